@@ -0,0 +1,198 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+ANSWER_CACHE_MAX_MB = float(os.getenv("ANSWER_CACHE_MAX_MB", "64"))
+# Cosine distance under which a differently worded query reuses a cached answer; 0 disables the semantic tier
+ANSWER_CACHE_SEMANTIC_DISTANCE = float(os.getenv("ANSWER_CACHE_SEMANTIC_DISTANCE", "0"))
+
+# Rough per-entry overhead of the dict, tuple key and bookkeeping
+_ENTRY_OVERHEAD = 200
+
+
+def normalize_query(query: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation so trivial rewordings share an entry"""
+    return re.sub(r"\s+", " ", query).strip().lower().rstrip("?!. ")
+
+
+class _EmbeddingMatrix:
+    """Unit query embeddings of one document's cached answers, stacked so a lookup is one matrix product"""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.keys = []
+        self._rows = {}
+        self._matrix = np.empty((8, dim), dtype=np.float32)
+
+    def add(self, key: Tuple[str, str, str], vector: np.ndarray) -> None:
+        if len(self.keys) == len(self._matrix):
+            grown = np.empty((len(self._matrix) * 2, self.dim), dtype=np.float32)
+            grown[:len(self.keys)] = self._matrix
+            self._matrix = grown
+        self._rows[key] = len(self.keys)
+        self._matrix[len(self.keys)] = vector
+        self.keys.append(key)
+
+    def remove(self, key: Tuple[str, str, str]) -> None:
+        # Fill the hole with the last row so the live rows stay contiguous
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        last = self.keys.pop()
+        if last != key:
+            self._matrix[row] = self._matrix[len(self.keys)]
+            self.keys[row] = last
+            self._rows[last] = row
+
+    def within(self, query: np.ndarray, max_distance: float) -> List[Tuple[float, Tuple[str, str, str]]]:
+        """(cosine distance, key) of the entries within max_distance of the query, nearest first"""
+        if not self.keys or query.shape[0] != self.dim:
+            return []
+        distances = 1.0 - self._matrix[:len(self.keys)] @ query
+        rows = np.flatnonzero(distances <= max_distance)
+        return [(float(distances[row]), self.keys[row]) for row in rows[np.argsort(distances[rows])]]
+
+
+class AnswerCache:
+    """In-memory LRU cache of generated answers keyed by (document_id, prompt version, normalized query).
+
+    Entries expire after ttl_seconds, and the least recently used ones are evicted once the
+    cache grows past max_bytes. When semantic_distance is set, entries stored with their query
+    embedding can also be matched by the nearest cached query for the same document; each
+    document's embeddings are kept stacked in one matrix, so that lookup is a single product.
+    """
+
+    def __init__(self, ttl_seconds: int = ANSWER_CACHE_TTL_SECONDS,
+                 max_bytes: int = int(ANSWER_CACHE_MAX_MB * 1024 * 1024),
+                 semantic_distance: float = ANSWER_CACHE_SEMANTIC_DISTANCE):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.semantic_distance = semantic_distance
+        self.total_bytes = 0
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._embeddings = {}  # (document_id, version) -> _EmbeddingMatrix of its entries' query embeddings
+        self._lock = threading.Lock()
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.semantic_distance > 0
+
+    def get(self, document_id: str, query: str, version: str) -> Optional[str]:
+        """Cached answer for this exact (normalized) query, or None"""
+        key = (document_id, version, normalize_query(query))
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                # With the semantic tier on, the miss is counted once get_similar misses too
+                if not self.semantic_enabled:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["answer"]
+
+    def get_similar(self, document_id: str, embedding: List[float], version: str) -> Optional[str]:
+        """Answer of the closest cached query for this document within semantic_distance, or None"""
+        if not self.semantic_enabled:
+            return None
+        query = _unit(embedding)
+        with self._lock:
+            best_key, best_distance = None, None
+            matrix = self._embeddings.get((document_id, version))
+            for distance, key in matrix.within(query, self.semantic_distance) if matrix else []:
+                # Expired entries are dropped as they're reached; the nearest live one wins
+                if self._live(key) is not None:
+                    best_key, best_distance = key, distance
+                    break
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            self.semantic_hits += 1
+            logger.info(f"Semantic answer cache hit for document {document_id} (distance {best_distance:.4f})")
+            return self._entries[best_key]["answer"]
+
+    def put(self, document_id: str, query: str, version: str, answer: str,
+            embedding: Optional[List[float]] = None) -> None:
+        """Cache an answer, evicting least recently used entries if over budget"""
+        key = (document_id, version, normalize_query(query))
+        vector = _unit(embedding) if embedding is not None and self.semantic_enabled else None
+        size = _ENTRY_OVERHEAD + len(answer.encode("utf-8")) + len(key[2].encode("utf-8"))
+        if vector is not None:
+            size += vector.nbytes
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = {
+                "answer": answer,
+                "embedding": vector,
+                "size": size,
+                "expires_at": time.time() + self.ttl_seconds,
+            }
+            self.total_bytes += size
+            if vector is not None:
+                matrix = self._embeddings.get(key[:2])
+                if matrix is None:
+                    matrix = self._embeddings[key[:2]] = _EmbeddingMatrix(len(vector))
+                if len(vector) == matrix.dim:
+                    matrix.add(key, vector)
+            while self.total_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, document_id: str) -> None:
+        """Drop every cached answer for a document"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == document_id]:
+                self._remove(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _live(self, key: Tuple[str, str, str]) -> Optional[dict]:
+        # Caller holds the lock; expired entries are dropped on access
+        entry = self._entries.get(key)
+        if entry is not None and entry["expires_at"] <= time.time():
+            self._remove(key)
+            return None
+        return entry
+
+    def _remove(self, key: Tuple[str, str, str]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry["size"]
+            matrix = self._embeddings.get(key[:2])
+            if matrix is not None:
+                matrix.remove(key)
+                if not matrix.keys:
+                    del self._embeddings[key[:2]]
+
+
+def _unit(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,137 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Verified Firebase ID tokens kept in memory (each until its own exp claim)
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+# Resolved user rows kept in memory, and for how long; credit changes made by this process
+# invalidate them straight away, so the TTL only bounds staleness from outside edits
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+AUTH_USER_CACHE_SECONDS = int(os.getenv("AUTH_USER_CACHE_SECONDS", "300"))
+# At most one users.last_login write per user per this many seconds
+LAST_LOGIN_UPDATE_SECONDS = int(os.getenv("LAST_LOGIN_UPDATE_SECONDS", "300"))
+
+
+class ExpiringCache:
+    """Bounded LRU mapping whose entries each carry their own expiry time (epoch seconds)"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, expires_at: float) -> None:
+        if expires_at <= time.time() or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return entry[0] if entry else None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class TokenCache(ExpiringCache):
+    """Decoded claims of verified ID tokens, valid until the token's exp.
+
+    Keyed by a SHA-256 of the token so the bearer credentials themselves aren't kept around.
+    """
+
+    def __init__(self, max_entries: int = AUTH_TOKEN_CACHE_SIZE):
+        super().__init__(max_entries)
+
+    @staticmethod
+    def _key(id_token: str) -> bytes:
+        return hashlib.sha256(id_token.encode("utf-8")).digest()
+
+    def get_claims(self, id_token: str) -> Optional[dict]:
+        return self.get(self._key(id_token))
+
+    def put_claims(self, id_token: str, claims: dict) -> None:
+        # Tokens without an expiry are verified every time
+        if "exp" in claims:
+            self.put(self._key(id_token), claims, float(claims["exp"]))
+
+
+class UserCache(ExpiringCache):
+    """User rows by Firebase UID, detached from any session and treated as read-only.
+
+    Also coalesces last_login updates: touch_login() says whether a user's login time is old
+    enough (last_login_interval) to be worth writing, and claims the write if so.
+    """
+
+    def __init__(self, max_entries: int = AUTH_USER_CACHE_SIZE, ttl_seconds: int = AUTH_USER_CACHE_SECONDS,
+                 last_login_interval: int = LAST_LOGIN_UPDATE_SECONDS):
+        super().__init__(max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.last_login_interval = timedelta(seconds=last_login_interval)
+        self.last_login_writes = 0
+        self._uids = {}  # user id -> firebase uid, for invalidating by id
+
+    def get_user(self, firebase_uid: str):
+        return self.get(firebase_uid)
+
+    def put_user(self, user) -> None:
+        self.put(user.firebase_uid, user, time.time() + self.ttl_seconds)
+        with self._lock:
+            self._uids[user.id] = user.firebase_uid
+            if len(self._uids) > self.max_entries * 2:
+                self._uids = {entry.id: uid for uid, (entry, _) in self._entries.items()}
+
+    def invalidate(self, user_id: str) -> None:
+        """Forget a user whose row was changed (e.g. credits), so the next request reloads it"""
+        with self._lock:
+            firebase_uid = self._uids.pop(user_id, None)
+        if firebase_uid is not None:
+            self.pop(firebase_uid)
+
+    def touch_login(self, user, now: datetime) -> bool:
+        """True (and the user's last_login set to now) if last_login is due to be written"""
+        with self._lock:
+            if user.last_login is not None and now - user.last_login < self.last_login_interval:
+                return False
+            user.last_login = now
+            self.last_login_writes += 1
+            return True
+
+    def stats(self) -> dict:
+        return {**super().stats(), "last_login_writes": self.last_login_writes}
@@ -0,0 +1,207 @@
+"""Per-stage timings of ingestion and querying, with a regression check against a baseline.
+
+Run from the backend directory:
+
+    python -m benchmarks.stages --json baseline.json              # record a baseline
+    python -m benchmarks.stages --compare baseline.json           # exits 1 if a stage regressed
+
+Each stage runs --repeat times over each test document; the median, min and max are reported
+in milliseconds per unit of work (per document, per OCR'd page, per query or per DB row), and
+regressions are judged on the min.
+Embedding uses the offline hashing provider behind the same batching layer as ingestion,
+so no API calls are made. OCR is skipped when tesseract or poppler isn't installed.
+Baselines are machine-specific: record and compare on the same machine.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import faiss
+import numpy as np
+
+os.environ.setdefault("CPU_WORKERS", "0")
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_community.vectorstores import FAISS
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from bm25 import KeywordIndex
+from chunk_store import ChunkStore, attach_chunk_store
+from db_services import save_document, save_query
+from embeddings import BatchedEmbeddings, HashingProvider
+from extraction import read_text_layer, chunk_text
+from models import Base
+from ocr import ocr_pages
+
+DOCUMENTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "test-documents")
+DOCUMENTS = ["robinhood.pdf", "lease.pdf"]
+QUERIES = [
+    "When is rent due and what is the late fee?",
+    "Can the agreement be terminated early?",
+    "What fees are charged on the account?",
+    "Who is responsible for repairs?",
+    "How are disputes resolved?",
+]
+
+
+def time_stage(run: Callable[[], object], repeat: int, units: int = 1) -> dict:
+    """Median, min and max wall time of run() in milliseconds per unit, after one warm-up call"""
+    run()
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000 / units)
+    return {
+        "median_ms": round(statistics.median(timings), 4),
+        "min_ms": round(min(timings), 4),
+        "max_ms": round(max(timings), 4),
+        "units": units,
+    }
+
+
+def ocr_unavailable() -> str:
+    missing = [tool for tool in ("tesseract", "pdftoppm") if shutil.which(tool) is None]
+    return f"{' and '.join(missing)} not installed" if missing else ""
+
+
+def benchmark_document(contents: bytes, repeat: int, ocr_sample_pages: int, db_path: str) -> Dict[str, dict]:
+    stages = {}
+    pages = read_text_layer(contents)
+    text = "".join(pages)
+    stages["extract_text_layer"] = time_stage(lambda: read_text_layer(contents), repeat)
+
+    reason = ocr_unavailable()
+    if reason:
+        stages["ocr_page"] = {"skipped": reason}
+    else:
+        sample = list(range(1, min(ocr_sample_pages, len(pages)) + 1))
+        stages["ocr_page"] = time_stage(lambda: ocr_pages(contents, sample, workers=1), max(1, repeat // 5), len(sample))
+
+    chunks = chunk_text(text)
+    stages["chunk"] = time_stage(lambda: chunk_text(text), repeat)
+
+    embeddings = BatchedEmbeddings(HashingProvider())
+    stages["embed"] = time_stage(lambda: embeddings.embed_documents(chunks), repeat)
+    vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+
+    def build_index():
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors)
+        return index
+    stages["faiss_build"] = time_stage(build_index, repeat)
+
+    chunk_store = ChunkStore.from_chunks(text, chunks)
+    stages["keyword_index_build"] = time_stage(lambda: KeywordIndex.build(chunk_store), repeat)
+
+    vectorstore = attach_chunk_store(FAISS(embeddings, build_index(), None, {}), chunk_store)
+    query_vectors = embeddings.embed_documents(QUERIES)
+    stages["search"] = time_stage(
+        lambda: [vectorstore.similarity_search_with_score_by_vector(vector, k=3) for vector in query_vectors],
+        repeat, len(query_vectors))
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with Session() as db:
+        stages["db_document_write"] = time_stage(
+            lambda: save_document(db, "benchmark.pdf", "benchmark.pdf", len(contents), text_content=text,
+                                  meta={"pages": len(pages), "chunks": len(chunks)}),
+            repeat)
+        document_id = save_document(db, "benchmark.pdf", "benchmark.pdf", len(contents)).id
+        stages["db_query_write"] = time_stage(
+            lambda: [save_query(db, document_id, query, chunks[0], response_time_ms=100) for query in QUERIES],
+            repeat, len(QUERIES))
+    engine.dispose()
+    return stages
+
+
+def compare(current: dict, baseline: dict, threshold: float, min_ms: float) -> List[dict]:
+    """Stage-by-stage comparison of two result files on the fastest run of each stage, which is
+    the least affected by scheduler noise. A stage regresses when it slows down by more than
+    threshold (a fraction) and by more than min_ms."""
+    rows = []
+    for document, stages in current["documents"].items():
+        for stage, result in stages.items():
+            before = baseline["documents"].get(document, {}).get(stage, {})
+            if "min_ms" not in result or "min_ms" not in before:
+                continue
+            change = result["min_ms"] / before["min_ms"] - 1 if before["min_ms"] else 0.0
+            rows.append({
+                "document": document,
+                "stage": stage,
+                "baseline_ms": before["min_ms"],
+                "current_ms": result["min_ms"],
+                "change": round(change, 4),
+                "regressed": change > threshold and result["min_ms"] - before["min_ms"] > min_ms,
+            })
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", nargs="+", default=DOCUMENTS, help="PDFs in test-documents to benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per stage")
+    parser.add_argument("--ocr-pages", type=int, default=2, help="pages OCR'd per document")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown as a fraction (default: 0.25)")
+    parser.add_argument("--min-ms", type=float, default=0.5, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    results = {
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "repeat": args.repeat,
+        "documents": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.documents:
+            with open(os.path.join(DOCUMENTS_DIR, name), "rb") as f:
+                contents = f.read()
+            results["documents"][name] = benchmark_document(contents, args.repeat, args.ocr_pages,
+                                                            os.path.join(workdir, f"{name}.db"))
+
+    for name, stages in results["documents"].items():
+        print(f"\n{name}")
+        print(f"{'stage':<22}{'median ms':>12}{'min ms':>10}{'max ms':>10}{'per':>6}")
+        for stage, result in stages.items():
+            if "skipped" in result:
+                print(f"{stage:<22}  skipped: {result['skipped']}")
+            else:
+                print(f"{stage:<22}{result['median_ms']:>12.3f}{result['min_ms']:>10.3f}{result['max_ms']:>10.3f}{result['units']:>6}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if not args.compare:
+        return 0
+    with open(args.compare, encoding="utf-8") as f:
+        rows = compare(results, json.load(f), args.threshold, args.min_ms)
+    print(f"\nCompared with {args.compare} (threshold +{args.threshold:.0%})")
+    for row in rows:
+        flag = "REGRESSED" if row["regressed"] else ""
+        print(f"{row['document']:<16}{row['stage']:<22}{row['baseline_ms']:>10.3f} -> {row['current_ms']:>10.3f}"
+              f"{row['change']:>+9.1%}  {flag}")
+    regressions = [row for row in rows if row["regressed"]]
+    if regressions:
+        print(f"\n{len(regressions)} stage(s) regressed")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""Memory per chunk and recall@k of each vector compression against the exact flat index.
+
+Run from the backend directory:
+
+    python -m benchmarks.vector_compression [--provider hashing] [--dimension 1536] [--json results.json]
+
+Every PDF in test-documents is extracted and chunked as ingestion does, and the chunks are
+embedded with the chosen provider (the offline hashing backend by default; use openai for
+real embedding geometry). Queries are random passages of the documents. Results are given
+per document and for the whole corpus in one index, which is large enough for product
+quantization to train where single documents fall back to int8.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+os.environ.setdefault("CPU_WORKERS", "0")
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embeddings import create_provider, EMBEDDING_DIMENSION
+from extraction import iter_pdf_pages, StreamingChunker
+from vector_compression import COMPRESSIONS, CompressedIndex
+
+DOCUMENTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "test-documents")
+
+
+def extract_chunks(contents: bytes, chunk_size: int, chunk_overlap: int) -> tuple:
+    """Chunk a PDF the way ingestion does, page by page with the streaming chunker; returns (text, chunks)"""
+    chunker = StreamingChunker(chunk_size, chunk_overlap)
+    chunks = []
+    for page in iter_pdf_pages(contents):
+        chunks.extend(chunk for _, _, chunk in chunker.feed(page.text))
+    chunks.extend(chunk for _, _, chunk in chunker.finish())
+    return chunker.text, chunks
+
+
+def sample_queries(text: str, count: int, length: int, rng: np.random.Generator) -> list:
+    starts = rng.integers(0, max(1, len(text) - length), size=count)
+    return [text[start:start + length] for start in starts]
+
+
+def recall_at_k(exact: np.ndarray, approximate: np.ndarray) -> float:
+    k = exact.shape[1]
+    return float(np.mean([len(set(e) & set(a)) / k for e, a in zip(exact, approximate)]))
+
+
+def benchmark_index(vectors: np.ndarray, queries: np.ndarray, k: int, rerank_factor: int) -> list:
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors)
+    _, exact = flat.search(queries, k)
+
+    results = []
+    for compression in COMPRESSIONS:
+        # Re-ranking a flat index against itself changes nothing
+        for rerank in [0] if compression == "none" else sorted({0, rerank_factor}):
+            index = CompressedIndex.build(vectors, compression, rerank)
+            started = time.perf_counter()
+            _, found = index.search(queries, k)
+            elapsed = time.perf_counter() - started
+            results.append({
+                "compression": compression,
+                "index": type(index.index).__name__,  # pq falls back to int8 when there are too few vectors to train
+                "rerank_factor": rerank,
+                "bytes_per_chunk": index.index.sa_code_size(),
+                f"recall@{k}": round(recall_at_k(exact, found), 4),
+                "search_ms_per_query": round(elapsed * 1000 / len(queries), 4),
+            })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--provider", default="hashing", help="embedding provider (default: hashing)")
+    parser.add_argument("--dimension", type=int, default=None, help="embedding dimension override")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=100, help="queries per document")
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    # Passed to the provider so OpenAI is actually asked for vectors of this size
+    provider = create_provider(args.provider, dimension=args.dimension or EMBEDDING_DIMENSION)
+    rng = np.random.default_rng(0)
+
+    corpus_vectors, corpus_queries, report = [], [], {"provider": provider.describe(), "k": args.k, "documents": {}}
+    for path in sorted(glob.glob(os.path.join(DOCUMENTS_DIR, "*.pdf"))):
+        with open(path, "rb") as f:
+            text, chunks = extract_chunks(f.read(), args.chunk_size, args.chunk_overlap)
+        vectors = np.asarray(provider.embed_documents(chunks), dtype=np.float32)
+        queries = np.asarray(provider.embed_documents(sample_queries(text, args.queries, 200, rng)), dtype=np.float32)
+        corpus_vectors.append(vectors)
+        corpus_queries.append(queries)
+        report["documents"][os.path.basename(path)] = {
+            "chunks": len(chunks), "results": benchmark_index(vectors, queries, args.k, args.rerank_factor)
+        }
+    corpus = np.concatenate(corpus_vectors)
+    report["documents"]["corpus"] = {
+        "chunks": len(corpus),
+        "results": benchmark_index(corpus, np.concatenate(corpus_queries), args.k, args.rerank_factor),
+    }
+
+    for name, document in report["documents"].items():
+        print(f"\n{name} ({document['chunks']} chunks, {provider.dimension} dimensions)")
+        print(f"{'compression':<12}{'index':<24}{'rerank':>7}{'bytes/chunk':>13}{f'recall@{args.k}':>11}{'ms/query':>10}")
+        for r in document["results"]:
+            print(f"{r['compression']:<12}{r['index']:<24}{r['rerank_factor']:>7}{r['bytes_per_chunk']:>13}"
+                  f"{r[f'recall@{args.k}']:>11.3f}{r['search_ms_per_query']:>10.3f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import bisect
+import logging
+import os
+import re
+from collections import Counter
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Share of the fused retrieval score that comes from BM25 (the rest from vector similarity)
+HYBRID_BM25_WEIGHT = float(os.getenv("HYBRID_BM25_WEIGHT", "0.3"))
+# Keyword fast path: taken when every query term is in the top chunk and it outscores the
+# runner-up by this factor; 0 disables it
+KEYWORD_FAST_PATH_MARGIN = float(os.getenv("KEYWORD_FAST_PATH_MARGIN", "1.5"))
+
+KEYWORDS_FILE = "keywords.npz"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Words ("12.3", "250,000") keep internal dots and commas so section numbers and amounts match exactly
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*")
+
+STOPWORDS = frozenset("""
+a about above after all also am an and any are as at be been before being between both but by can could
+did do does doing done during each either for from had has have having he her here hers him his how i if
+in into is it its itself just let may me might mine must my no nor not of off on once only or other our
+ours out over own please same say says shall she should so some such tell than that the their theirs them
+then there these they this those through to too under until up upon us very was we were what when where
+which while who whom whose why will with within without would you your yours explain mean means
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def query_terms(query: str) -> List[str]:
+    """Distinct non-stopword terms of a query"""
+    return sorted({term for term in tokenize(query) if term not in STOPWORDS})
+
+
+class _Terms(Sequence):
+    """Sorted vocabulary packed into one UTF-8 buffer, searchable with bisect"""
+
+    def __init__(self, buffer: bytes, offsets: np.ndarray):
+        self.buffer = buffer
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    def index_of(self, term: str) -> Optional[int]:
+        i = bisect.bisect_left(self, term)
+        return i if i < len(self) and self[i] == term else None
+
+
+class KeywordIndex:
+    """BM25 inverted index over one document's chunks.
+
+    Postings are stored CSR-style: for term t, chunks[offsets[t]:offsets[t + 1]] are the
+    (sorted) chunk numbers containing it and tfs the matching term frequencies.
+    """
+
+    def __init__(self, terms: _Terms, offsets: np.ndarray, chunks: np.ndarray, tfs: np.ndarray, lengths: np.ndarray):
+        self.terms = terms
+        self.offsets = offsets
+        self.chunks = chunks
+        self.tfs = tfs
+        self.lengths = lengths
+        self.avg_length = float(lengths.mean()) if len(lengths) else 0.0
+
+    @classmethod
+    def build(cls, chunks: Iterable[str]) -> "KeywordIndex":
+        postings = {}
+        lengths = []
+        for n, chunk in enumerate(chunks):
+            tokens = tokenize(chunk)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((n, tf))
+
+        vocabulary = sorted(postings)
+        encoded = [term.encode("utf-8") for term in vocabulary]
+        term_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(term) for term in encoded], out=term_offsets[1:])
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum([len(postings[term]) for term in vocabulary], out=offsets[1:])
+        flat = [posting for term in vocabulary for posting in postings[term]]
+        return cls(
+            _Terms(b"".join(encoded), term_offsets),
+            offsets,
+            np.array([n for n, _ in flat], dtype=np.int32),
+            np.array([min(tf, 65535) for _, tf in flat], dtype=np.uint16),
+            np.array(lengths, dtype=np.int32),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "KeywordIndex":
+        with np.load(os.path.join(path, KEYWORDS_FILE)) as data:
+            return cls(_Terms(data["terms"].tobytes(), data["term_offsets"]), data["offsets"], data["chunks"],
+                       data["tfs"], data["lengths"])
+
+    def save(self, path: str) -> None:
+        # Written through a file object so numpy doesn't append its own extension
+        with open(os.path.join(path, KEYWORDS_FILE), "wb") as f:
+            np.savez(f, terms=np.frombuffer(self.terms.buffer, dtype=np.uint8), term_offsets=self.terms.offsets,
+                     offsets=self.offsets, chunks=self.chunks, tfs=self.tfs, lengths=self.lengths)
+
+    @property
+    def nbytes(self) -> int:
+        return (len(self.terms.buffer) + self.terms.offsets.nbytes + self.offsets.nbytes + self.chunks.nbytes
+                + self.tfs.nbytes + self.lengths.nbytes)
+
+    def scores(self, terms: List[str]) -> np.ndarray:
+        """BM25 score of every chunk for the given query terms"""
+        scores = np.zeros(len(self.lengths), dtype=np.float32)
+        if not len(self.lengths):
+            return scores
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / max(self.avg_length, 1.0))
+        for term in terms:
+            t = self.terms.index_of(term)
+            if t is None:
+                continue
+            chunks = self.chunks[self.offsets[t]:self.offsets[t + 1]]
+            tfs = self.tfs[self.offsets[t]:self.offsets[t + 1]].astype(np.float32)
+            idf = np.log(1 + (len(self.lengths) - len(chunks) + 0.5) / (len(chunks) + 0.5))
+            scores[chunks] += idf * tfs * (BM25_K1 + 1) / (tfs + norm[chunks])
+        return scores
+
+    def contains(self, term: str, chunk: int) -> bool:
+        t = self.terms.index_of(term)
+        if t is None:
+            return False
+        postings = self.chunks[self.offsets[t]:self.offsets[t + 1]]
+        i = np.searchsorted(postings, chunk)
+        return i < len(postings) and postings[i] == chunk
+
+    def confident(self, terms: List[str], scores: np.ndarray, margin: float = KEYWORD_FAST_PATH_MARGIN) -> bool:
+        """Whether the keyword match alone is decisive: the top chunk has every query term
+        and clearly outscores the runner-up"""
+        if margin <= 0 or not terms or not len(scores):
+            return False
+        order = np.argsort(scores)[::-1]
+        best = int(order[0])
+        if scores[best] <= 0 or not all(self.contains(term, best) for term in terms):
+            return False
+        runner_up = scores[order[1]] if len(order) > 1 else 0.0
+        return scores[best] >= margin * runner_up
+
+
+def top_chunks(scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+    """The k highest scoring chunks with a positive score"""
+    order = np.argsort(scores)[::-1][:k]
+    return [(int(i), float(scores[i])) for i in order if scores[i] > 0]
+
+
+def fuse(bm25_scores: np.ndarray, vector_hits: List[Tuple[int, float]], k: int,
+         weight: float = HYBRID_BM25_WEIGHT) -> List[Tuple[int, float]]:
+    """Combine BM25 scores with vector hits ((chunk, L2 distance), nearest first) into the top k chunks.
+
+    Both signals are scaled to [0, 1] - BM25 by the best score, distances min-max over the
+    candidates - and mixed by weight. Candidates are the vector hits plus as many top BM25
+    chunks, so exact-term matches the embedding missed can still make it in.
+    """
+    top_bm25 = float(bm25_scores.max()) if len(bm25_scores) else 0.0
+    vector_sim = {}
+    if vector_hits:
+        distances = [distance for _, distance in vector_hits]
+        low, high = min(distances), max(distances)
+        for chunk, distance in vector_hits:
+            vector_sim[chunk] = 1.0 if high == low else (high - distance) / (high - low)
+
+    candidates = set(vector_sim)
+    if top_bm25 > 0:
+        candidates.update(chunk for chunk, _ in top_chunks(bm25_scores, max(k, len(vector_hits))))
+
+    fused = [
+        (chunk, weight * (float(bm25_scores[chunk]) / top_bm25 if top_bm25 > 0 else 0.0)
+         + (1 - weight) * vector_sim.get(chunk, 0.0))
+        for chunk in candidates
+    ]
+    fused.sort(key=lambda hit: (-hit[1], hit[0]))
+    return fused[:k]
@@ -0,0 +1,170 @@
+import logging
+import mmap
+import os
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+TEXT_FILE = "text.txt"
+SPANS_FILE = "chunks.npy"
+
+
+class ChunkStore(Sequence):
+    """A document's text stored once as UTF-8, with its chunks kept as (start, end) byte offsets.
+
+    The buffer is either bytes or a read-only memory map of the persisted text file. Chunk
+    strings are only decoded when indexed - for retrieved chunks going into the prompt - so
+    the text isn't held again per chunk or per FAISS docstore entry. Chunks that aren't a
+    verbatim slice of the text (never the case with the recursive splitter) are appended to
+    the buffer after the text.
+    """
+
+    def __init__(self, buffer: Union[bytes, mmap.mmap], spans: np.ndarray, text_bytes: Optional[int] = None):
+        self.buffer = buffer
+        self.spans = spans
+        self.text_bytes = len(buffer) if text_bytes is None else text_bytes
+        self._text_length = None
+
+    @classmethod
+    def from_chunks(cls, text: str, chunks: List[str]) -> "ChunkStore":
+        """Locate each chunk in the text and keep only their byte offsets"""
+        encoded = text.encode("utf-8")
+        ascii_only = len(encoded) == len(text)
+        extra = bytearray()
+        spans = np.empty((len(chunks), 2), dtype=np.int64)
+
+        # Chunks come in document order, so each search starts just after the previous chunk's start
+        search_from, char_cursor, byte_cursor = 0, 0, 0
+        for i, chunk in enumerate(chunks):
+            start = text.find(chunk, search_from)
+            if start < 0:
+                start = text.find(chunk)
+            chunk_bytes = len(chunk.encode("utf-8"))
+            if start < 0:
+                logger.warning(f"Chunk {i} is not a slice of the document text; storing a separate copy")
+                spans[i] = (len(encoded) + len(extra), len(encoded) + len(extra) + chunk_bytes)
+                extra += chunk.encode("utf-8")
+                continue
+            if ascii_only:
+                byte_start = start
+            else:
+                if start < char_cursor:
+                    char_cursor, byte_cursor = 0, 0
+                byte_start = byte_cursor + len(text[char_cursor:start].encode("utf-8"))
+                char_cursor, byte_cursor = start, byte_start
+            spans[i] = (byte_start, byte_start + chunk_bytes)
+            search_from = start + 1
+
+        store = cls(encoded + bytes(extra) if extra else encoded, spans, len(encoded))
+        store._text_length = len(text)
+        return store
+
+    @classmethod
+    def from_char_spans(cls, text: str, spans: Sequence[Tuple[int, int]]) -> "ChunkStore":
+        """Build a store from chunks given as (start, end) character offsets into the text"""
+        encoded = text.encode("utf-8")
+        char_spans = np.array(spans, dtype=np.int64).reshape(-1, 2)
+        if len(encoded) == len(text):
+            byte_spans = char_spans
+        else:
+            # Byte offset of every character: cumulative UTF-8 widths of the code points before it
+            code_points = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+            widths = 1 + (code_points >= 0x80) + (code_points >= 0x800) + (code_points >= 0x10000)
+            offsets = np.concatenate(([0], np.cumsum(widths, dtype=np.int64)))
+            byte_spans = offsets[char_spans]
+        store = cls(encoded, byte_spans, len(encoded))
+        store._text_length = len(text)
+        return store
+
+    @classmethod
+    def open(cls, path: str, text_bytes: Optional[int] = None) -> "ChunkStore":
+        """Memory-map a chunk store saved by save()"""
+        spans = np.load(os.path.join(path, SPANS_FILE))
+        with open(os.path.join(path, TEXT_FILE), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        return cls(buffer, spans, text_bytes)
+
+    def save(self, path: str) -> None:
+        """Write the text buffer and chunk offsets into a folder"""
+        with open(os.path.join(path, TEXT_FILE), "wb") as f:
+            f.write(self.buffer)
+        np.save(os.path.join(path, SPANS_FILE), self.spans)
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        start, end = self.spans[i]
+        return self.buffer[start:end].decode("utf-8")
+
+    @property
+    def text(self) -> str:
+        """The full document text (decoded on each access - don't hold on to it)"""
+        return self.buffer[:self.text_bytes].decode("utf-8")
+
+    @property
+    def text_length(self) -> int:
+        """Length of the document text in characters"""
+        if self._text_length is None:
+            self._text_length = len(self.text)
+        return self._text_length
+
+    @property
+    def resident_bytes(self) -> int:
+        """Heap memory held by the store; a memory-mapped buffer is page cache the OS can reclaim"""
+        buffer_bytes = 0 if isinstance(self.buffer, mmap.mmap) else len(self.buffer)
+        return buffer_bytes + self.spans.nbytes
+
+    def __getstate__(self):
+        # Memory maps can't be pickled (e.g. when sent to a worker process) - ship the bytes instead
+        state = dict(self.__dict__)
+        state["buffer"] = bytes(self.buffer)
+        return state
+
+
+class ChunkDocstore(Docstore):
+    """Read-only FAISS docstore that builds each Document from a ChunkStore on lookup"""
+
+    def __init__(self, chunks: ChunkStore):
+        self.chunks = chunks
+
+    def search(self, search: str) -> Union[str, Document]:
+        try:
+            return Document(page_content=self.chunks[int(search)])
+        except (ValueError, IndexError):
+            return f"ID {search} not found."
+
+    def add(self, texts: dict) -> None:
+        raise NotImplementedError("Chunk docstores are read-only")
+
+    def delete(self, ids: List) -> None:
+        raise NotImplementedError("Chunk docstores are read-only")
+
+
+def attach_chunk_store(vectorstore, chunks: ChunkStore):
+    """Serve a FAISS store's documents from the chunk store, dropping its own copies of the chunk text.
+
+    Vector i of the index must belong to chunk i, as FAISS.from_texts builds it.
+    """
+    vectorstore.docstore = ChunkDocstore(chunks)
+    vectorstore.index_to_docstore_id = {i: str(i) for i in range(len(chunks))}
+    return vectorstore
+
+
+def search_chunks(vectorstore, embedding: List[float], k: int) -> List[Tuple[int, float]]:
+    """(chunk index, squared L2 distance) of the k chunks nearest the embedding, nearest first.
+
+    Works for FAISS stores set up by attach_chunk_store and for shared index views.
+    """
+    if hasattr(vectorstore, "search_chunks"):
+        return vectorstore.search_chunks(embedding, k)
+    index = vectorstore.index
+    distances, indices = index.search(np.asarray([embedding], dtype=np.float32), min(k, index.ntotal))
+    return [(int(i), float(d)) for d, i in zip(distances[0], indices[0]) if i >= 0]
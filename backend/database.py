@@ -1,8 +1,13 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, exc, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 import os
+import time
 from dotenv import load_dotenv
 from models import Base, User
+from metrics import CallbackMetric, Counter, Histogram
 
 load_dotenv()
 
@@ -13,14 +18,113 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./legal_lens.db")
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-# Create engine
-if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-else:
-    engine = create_engine(DATABASE_URL)
+# Connection pool of each engine (sync and async have one each): connections kept open, extra ones
+# allowed under load, and seconds to wait for a free connection before failing
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Replace connections older than this many seconds, to stay under server and proxy idle timeouts (-1: never)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Check a connection is alive on checkout, so ones the server dropped are replaced instead of failing a request
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
 
-# Create session factory
+# Checkout time covers waiting for a free connection, opening a new one and the pre-ping
+POOL_CHECKOUT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0)
+POOL_CHECKOUT_SECONDS = Histogram("legal_lens_db_pool_checkout_seconds",
+                                  "Time to check a connection out of the pool, by engine (sync or async)",
+                                  ["engine"], buckets=POOL_CHECKOUT_BUCKETS)
+POOL_TIMEOUTS = Counter("legal_lens_db_pool_timeouts_total",
+                        "Checkouts that gave up after DB_POOL_TIMEOUT seconds, by engine", ["engine"])
+
+class TimedCheckout:
+    """Pool mixin recording each checkout's duration, and checkouts that time out"""
+
+    label = "sync"
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            POOL_TIMEOUTS.inc(self.label)
+            raise
+        finally:
+            POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started, self.label)
+
+class TimedQueuePool(TimedCheckout, QueuePool):
+    label = "sync"
+
+class TimedAsyncQueuePool(TimedCheckout, AsyncAdaptedQueuePool):
+    label = "async"
+
+class TimedAsyncNullPool(TimedCheckout, NullPool):
+    label = "async"
+
+def async_database_url(url: str) -> str:
+    """The URL for the async engine: the same database through asyncpg or aiosqlite"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    if parsed.get_backend_name() == "postgresql":
+        # asyncpg takes ssl=<mode> where libpq takes sslmode=<mode>
+        query = dict(parsed.query)
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        return parsed.set(drivername="postgresql+asyncpg", query=query).render_as_string(hide_password=False)
+    return url
+
+# Async driver URL for the hot endpoints; derived from DATABASE_URL when unset
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
+
+def engine_options(url: str, poolclass) -> dict:
+    """Pool settings for an engine. In-memory SQLite keeps its single shared connection instead (and the
+    async engine then sees a separate, empty database - use a file for anything but throwaway runs);
+    aiosqlite opens a connection (and its thread) per session, as SQLAlchemy does by default, since
+    pooled ones would keep their threads - and the process - alive"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return {"connect_args": {"check_same_thread": False}}
+    if parsed.get_driver_name() == "aiosqlite":
+        return {"poolclass": TimedAsyncNullPool}
+    options = {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if parsed.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+    return options
+
+# Create engines: the sync one for most endpoints and background work, the async one for the hot
+# endpoints (/query, /me, /history) so their database access doesn't tie up a threadpool thread
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL, TimedQueuePool))
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, TimedAsyncQueuePool))
+
+# Create session factories
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay loaded after commit, since lazy loads would need an await
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+def pools() -> dict:
+    return {"sync": engine.pool, "async": async_engine.sync_engine.pool}
+
+def pool_connections() -> dict:
+    values = {}
+    for label, pool in pools().items():
+        if isinstance(pool, QueuePool):
+            values[(label, "checked_out")] = pool.checkedout()
+            values[(label, "idle")] = pool.checkedin()
+    return values
+
+CallbackMetric("legal_lens_db_pool_connections", "Open pooled connections by engine and state (checked_out, idle)",
+               pool_connections, labelnames=["engine", "state"])
+CallbackMetric("legal_lens_db_pool_max_connections", "Most connections each engine's pool will open",
+               lambda: {(label,): pool.size() + DB_MAX_OVERFLOW if DB_MAX_OVERFLOW >= 0 else None
+                        for label, pool in pools().items() if isinstance(pool, QueuePool)},
+               labelnames=["engine"])
 
 # Dependency to get database session
 def get_db():
@@ -30,9 +134,41 @@ def get_db():
     finally:
         db.close()
 
+# Async dependency for the hot endpoints; run existing sync helpers on it with `await db.run_sync(fn, ...)`
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 # Create all tables
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    add_missing_indexes()
+
+# create_all never alters existing tables, so add nullable columns introduced since they were created
+def add_missing_columns():
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+# Nor does it add indexes to existing tables
+def add_missing_indexes():
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
 
 # Get user by Firebase UID
 def get_user_by_firebase_uid(db, firebase_uid):
@@ -1,8 +1,10 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from models import Document, DocumentQuery, AnalysisSession
+from sqlalchemy import func, insert, tuple_
+from models import Document, DocumentQuery, AnalysisSession, User
 from datetime import datetime
+import base64
 import time
+from metrics import timed
 
 def save_document(
     db: Session,
@@ -13,7 +15,8 @@ def save_document(
     text_length: int = None,
     user_id: str = None,
     document_type: str = None,
-    meta: dict = None
+    meta: dict = None,
+    processing_status: str = "completed"
 ) -> Document:
     """Save a document to the database"""
     document = Document(
@@ -24,20 +27,51 @@ def save_document(
         text_length=text_length if text_length is not None else (len(text_content) if text_content else 0),
         user_id=user_id,
         document_type=document_type,
-        meta=meta or {}
+        meta=meta or {},
+        processing_status=processing_status
     )
-    db.add(document)
-    db.commit()
-    db.refresh(document)
+    with timed("db_write"):
+        db.add(document)
+        db.commit()
+        db.refresh(document)
     return document
 
+def update_document(db: Session, document_id: str, **fields) -> None:
+    """Update columns (e.g. processing_status) on an existing document"""
+    with timed("db_write"):
+        db.query(Document).filter(Document.id == document_id).update(fields, synchronize_session=False)
+        db.commit()
+
+def delete_document(db: Session, document_id: str) -> None:
+    """Remove a document row, e.g. one saved for an upload that was then rejected"""
+    with timed("db_write"):
+        db.query(Document).filter(Document.id == document_id).delete(synchronize_session=False)
+        db.commit()
+
+def deduct_credit(db: Session, user_id: str) -> bool:
+    """Take one credit from a user if they have any left (a single atomic update); returns whether one was taken"""
+    with timed("db_write"):
+        taken = db.query(User).filter(User.id == user_id, User.credits > 0).update(
+            {User.credits: User.credits - 1}, synchronize_session=False
+        )
+        db.commit()
+    return taken > 0
+
+def touch_last_login(db: Session, user_id: str, when: datetime) -> None:
+    """Record a user's login time without loading their row"""
+    with timed("db_write"):
+        db.query(User).filter(User.id == user_id).update({User.last_login: when}, synchronize_session=False)
+        db.commit()
+
 def save_query(
     db: Session,
     document_id: str,
     query_text: str,
     response_text: str,
     response_time_ms: int = None,
-    user_id: str = None
+    user_id: str = None,
+    time_to_first_token_ms: int = None,
+    cache_hit: bool = False
 ) -> DocumentQuery:
     """Save a document query to the database"""
     query = DocumentQuery(
@@ -45,21 +79,51 @@ def save_query(
         query_text=query_text,
         response_text=response_text,
         response_time_ms=response_time_ms,
+        time_to_first_token_ms=time_to_first_token_ms,
+        cache_hit=cache_hit,
         user_id=user_id
     )
-    db.add(query)
-    db.commit()
-    db.refresh(query)
+    with timed("db_write"):
+        db.add(query)
+        db.commit()
+        db.refresh(query)
     return query
 
-def get_document_history(db: Session, user_id: str = None, limit: int = 50) -> list:
-    """Get document upload history"""
-    query = db.query(Document)
+def save_queries(db: Session, queries: list) -> None:
+    """Save many document queries (dicts of DocumentQuery columns) in one bulk insert"""
+    with timed("db_write"):
+        db.execute(insert(DocumentQuery), queries)
+        db.commit()
+
+# Columns the history listing shows - not text_content, which can run to many kilobytes per document
+HISTORY_COLUMNS = (Document.id, Document.original_filename, Document.upload_date, Document.file_size,
+                   Document.text_length, Document.processing_status, Document.meta)
+
+def encode_history_cursor(upload_date: datetime, document_id: str) -> str:
+    """Opaque cursor for the history page after the document with this (upload_date, id)"""
+    return base64.urlsafe_b64encode(f"{upload_date.isoformat()}|{document_id}".encode()).decode()
+
+def decode_history_cursor(cursor: str) -> tuple:
+    """(upload_date, id) from a history cursor; ValueError if it's malformed"""
+    try:
+        upload_date, document_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(upload_date), document_id
+    except Exception as e:
+        raise ValueError(f"Invalid history cursor: {cursor}") from e
+
+def get_document_history(db: Session, user_id: str = None, limit: int = 50, cursor: str = None) -> tuple:
+    """Get a page of document upload history, newest first: (rows of HISTORY_COLUMNS, cursor for the
+    next page or None). Pages continue from the cursor's (upload_date, id), so deep pages cost the
+    same as the first"""
+    query = db.query(*HISTORY_COLUMNS)
     if user_id:
         query = query.filter(Document.user_id == user_id)
-    
-    documents = query.order_by(Document.upload_date.desc()).limit(limit).all()
-    return documents
+    if cursor:
+        query = query.filter(tuple_(Document.upload_date, Document.id) < tuple_(*decode_history_cursor(cursor)))
+
+    rows = query.order_by(Document.upload_date.desc(), Document.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_history_cursor(rows[limit - 1].upload_date, rows[limit - 1].id) if len(rows) > limit else None
+    return rows[:limit], next_cursor
 
 def get_document_queries(db: Session, document_id: str, limit: int = 50) -> list:
     """Get all queries for a specific document"""
@@ -70,24 +134,28 @@ def get_document_queries(db: Session, document_id: str, limit: int = 50) -> list
         .all()
     return queries
 
+def get_user_document_ids(db: Session, user_id: str, document_ids: list = None, limit: int = 50) -> list:
+    """Get the in-memory IDs of a user's processed documents, optionally limited to the given IDs"""
+    query = db.query(Document.filename)\
+        .filter(Document.user_id == user_id, Document.processing_status == "completed")
+    if document_ids is not None:
+        query = query.filter(Document.filename.in_(document_ids))
+    rows = query.order_by(Document.upload_date.desc()).limit(limit).all()
+    # Document.filename holds the ID documents are stored and queried under
+    return [row[0] for row in rows]
+
 def get_document_by_id(db: Session, document_id: str) -> Document:
     """Get a document by its ID"""
     return db.query(Document).filter(Document.id == document_id).first()
 
 def get_user_activity_summary(db: Session, user_id: str = None) -> dict:
-    """Get summary of user activity"""
-    query = db.query(Document)
+    """Get document count and total size in one query"""
+    query = db.query(func.count(Document.id), func.coalesce(func.sum(Document.file_size), 0))
     if user_id:
         query = query.filter(Document.user_id == user_id)
-    
-    total_documents = query.count()
-    total_size = query.with_entities(func.sum(Document.file_size)).scalar() or 0
-    
-    # Get recent activity
-    recent_documents = query.order_by(Document.upload_date.desc()).limit(5).all()
-    
+
+    total_documents, total_size = query.one()
     return {
         "total_documents": total_documents,
-        "total_size_bytes": total_size,
-        "recent_documents": recent_documents
+        "total_size_bytes": total_size
     } 
\ No newline at end of file
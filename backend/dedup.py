@@ -0,0 +1,73 @@
+import hashlib
+import logging
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(contents: bytes) -> str:
+    """SHA-256 of the raw uploaded bytes, used to spot byte-identical PDFs"""
+    return hashlib.sha256(contents).hexdigest()
+
+
+class ContentIndex:
+    """Lookup table from PDF content hash to its processed text, chunks and vector index.
+
+    Every document ID that uses a shared entry is an alias of it. Entries are
+    reference-counted by alias and dropped from memory when the last alias is released,
+    at which point on_free(digest, entry) is called.
+    """
+
+    def __init__(self, on_free: Callable[[str, dict], None] = lambda digest, shared: None):
+        self.on_free = on_free
+        self._entries = {}
+        self._hash_of = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, digest: str) -> Optional[dict]:
+        """Return the shared entry for a content hash, or None if it hasn't been processed"""
+        with self._lock:
+            return self._entries.get(digest)
+
+    def register(self, digest: str, shared: dict) -> dict:
+        """Add processed content under its hash; returns the entry that ended up registered"""
+        with self._lock:
+            existing = self._entries.get(digest)
+            if existing is not None:
+                return existing
+            shared["aliases"] = set()
+            self._entries[digest] = shared
+            return shared
+
+    def add_alias(self, digest: str, document_id: str) -> Optional[dict]:
+        """Point a document ID at a registered entry and return it, or None if the entry has been
+        freed (its last alias released) since it was looked up"""
+        with self._lock:
+            shared = self._entries.get(digest)
+            if shared is None:
+                return None
+            shared["aliases"].add(document_id)
+            self._hash_of[document_id] = digest
+            return shared
+
+    def release(self, document_id: str) -> bool:
+        """Drop a document's alias; returns True if it was the last one and the entry was freed"""
+        with self._lock:
+            digest = self._hash_of.pop(document_id, None)
+            if digest is None:
+                return False
+            shared = self._entries[digest]
+            shared["aliases"].discard(document_id)
+            if shared["aliases"]:
+                return False
+            del self._entries[digest]
+        self.on_free(digest, shared)
+        logger.info(f"Freed shared content {digest[:12]} (last alias {document_id} released)")
+        return True
+
+    def ref_count(self, digest: str) -> int:
+        """Number of live document IDs aliasing a content hash"""
+        with self._lock:
+            shared = self._entries.get(digest)
+            return len(shared["aliases"]) if shared else 0
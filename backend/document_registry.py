@@ -0,0 +1,172 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Memory budget for documents held in memory; least recently queried ones beyond it are dropped
+# and reloaded from the index store on their next query
+DOCUMENT_MEMORY_BUDGET_MB = int(os.getenv("DOCUMENT_MEMORY_BUDGET_MB", "1024"))
+
+# Rough per-chunk overhead of the FAISS index-to-docstore-ID mapping
+_CHUNK_OVERHEAD = 120
+
+
+def estimate_document_bytes(doc: dict) -> int:
+    """Approximate memory held by a document's vector index, chunk store and keyword index"""
+    size = 0
+    chunks = doc.get("chunks")
+    if chunks is not None:
+        size += chunks.resident_bytes + len(chunks) * _CHUNK_OVERHEAD
+    keywords = doc.get("keywords")
+    if keywords is not None:
+        size += keywords.nbytes
+    index = getattr(doc.get("vectorstore"), "index", None)
+    if index is not None:
+        # Compressed indexes report their own size; flat ones hold 4-byte floats
+        size += getattr(index, "nbytes", index.ntotal * index.d * 4)
+    return size
+
+
+class DocumentRegistry:
+    """In-memory documents with a byte budget, evicting the least recently queried ones.
+
+    Entries are the document dicts built by main. Documents that share content (same
+    content hash) share its memory, so it's counted once while any of them is resident.
+    Evicted documents stay on disk: get() loads them back through load(document_id).
+    Only documents that persisted(document_id, doc) confirms are on disk are evicted;
+    on_evict(document_id) is called for each so shared content can be released.
+    """
+
+    def __init__(self, load: Callable[[str], Optional[dict]],
+                 persisted: Callable[[str, dict], bool] = lambda document_id, doc: True,
+                 on_evict: Callable[[str], None] = lambda document_id: None,
+                 max_bytes: int = DOCUMENT_MEMORY_BUDGET_MB * 1024 * 1024):
+        self.load = load
+        self.persisted = persisted
+        self.on_evict = on_evict
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._content = {}  # content key -> [bytes, resident documents]
+        self._lock = threading.Lock()
+
+    def get(self, document_id: str) -> Optional[dict]:
+        """Return a document, reloading it from disk if it isn't in memory; None if it doesn't exist"""
+        with self._lock:
+            doc = self._entries.get(document_id)
+            if doc is not None:
+                self._entries.move_to_end(document_id)
+                self.hits += 1
+                return doc
+            self.misses += 1
+
+        # Load outside the lock - it reads from disk - and keep whichever copy got in first
+        doc = self.load(document_id)
+        if doc is None:
+            return None
+        logger.info(f"Reloaded document {document_id} into memory")
+        return self._add(document_id, doc, replace=False)
+
+    def put(self, document_id: str, doc: dict) -> dict:
+        """Add or replace a document, evicting others if over budget"""
+        return self._add(document_id, doc, replace=True)
+
+    def pop(self, document_id: str, default=None) -> Optional[dict]:
+        """Remove a document from memory without calling on_evict"""
+        with self._lock:
+            doc = self._remove(document_id)
+        return default if doc is None else doc
+
+    def __contains__(self, document_id: str) -> bool:
+        with self._lock:
+            return document_id in self._entries
+
+    def __getitem__(self, document_id: str) -> dict:
+        """Resident document, without reloading or counting as an access"""
+        with self._lock:
+            return self._entries[document_id]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._entries)
+
+    def items(self) -> Iterator[Tuple[str, dict]]:
+        """Snapshot of resident documents (doesn't touch recency)"""
+        with self._lock:
+            return iter(list(self._entries.items()))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "documents": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _add(self, document_id: str, doc: dict, replace: bool) -> dict:
+        with self._lock:
+            if not replace and document_id in self._entries:
+                return self._entries[document_id]
+            if not replace:
+                self.reloads += 1
+            self._remove(document_id)
+            self._entries[document_id] = doc
+            key = self._content_key(document_id, doc)
+            content = self._content.get(key)
+            if content is None:
+                content = self._content[key] = [estimate_document_bytes(doc), 0]
+                self.total_bytes += content[0]
+            content[1] += 1
+            evicted = self._evict(keep=document_id)
+
+        for evicted_id in evicted:
+            self.on_evict(evicted_id)
+        return doc
+
+    @staticmethod
+    def _content_key(document_id: str, doc: dict) -> str:
+        return doc.get("content_hash") or document_id
+
+    def _remove(self, document_id: str) -> Optional[dict]:
+        # Caller holds the lock
+        doc = self._entries.pop(document_id, None)
+        if doc is None:
+            return None
+        key = self._content_key(document_id, doc)
+        content = self._content[key]
+        content[1] -= 1
+        if content[1] == 0:
+            self.total_bytes -= content[0]
+            del self._content[key]
+        return doc
+
+    def _evict(self, keep: str) -> List[str]:
+        # Caller holds the lock; never evicts the entry just added, even if it alone exceeds the budget
+        evicted = []
+        for document_id in list(self._entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if document_id == keep or not self.persisted(document_id, self._entries[document_id]):
+                continue
+            self._remove(document_id)
+            evicted.append(document_id)
+        if evicted:
+            self.evictions += len(evicted)
+            logger.info(f"Evicted {len(evicted)} documents from memory ({self.total_bytes} of {self.max_bytes} bytes in use)")
+        return evicted
@@ -0,0 +1,162 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# On-disk cache of chunk embeddings shared by every document (lives next to the persisted indexes)
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(os.getenv("VECTOR_STORE_PATH", "./vector_store"), "embedding_cache.db"))
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+
+# SQLite's default limit on bound parameters is 999
+_BATCH = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCacheStore:
+    """SQLite-backed cache of embedding vectors keyed by (model, chunk text hash).
+
+    Least recently used rows are evicted once the stored vectors exceed max_bytes.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_bytes: int = EMBEDDING_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """Return cached vectors for the given hashes and mark them as recently used"""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(hashes), _BATCH):
+                batch = hashes[i:i + _BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = array("f", blob).tolist()
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash IN ({placeholders})",
+                        [now, model, *batch]
+                    )
+            self._conn.commit()
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]) -> None:
+        """Store vectors, evicting least recently used rows if the cache grows past its budget"""
+        now = time.time()
+        rows = [(model, h, array("f", v).tobytes(), now) for h, v in vectors.items()]
+        with self._lock:
+            for model_, h, blob, ts in rows:
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (model_, h, blob, len(blob), ts)
+                )
+                if cur.rowcount:
+                    self.total_bytes += len(blob)
+            self._conn.commit()
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Evict down to 90% of the budget so we don't evict on every insert
+        target = int(self.max_bytes * 0.9)
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+        if not count:
+            return
+        avg_size = total / count
+        to_remove = max(1, int((total - target) / avg_size) + 1)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (to_remove,)
+        )
+        self._conn.commit()
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        logger.info(f"Embedding cache evicted {to_remove} entries ({self.total_bytes} bytes remaining)")
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends cache misses to the underlying provider"""
+
+    def __init__(self, underlying: Embeddings, store: EmbeddingCacheStore, model: Optional[str] = None):
+        self.underlying = underlying
+        self.store = store
+        self.model = model or getattr(underlying, "model", type(underlying).__name__)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(t) for t in texts]
+        cached = self.store.get_many(self.model, list(set(hashes)))
+
+        # Embed each distinct missing text once
+        missing = {}
+        for h, t in zip(hashes, texts):
+            if h not in cached and h not in missing:
+                missing[h] = t
+        if missing:
+            new_vectors = self.underlying.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), new_vectors))
+            self.store.put_many(self.model, fresh)
+            cached.update(fresh)
+
+        hits = len(texts) - len(missing)
+        cache_stats.record(hits, len(missing))
+        logger.info(
+            f"Embedding cache: {hits}/{len(texts)} chunks served from cache, "
+            f"{len(missing)} sent to {self.model} (lifetime hit rate {cache_stats.hit_rate:.1%})"
+        )
+        return [cached[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+
+class CacheStats:
+    """Process-wide embedding cache hit/miss counters"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def record(self, hits: int, misses: int) -> None:
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hit_rate, 4)}
+
+
+cache_stats = CacheStats()
@@ -0,0 +1,265 @@
+import logging
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from openai import OpenAI
+
+from metrics import ERRORS, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Embedding backend: "openai", or "hashing" for deterministic local vectors (offline tests, benchmarks, load tests)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
+# OpenAI embedding model and its vector size
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+# Vector size for the hashing backend (and for OpenAI models that accept a reduced dimension)
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "0")) or None
+# Texts per embedding request, and requests in flight at once; 0 uses the provider's default
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "0")) or None
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "0")) or None
+# Most (estimated) tokens per embedding request - OpenAI rejects requests over 300k
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "100000"))
+# Failed batches are retried this many times, backing off exponentially from the base delay
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "3"))
+EMBEDDING_RETRY_BACKOFF_SECONDS = float(os.getenv("EMBEDDING_RETRY_BACKOFF_SECONDS", "1.0"))
+
+# Native sizes of the OpenAI embedding models
+OPENAI_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+# Models that can't be asked for shorter vectors
+FIXED_DIMENSION_MODELS = {"text-embedding-ada-002"}
+
+_WORD = re.compile(r"\w+")
+
+
+class EmbeddingProvider(Embeddings):
+    """An embedding backend along with what callers need to drive it efficiently.
+
+    model names the vectors for caching (vectors from different models never mix),
+    dimension is the vector size, batch_size the most texts per request and
+    concurrency how many requests may run at once.
+    """
+
+    model: str
+    dimension: int
+    batch_size: int
+    concurrency: int
+
+    def describe(self) -> dict:
+        return {"model": self.model, "dimension": self.dimension, "batch_size": self.batch_size,
+                "concurrency": self.concurrency}
+
+
+class OpenAIProvider(EmbeddingProvider):
+    """OpenAI embeddings API (or a compatible endpoint at OPENAI_BASE_URL)"""
+
+    def __init__(self, model: str = EMBEDDING_MODEL, dimension: Optional[int] = None,
+                 batch_size: int = 256, concurrency: int = 4):
+        # ada-002 has a fixed size; newer models can be asked for shorter vectors
+        if dimension and model in FIXED_DIMENSION_MODELS and dimension != OPENAI_DIMENSIONS[model]:
+            raise ValueError(f"{model} only produces {OPENAI_DIMENSIONS[model]}-dimensional vectors, "
+                             f"not {dimension} (unset EMBEDDING_DIMENSION or use a text-embedding-3 model)")
+        self.api_model = model
+        self.dimension = dimension or OPENAI_DIMENSIONS.get(model, 1536)
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.params = {"dimensions": dimension} if dimension and model not in FIXED_DIMENSION_MODELS else {}
+        base_url = os.getenv("OPENAI_BASE_URL") or None
+        # Shortened vectors are cached apart from the model's full-size ones, and vectors from another
+        # endpoint (e.g. the load-test stand-in) apart from OpenAI's
+        self.model = f"{model}-{self.dimension}" if self.params else model
+        if base_url:
+            self.model = f"{self.model}@{base_url}"
+        # Retries are left to BatchedEmbeddings so a failing batch doesn't hold a slot through two retry loops.
+        # Texts are sent as-is, one request per batch: chunks are far below the model's context length, so
+        # there's no need for tiktoken pre-tokenisation (which downloads its encoding on first use).
+        self.client = OpenAI(base_url=base_url, max_retries=0)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            response = self.client.embeddings.create(model=self.api_model, input=texts[start:start + self.batch_size],
+                                                     **self.params)
+            vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class HashingProvider(EmbeddingProvider):
+    """Deterministic local embeddings using the hashing trick - no network, no cost.
+
+    Each word and adjacent word pair is hashed (CRC32, so stable across processes) to a
+    dimension and a sign, with sublinear term frequency, and the vector is L2-normalised.
+    Texts sharing vocabulary land close together, which is enough for retrieval to behave
+    sensibly in tests and to exercise the full pipeline at full speed.
+    """
+
+    def __init__(self, dimension: int = 1536, batch_size: int = 1000, concurrency: int = 4):
+        self.dimension = dimension
+        self.model = f"hashing-{dimension}"
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+
+    def _features(self, text: str) -> Dict[int, float]:
+        words = _WORD.findall(text.lower())
+        counts = {}
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            counts[feature] = counts.get(feature, 0) + 1
+        features = {}
+        for feature, count in counts.items():
+            h = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if h & 0x80000000 else -1.0
+            features[h % self.dimension] = features.get(h % self.dimension, 0.0) + sign * (1.0 + np.log(count))
+        return features
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            if features:
+                vectors[row, list(features)] = list(features.values())
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English) - cheap enough to run on every chunk"""
+    return len(text) // 4 + 1
+
+
+def make_batches(texts: List[str], max_texts: int, max_tokens: int) -> List[range]:
+    """Split texts into consecutive batches of at most max_texts texts and max_tokens estimated tokens.
+
+    A single text over the token budget still gets a batch of its own.
+    """
+    batches = []
+    start, tokens = 0, 0
+    for i, text in enumerate(texts):
+        size = estimate_tokens(text)
+        if i > start and (i - start >= max_texts or tokens + size > max_tokens):
+            batches.append(range(start, i))
+            start, tokens = i, 0
+        tokens += size
+    if start < len(texts):
+        batches.append(range(start, len(texts)))
+    return batches
+
+
+class EmbeddingStats:
+    """Process-wide embedding throughput counters"""
+
+    def __init__(self):
+        self.texts = 0
+        self.batches = 0
+        self.retries = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, texts: int, batches: int, retries: int, seconds: float) -> None:
+        with self._lock:
+            self.texts += texts
+            self.batches += batches
+            self.retries += retries
+            self.seconds += seconds
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.texts / self.seconds if self.seconds else 0.0
+
+    def as_dict(self) -> dict:
+        return {"texts": self.texts, "batches": self.batches, "retries": self.retries,
+                "seconds": round(self.seconds, 3), "chunks_per_second": round(self.chunks_per_second, 1)}
+
+
+embedding_stats = EmbeddingStats()
+
+
+class BatchedEmbeddings(Embeddings):
+    """Embeds documents in token-bounded batches, sent concurrently and retried with backoff.
+
+    At most provider.concurrency batches are in flight at once across every caller in the
+    process (the thread pool is shared), so concurrent ingests don't multiply the load on
+    the provider. Vectors come back in input order.
+    """
+
+    def __init__(self, provider: EmbeddingProvider, max_batch_tokens: int = EMBEDDING_BATCH_TOKENS,
+                 max_retries: int = EMBEDDING_MAX_RETRIES, backoff_seconds: float = EMBEDDING_RETRY_BACKOFF_SECONDS):
+        self.provider = provider
+        self.model = provider.model
+        self.max_batch_tokens = max_batch_tokens
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max(1, provider.concurrency), thread_name_prefix="embedding")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        started = time.perf_counter()
+        batches = make_batches(texts, self.provider.batch_size, self.max_batch_tokens)
+        results = list(self._executor.map(lambda batch: self._embed_batch([texts[i] for i in batch]), batches))
+        elapsed = time.perf_counter() - started
+
+        retries = sum(attempts for _, attempts in results)
+        embedding_stats.record(len(texts), len(batches), retries, elapsed)
+        logger.info(
+            f"Embedded {len(texts)} texts in {len(batches)} batches in {elapsed:.2f}s "
+            f"({len(texts) / elapsed if elapsed else 0:.0f} chunks/s, concurrency {self.provider.concurrency}, {retries} retries)"
+        )
+        return [vector for vectors, _ in results for vector in vectors]
+
+    def _embed_batch(self, texts: List[str]):
+        # Returns (vectors, retries used)
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                vectors = self.provider.embed_documents(texts)
+                if len(vectors) != len(texts):
+                    raise ValueError(f"Provider returned {len(vectors)} vectors for {len(texts)} texts")
+                STAGE_SECONDS.observe(time.perf_counter() - started, "embed_batch")
+                return vectors, attempt
+            except Exception as e:
+                ERRORS.inc("embed_batch")
+                if attempt == self.max_retries:
+                    logger.error(f"Embedding batch of {len(texts)} texts failed after {attempt + 1} attempts: {e}")
+                    raise
+                delay = self.backoff_seconds * (2 ** attempt) * random.uniform(0.5, 1.0)
+                logger.warning(f"Embedding batch of {len(texts)} texts failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.provider.embed_query(text)
+
+
+PROVIDERS = {
+    "openai": OpenAIProvider,
+    "hashing": HashingProvider,
+}
+
+
+def create_provider(name: str = EMBEDDING_PROVIDER, dimension: Optional[int] = EMBEDDING_DIMENSION) -> EmbeddingProvider:
+    """Build the named embedding provider, applying the EMBEDDING_* overrides (dimension may be given directly)"""
+    provider_class = PROVIDERS.get(name)
+    if provider_class is None:
+        raise ValueError(f"Unknown embedding provider '{name}' (expected one of: {', '.join(PROVIDERS)})")
+    kwargs = {"dimension": dimension, "batch_size": EMBEDDING_BATCH_SIZE, "concurrency": EMBEDDING_CONCURRENCY}
+    provider = provider_class(**{key: value for key, value in kwargs.items() if value is not None})
+    logger.info(f"Embedding provider: {provider.describe()}")
+    return provider
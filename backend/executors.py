@@ -0,0 +1,40 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for CPU-bound stages (PDF parsing, OCR, chunking); 0 runs them inline
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 1)))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def process_pool() -> ProcessPoolExecutor:
+    """Shared process pool for CPU-bound work, so it never holds the API process's GIL"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn rather than fork: the API process has live threads (workers, schedulers)
+            _pool = ProcessPoolExecutor(max_workers=max(1, CPU_WORKERS), mp_context=multiprocessing.get_context("spawn"))
+            logger.info(f"Started CPU process pool with {max(1, CPU_WORKERS)} workers")
+        return _pool
+
+
+def run_cpu_bound(fn, *args, **kwargs):
+    """Run a picklable module-level function on the process pool and wait for its result"""
+    if CPU_WORKERS <= 0:
+        return fn(*args, **kwargs)
+    return process_pool().submit(fn, *args, **kwargs).result()
+
+
+def shutdown() -> None:
+    """Stop the worker processes"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
@@ -0,0 +1,223 @@
+import logging
+import os
+import tempfile
+from collections import deque
+from io import BytesIO
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from pypdf import PdfReader
+
+from executors import run_cpu_bound
+from metrics import timed
+from ocr import OcrQueue
+
+logger = logging.getLogger(__name__)
+
+# Pages whose text layer has fewer non-whitespace characters than this are OCR'd
+OCR_MIN_PAGE_CHARS = int(os.getenv("OCR_MIN_PAGE_CHARS", "20"))
+# Pages read (and OCR'd) per step when streaming a PDF through ingestion
+EXTRACTION_WINDOW_PAGES = int(os.getenv("EXTRACTION_WINDOW_PAGES", "8"))
+
+
+class ExtractionError(Exception):
+    """Raised when no usable text can be extracted from a PDF"""
+
+
+def _open_reader(source: Union[str, bytes]) -> PdfReader:
+    reader = PdfReader(source if isinstance(source, str) else BytesIO(source))
+
+    # Check if PDF is encrypted
+    if reader.is_encrypted:
+        try:
+            reader.decrypt('')  # Try empty password
+        except Exception as e:
+            raise ExtractionError(f"PDF is encrypted and cannot be processed ({e})")
+    return reader
+
+
+def count_pages(source: Union[str, bytes]) -> int:
+    return len(_open_reader(source).pages)
+
+
+def read_text_layer(source: Union[str, bytes], first_page: int = 1, last_page: Optional[int] = None) -> List[str]:
+    """Parse the PDF (a file path or its bytes) and return the text layer of pages first_page..last_page
+    (1-based, inclusive; "" where extraction failed).
+
+    CPU-bound, so it runs on the process pool and leaves logging to the caller.
+    """
+    reader = _open_reader(source)
+
+    page_texts = []
+    for page in reader.pages[first_page - 1:last_page]:
+        try:
+            page_texts.append(page.extract_text())
+        except Exception:
+            page_texts.append("")
+    return page_texts
+
+
+def chunk_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
+    """Split text into overlapping chunks for embedding"""
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len
+    )
+    return text_splitter.split_text(text)
+
+
+class StreamingChunker:
+    """Chunks text that arrives a page at a time with the same splitter as chunk_text.
+
+    Everything up to the start of the last chunk of the unchunked tail is final once the
+    next page arrives; the last chunk is held back and re-split with the following text,
+    since it may continue across the page break. Boundaries can differ slightly from
+    chunking the whole text at once (the splitter picks separators per piece of text),
+    but chunks are still verbatim, overlapping slices no longer than chunk_size. Chunks are returned as character offsets
+    into the full text (available as .text once all pages are in). The splitting itself runs
+    on the CPU process pool; only locating the chunks in the tail stays on the calling thread.
+    """
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.length = 0
+        self._parts = []
+        self._tail = ""  # text from the start of the held-back chunk onwards
+        self._tail_start = 0
+
+    def feed(self, text: str) -> List[Tuple[int, int, str]]:
+        """Add the next page of text; returns the chunks it completed as (start, end, chunk)"""
+        self._parts.append(text)
+        self.length += len(text)
+        self._tail += text
+        with timed("chunk"):
+            return self._split(final=False)
+
+    def finish(self) -> List[Tuple[int, int, str]]:
+        """Chunk whatever text is left after the last page"""
+        with timed("chunk"):
+            return self._split(final=True)
+
+    @property
+    def text(self) -> str:
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def _split(self, final: bool) -> List[Tuple[int, int, str]]:
+        chunks = run_cpu_bound(chunk_text, self._tail, self.chunk_size, self.chunk_overlap)
+        located = []
+        cursor = 0
+        for chunk in chunks:
+            start = self._tail.find(chunk, cursor)
+            if start < 0:
+                logger.warning("Chunk is not a slice of the document text; skipping it")
+                continue
+            located.append((start, chunk))
+            cursor = start + 1
+
+        if not final:
+            if not located:
+                return []
+            held_start, _ = located.pop()
+        completed = [(self._tail_start + start, self._tail_start + start + len(chunk), chunk) for start, chunk in located]
+        if final:
+            self._tail, self._tail_start = "", self.length
+        else:
+            self._tail, self._tail_start = self._tail[held_start:], self._tail_start + held_start
+        return completed
+
+
+class ExtractedPage(NamedTuple):
+    number: int  # 1-based
+    text: str
+    ocr: bool
+
+
+def iter_pdf_pages(contents: bytes, on_progress: Optional[Callable[[str], None]] = None,
+                   window: int = EXTRACTION_WINDOW_PAGES) -> Iterator[ExtractedPage]:
+    """Extract pages in order, a window at a time, OCR'ing only pages with an empty or
+    near-empty text layer. Yields each page as soon as it and every page before it are done.
+
+    Text layers of later windows are read while earlier windows' scanned pages are still being
+    OCR'd, until the OCR queue is full.
+    """
+    report = on_progress or (lambda stage: None)
+    # Workers open the PDF from one temp file, rather than being sent its bytes for every window
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(contents)
+        pdf_path = f.name
+    ocr = OcrQueue(pdf_path)
+
+    try:
+        page_count = run_cpu_bound(count_pages, pdf_path)
+        logger.info(f"PDF loaded successfully, pages: {page_count}")
+
+        # Windows read but not yet yielded, oldest first, with the pages each is waiting on OCR for
+        waiting = deque()
+        reported_ocr = False
+        for first in range(1, page_count + 1, window):
+            last = min(first + window - 1, page_count)
+            with timed("pdf_extract"):
+                page_texts = run_cpu_bound(read_text_layer, pdf_path, first, last)
+
+            needs_ocr = []
+            for page_number, page_text in enumerate(page_texts, start=first):
+                logger.info(f"Page {page_number} extracted text length: {len(page_text)} characters")
+                if len("".join(page_text.split())) < OCR_MIN_PAGE_CHARS:
+                    needs_ocr.append(page_number)
+
+            if needs_ocr:
+                # Scanned pages (or a fully scanned document) - OCR just those pages
+                logger.info(f"{len(needs_ocr)} of pages {first}-{last} have no usable text layer, running OCR on them")
+                if not reported_ocr:
+                    report("ocr")
+                    reported_ocr = True
+                ocr.add(needs_ocr)
+            waiting.append((first, page_texts, needs_ocr))
+
+            while waiting and (ocr.ready(waiting[0][2]) or ocr.full()):
+                yield from _merge_ocr(ocr, *waiting.popleft())
+        while waiting:
+            yield from _merge_ocr(ocr, *waiting.popleft())
+    finally:
+        ocr.close()
+        os.remove(pdf_path)
+
+
+def _merge_ocr(ocr: OcrQueue, first: int, page_texts: List[str], needs_ocr: List[int]) -> Iterator[ExtractedPage]:
+    """Wait for a window's OCR and yield its pages, preferring OCR text where it found more"""
+    ocr_texts = {}
+    if needs_ocr:
+        try:
+            ocr_texts = ocr.texts(needs_ocr)
+        except Exception as e:
+            logger.error(f"OCR extraction failed: {e}")
+
+    for page_number, page_text in enumerate(page_texts, start=first):
+        ocr_text = ocr_texts.get(page_number, "")
+        if ocr_text.strip() and len(ocr_text.strip()) > len(page_text.strip()):
+            yield ExtractedPage(page_number, ocr_text + "\n", True)
+        else:
+            yield ExtractedPage(page_number, page_text, False)
+
+
+def extraction_summary(pages: int, pages_ocr: int) -> dict:
+    """How many pages used the text layer and how many OCR"""
+    pages_text_layer = pages - pages_ocr
+    if pages_ocr == 0:
+        method = "text_extraction"
+    elif pages_text_layer == 0:
+        method = "ocr"
+    else:
+        method = "hybrid"
+    return {
+        "processing_method": method,
+        "pages_text_layer": pages_text_layer,
+        "pages_ocr": pages_ocr,
+    }
+
+
+NO_TEXT_ERROR = "No text could be extracted from the PDF using OCR. The file might be corrupted or contain unreadable images."
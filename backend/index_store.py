@@ -0,0 +1,272 @@
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterator, Optional, Tuple
+
+from bm25 import KeywordIndex, KEYWORDS_FILE
+from chunk_store import ChunkStore, attach_chunk_store, SPANS_FILE, TEXT_FILE
+from shared_index import ContentFreedError
+from utils import save_faiss_index, load_faiss_index, load_vector_store
+from vector_compression import CompressedIndex
+
+logger = logging.getLogger(__name__)
+
+# Directory where per-document indexes are persisted (mounted as a volume in docker-compose)
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "./vector_store")
+
+# Document IDs are UUIDs (or the demo ID) - never allow anything that could escape the store directory
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_-]+$")
+
+META_FILE = "meta.json"
+CONTENT_FILE = "content.json"
+
+
+class IndexStore:
+    """Persists FAISS indexes and document metadata to disk and loads them back on demand.
+
+    Layout: each document gets a folder holding meta.json. The index itself (FAISS index,
+    text buffer and chunk offsets, BM25 keyword index, page and extraction stats, and the
+    exact vectors of a compressed index) lives in a folder named after its key - the PDF's
+    content hash - so byte-identical uploads share a single copy on disk. Which documents
+    reference each shared index is kept in memory (read from the metadata once at startup),
+    so an index is removed with its last document without rescanning the store.
+    Documents persisted before content hashing keep index and metadata together under the
+    document ID, and older indexes with a pickled docstore are still loaded.
+
+    Writes happen on a single background thread so uploads don't wait on disk I/O;
+    call flush() before shutdown to make sure nothing pending is lost.
+    """
+
+    def __init__(self, root: str = VECTOR_STORE_PATH):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-store")
+        self._pending = {}
+        self._lock = threading.Lock()
+        # Content hash -> IDs of the documents whose metadata (on disk or queued) references it,
+        # so deleting a document never has to scan every other document's metadata
+        self._aliases = {}
+        for document_id, meta in self.iter_metadata():
+            if meta.get("content_hash"):
+                self._aliases.setdefault(meta["content_hash"], set()).add(document_id)
+
+    def _path(self, name: str) -> Optional[str]:
+        if not name or not _SAFE_ID.match(name):
+            return None
+        return os.path.join(self.root, name)
+
+    def _submit(self, name: str, fn, *args) -> None:
+        future = self._executor.submit(fn, *args)
+        with self._lock:
+            self._pending[name] = future
+        future.add_done_callback(lambda f: self._done(name, f))
+
+    def _done(self, name: str, future) -> None:
+        with self._lock:
+            if self._pending.get(name) is future:
+                del self._pending[name]
+        if future.exception():
+            logger.error(f"Failed to persist {name}: {future.exception()}")
+        else:
+            logger.info(f"Persisted {name} to index store")
+
+    def _wait(self, name: str) -> None:
+        with self._lock:
+            future = self._pending.get(name)
+        if future is not None:
+            future.exception()
+
+    def save(self, document_id: str, doc: dict) -> None:
+        """Queue a document's metadata - and its index, unless already stored - to be written to disk"""
+        key = doc.get("content_hash") or document_id
+        doc_path = self._path(document_id)
+        index_path = self._path(key)
+        if doc_path is None or index_path is None:
+            logger.warning(f"Refusing to persist document with unsafe ID: {document_id}")
+            return
+
+        meta = {
+            "filename": doc["filename"],
+            "created_at": doc["created_at"].isoformat() if doc.get("created_at") else None,
+            "is_guest_upload": doc.get("is_guest_upload", False),
+            "is_demo": doc.get("is_demo", False),
+            "content_hash": doc.get("content_hash"),
+        }
+
+        with self._lock:
+            index_pending = key in self._pending
+        if not index_pending and not self.has_index(key):
+            content = {"pages": doc.get("pages"), "extraction": doc.get("extraction"), "text_bytes": doc["chunks"].text_bytes}
+            self._submit(key, self._write_index, index_path, doc["vectorstore"], doc["chunks"], doc.get("keywords"), content)
+        if doc.get("content_hash"):
+            with self._lock:
+                self._aliases.setdefault(key, set()).add(document_id)
+        self._submit(document_id, self._write_meta, doc_path, meta)
+
+    def _write_index(self, path: str, vectorstore, chunks: ChunkStore, keywords: Optional[KeywordIndex],
+                     content: dict) -> None:
+        # Write to a temp folder first so a crash mid-write never leaves a half-written index
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        try:
+            save_faiss_index(vectorstore, tmp_path)
+        except ContentFreedError as e:
+            # Every alias was released before the write ran - nothing left to persist
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            logger.info(f"Skipped persisting {os.path.basename(path)}: {e}")
+            return
+        chunks.save(tmp_path)
+        if keywords is not None:
+            keywords.save(tmp_path)
+        with open(os.path.join(tmp_path, CONTENT_FILE), "w", encoding="utf-8") as f:
+            json.dump(content, f)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+        if isinstance(vectorstore.index, CompressedIndex):
+            # Now on disk, the exact vectors used for re-ranking can be paged in rather than held in memory;
+            # swapped in with one assignment, so queries searching the index meanwhile are unaffected
+            try:
+                vectorstore.index.use_vectors_file(path)
+            except Exception as e:
+                logger.warning(f"Keeping exact vectors in memory for {path}: {e}")
+
+    def _write_meta(self, path: str, meta: dict) -> None:
+        os.makedirs(path, exist_ok=True)
+        tmp_file = os.path.join(path, META_FILE + ".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_file, os.path.join(path, META_FILE))
+
+    def has_index(self, key: str) -> bool:
+        """Whether an index for this content hash (or legacy document ID) is on disk"""
+        path = self._path(key)
+        return path is not None and os.path.exists(os.path.join(path, "index.faiss"))
+
+    def is_persisted(self, document_id: str, key: str) -> bool:
+        """Whether a document's metadata and index are on disk or queued to be written"""
+        with self._lock:
+            pending = set(self._pending)
+        doc_path = self._path(document_id)
+        if doc_path is None or not (document_id in pending or os.path.exists(os.path.join(doc_path, META_FILE))):
+            return False
+        return key in pending or self.has_index(key)
+
+    def load_meta(self, document_id: str) -> Optional[dict]:
+        """Load a persisted document's metadata, or None if it isn't on disk"""
+        path = self._path(document_id)
+        if path is None:
+            return None
+        # A document may be evicted (counting as persisted) while its write is still queued
+        self._wait(document_id)
+        if not os.path.exists(os.path.join(path, META_FILE)):
+            return None
+        try:
+            return self._read_meta(path)
+        except Exception as e:
+            logger.error(f"Failed to read metadata for document {document_id}: {e}")
+            return None
+
+    def load_index(self, key: str) -> Optional[dict]:
+        """Load a persisted index with its chunk store, keyword index and page count, or None if it isn't on disk"""
+        self._wait(key)
+        if not self.has_index(key):
+            return None
+        path = self._path(key)
+
+        try:
+            content = {}
+            if os.path.exists(os.path.join(path, CONTENT_FILE)):
+                with open(os.path.join(path, CONTENT_FILE), encoding="utf-8") as f:
+                    content = json.load(f)
+            if os.path.exists(os.path.join(path, SPANS_FILE)):
+                # The text buffer is memory-mapped, so it stays out of the heap
+                chunks = ChunkStore.open(path, content.get("text_bytes"))
+                vectorstore = load_faiss_index(path, chunks)
+            else:
+                vectorstore, chunks = self._load_pickled_index(path)
+            if os.path.exists(os.path.join(path, KEYWORDS_FILE)):
+                keywords = KeywordIndex.load(path)
+            else:
+                # Indexes written before hybrid retrieval - cheap enough to rebuild from the chunks
+                keywords = KeywordIndex.build(chunks)
+        except Exception as e:
+            logger.error(f"Failed to load persisted index {key}: {e}")
+            return None
+
+        return {
+            "vectorstore": vectorstore,
+            "chunks": chunks,
+            "keywords": keywords,
+            "pages": content.get("pages"),
+            "extraction": content.get("extraction"),
+        }
+
+    @staticmethod
+    def _load_pickled_index(path: str):
+        # Indexes written before chunk stores pickled the full docstore; rebuild the chunk
+        # list in insertion order from it and convert to the compact form
+        vectorstore = load_vector_store(path)
+        chunk_texts = [
+            vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]).page_content
+            for i in range(len(vectorstore.index_to_docstore_id))
+        ]
+        with open(os.path.join(path, TEXT_FILE), encoding="utf-8") as f:
+            chunks = ChunkStore.from_chunks(f.read(), chunk_texts)
+        return attach_chunk_store(vectorstore, chunks), chunks
+
+    def delete(self, document_id: str) -> None:
+        """Remove a document's metadata, and its index once no other document references it"""
+        path = self._path(document_id)
+        if path is None:
+            return
+        meta = self.load_meta(document_id) or {}
+        key = meta.get("content_hash") or document_id
+        shutil.rmtree(path, ignore_errors=True)
+        if key == document_id:
+            return
+
+        # Aliases are counted when their metadata is queued, so ones not yet on disk keep the index too
+        with self._lock:
+            aliases = self._aliases.get(key, set())
+            aliases.discard(document_id)
+            unreferenced = not aliases
+            if unreferenced:
+                self._aliases.pop(key, None)
+        if unreferenced:
+            self._wait(key)
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            logger.info(f"Removed shared index {key} (no documents left)")
+
+    def iter_metadata(self) -> Iterator[Tuple[str, dict]]:
+        """Yield (document_id, metadata) for every persisted document"""
+        for document_id in os.listdir(self.root):
+            path = self._path(document_id)
+            if path is None or not os.path.exists(os.path.join(path, META_FILE)):
+                continue
+            try:
+                yield document_id, self._read_meta(path)
+            except Exception as e:
+                logger.warning(f"Skipping unreadable index metadata for {document_id}: {e}")
+
+    def flush(self) -> None:
+        """Block until every queued write has reached disk"""
+        with self._lock:
+            pending = list(self._pending.values())
+        for future in pending:
+            future.exception()  # failures are already logged in _done
+        logger.info(f"Index store flushed ({len(pending)} pending writes)")
+
+    @staticmethod
+    def _read_meta(path: str) -> dict:
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("created_at"):
+            meta["created_at"] = datetime.fromisoformat(meta["created_at"])
+        return meta
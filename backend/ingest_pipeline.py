@@ -0,0 +1,206 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+from bm25 import KeywordIndex
+from chunk_store import ChunkStore, attach_chunk_store
+from executors import run_cpu_bound
+from metrics import timed
+from vector_compression import compress_index
+from extraction import (iter_pdf_pages, extraction_summary, StreamingChunker, ExtractionError, NO_TEXT_ERROR,
+                        EXTRACTION_WINDOW_PAGES)
+
+logger = logging.getLogger(__name__)
+
+# A document becomes queryable ("partial") once this many pages are indexed, and again each time
+# the indexed page count doubles, until it's complete; 0 only publishes the finished document
+STREAMING_FIRST_PAGES = int(os.getenv("STREAMING_FIRST_PAGES", "5"))
+# Chunks sent to the embedding stage at a time while pages are still being extracted
+STREAMING_EMBED_CHUNKS = int(os.getenv("STREAMING_EMBED_CHUNKS", "64"))
+
+_DONE = object()
+
+
+def embedding_concurrency(embeddings: Embeddings) -> int:
+    """Requests the embedding provider behind embeddings (through the cache and batching wrappers) may run at once"""
+    while embeddings is not None:
+        if isinstance(getattr(embeddings, "concurrency", None), int):
+            return max(1, embeddings.concurrency)
+        provider = getattr(embeddings, "provider", None)
+        if provider is not None:
+            return max(1, provider.concurrency)
+        embeddings = getattr(embeddings, "underlying", None)
+    return 1
+
+
+def _put(pages: queue.Queue, item, stop: threading.Event) -> bool:
+    """Put an item on the bounded page queue, giving up if the consumer has stopped; returns whether it was put"""
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _extract_pages(contents: bytes, pages: queue.Queue, on_progress: Callable[[str], None], stop: threading.Event) -> None:
+    # Producer thread: extraction (and OCR) of later pages overlaps chunking and embedding of earlier ones.
+    # Every put checks stop, so a consumer that failed and no longer drains the queue never strands this thread
+    try:
+        for page in iter_pdf_pages(contents, on_progress):
+            if not _put(pages, page, stop):
+                return
+        _put(pages, _DONE, stop)
+    except Exception as e:
+        _put(pages, e, stop)
+
+
+class StreamingIndexBuilder:
+    """Grows a document's vector index chunk by chunk as pages stream in.
+
+    Each group of STREAMING_EMBED_CHUNKS chunks is embedded in the background, with up to the
+    provider's concurrency groups in flight, so streaming keeps as many embedding requests
+    running as embedding a whole document at once would; vectors are indexed in chunk order.
+    The FAISS index is only touched by the ingesting thread; snapshot() hands out a copy
+    (plus a chunk store and keyword index over the chunks indexed so far) that queries can
+    use while the original keeps growing.
+    """
+
+    def __init__(self, embeddings: Embeddings, chunker: StreamingChunker):
+        self.embeddings = embeddings
+        self.chunker = chunker
+        self.index = None
+        self.spans: List[Tuple[int, int]] = []  # character spans of indexed chunks, in index order
+        self.concurrency = embedding_concurrency(embeddings)
+        self._pending: List[Tuple[int, int, str]] = []
+        self._in_flight: Deque[Tuple[List[Tuple[int, int, str]], Future]] = deque()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="streaming-embed")
+
+    def add(self, chunks: List[Tuple[int, int, str]]) -> None:
+        self._pending.extend(chunks)
+        if len(self._pending) >= STREAMING_EMBED_CHUNKS:
+            self._submit()
+
+    def _submit(self) -> None:
+        # Start embedding the pending chunks; once more groups are in flight than the provider
+        # runs at once, wait for (and index) the oldest
+        chunks, self._pending = self._pending, []
+        future = self._executor.submit(self.embeddings.embed_documents, [chunk for _, _, chunk in chunks])
+        self._in_flight.append((chunks, future))
+        while len(self._in_flight) > self.concurrency:
+            self._index_oldest()
+
+    def _index_oldest(self) -> None:
+        chunks, future = self._in_flight.popleft()
+        vectors = np.asarray(future.result(), dtype=np.float32)
+        with timed("index_build"):
+            if self.index is None:
+                self.index = faiss.IndexFlatL2(vectors.shape[1])
+            self.index.add(vectors)
+        self.spans.extend((start, end) for start, end, _ in chunks)
+
+    def flush(self) -> None:
+        """Embed and index every pending chunk"""
+        if self._pending:
+            self._submit()
+        while self._in_flight:
+            self._index_oldest()
+
+    def close(self) -> None:
+        """Stop the background embedding (abandoning groups not yet started)"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _store(self, index, chunks: ChunkStore) -> FAISS:
+        return attach_chunk_store(FAISS(self.embeddings, index, None, {}), chunks)
+
+    def snapshot(self) -> Optional[dict]:
+        """An independent, queryable copy of everything indexed so far (None before the first chunk)"""
+        self.flush()
+        if not self.spans:
+            return None
+        chunks = ChunkStore.from_char_spans(self.chunker.text, self.spans)
+        return {
+            "vectorstore": self._store(faiss.clone_index(self.index), chunks),
+            "chunks": chunks,
+            "keywords": run_cpu_bound(KeywordIndex.build, chunks),
+        }
+
+    def finish(self) -> dict:
+        """The completed index (compressed as configured), chunk store and keyword index"""
+        self.add(self.chunker.finish())
+        self.flush()
+        if not self.spans:
+            raise ExtractionError("Failed to create text chunks from the document.")
+        with timed("index_build"):
+            chunks = ChunkStore.from_char_spans(self.chunker.text, self.spans)
+            return {
+                "vectorstore": self._store(compress_index(self.index), chunks),
+                "chunks": chunks,
+                "keywords": run_cpu_bound(KeywordIndex.build, chunks),
+            }
+
+
+def stream_pdf(contents: bytes, embeddings: Embeddings, on_progress: Optional[Callable[[str], None]] = None,
+               on_partial: Optional[Callable[[dict], None]] = None, first_pages: int = STREAMING_FIRST_PAGES) -> dict:
+    """Extract, chunk, embed and index a PDF as a pipeline of overlapping stages.
+
+    Pages are extracted on a background thread and fed to a streaming chunker; completed
+    chunks are embedded in batches and appended to a growing FAISS index. When on_partial is
+    given it receives a queryable snapshot (vectorstore, chunks, keywords, pages_indexed, extraction) after the first first_pages pages, and again each time the indexed page count
+    doubles. Returns the finished document in the same form, as process_pdf did.
+    """
+    report = on_progress or (lambda stage: None)
+    started = time.perf_counter()
+    report("extracting")
+
+    pages: queue.Queue = queue.Queue(maxsize=EXTRACTION_WINDOW_PAGES * 2)
+    stop = threading.Event()
+    producer = threading.Thread(target=_extract_pages, args=(contents, pages, report, stop),
+                                name="pdf-extraction", daemon=True)
+    producer.start()
+
+    chunker = StreamingChunker()
+    builder = StreamingIndexBuilder(embeddings, chunker)
+    page_count = pages_ocr = 0
+    next_publish = first_pages if on_partial and first_pages > 0 else None
+    try:
+        while True:
+            page = pages.get()
+            if page is _DONE:
+                break
+            if isinstance(page, Exception):
+                raise page
+            if page_count == 0:
+                report("embedding")
+            page_count += 1
+            pages_ocr += page.ocr
+            builder.add(chunker.feed(page.text))
+
+            if next_publish is not None and page_count >= next_publish:
+                snapshot = builder.snapshot()
+                if snapshot is not None:
+                    logger.info(f"{page_count} pages indexed ({len(snapshot['chunks'])} chunks) - publishing partial document")
+                    on_partial({**snapshot, "pages_indexed": page_count,
+                                "extraction": extraction_summary(page_count, pages_ocr)})
+                next_publish *= 2
+
+        if not chunker.text.strip():
+            raise ExtractionError(NO_TEXT_ERROR)
+        document = builder.finish()
+    finally:
+        stop.set()
+        builder.close()
+
+    logger.info(f"Streamed {page_count} pages into {len(document['chunks'])} chunks in {time.perf_counter() - started:.2f}s")
+    return {**document, "pages": page_count, "extraction": extraction_summary(page_count, pages_ocr)}
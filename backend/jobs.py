@@ -0,0 +1,210 @@
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_MAX = int(os.getenv("INGEST_QUEUE_MAX", "100"))
+
+# Lower number = served first
+PRIORITY_USER = 0
+PRIORITY_GUEST = 1
+LANES = {PRIORITY_USER: "user", PRIORITY_GUEST: "guest"}
+
+# Keep finished jobs around long enough for clients to poll their final status
+FINISHED_JOB_TTL_SECONDS = 3600
+
+# Number of recent queue wait times kept for the stats endpoint
+WAIT_SAMPLES = 200
+
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue has reached its maximum depth"""
+
+
+class JobQueue:
+    """Bounded priority queue of background jobs served by a fixed pool of worker threads.
+
+    Jobs are plain dicts so they can be returned from the API as-is. Each job function
+    receives its job dict and may report progress through update().
+    """
+
+    def __init__(self, workers: int = INGEST_WORKERS, max_depth: int = INGEST_QUEUE_MAX, name: str = "ingest"):
+        self.workers = workers
+        self.max_depth = max_depth
+        self.name = name
+        self._queue = queue.PriorityQueue()
+        self._jobs = {}
+        self._by_document = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._depth = {lane: 0 for lane in LANES}
+        self._busy = 0
+        self._waits = {lane: deque(maxlen=WAIT_SAMPLES) for lane in LANES}
+        self._counts = {"completed": 0, "failed": 0, "cancelled": 0}
+        self._stopping = False
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"{name}-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {workers} {name} workers (max queue depth {max_depth})")
+
+    def submit(self, fn: Callable[[dict], None], priority: int = PRIORITY_GUEST, document_id: Optional[str] = None,
+               on_cancel: Optional[Callable[[dict], None]] = None) -> dict:
+        """Queue a job; raises QueueFullError if the queue is at capacity"""
+        with self._lock:
+            if self._stopping:
+                raise QueueFullError("Job queue is shutting down")
+            if sum(self._depth.values()) >= self.max_depth:
+                raise QueueFullError(f"{self.name} queue is full ({self.max_depth} jobs waiting)")
+            self._prune()
+            job = {
+                "id": str(uuid.uuid4()),
+                "document_id": document_id,
+                "status": "queued",
+                "progress": "queued",
+                "lane": LANES[priority],
+                "error": None,
+                "enqueued_at": datetime.utcnow(),
+                "started_at": None,
+                "finished_at": None,
+            }
+            self._jobs[job["id"]] = job
+            if document_id:
+                self._by_document[document_id] = job["id"]
+            self._depth[priority] += 1
+            self._queue.put((priority, next(self._seq), job["id"], fn, on_cancel))
+        return job
+
+    def record(self, document_id: Optional[str] = None, status: str = "completed") -> dict:
+        """Register a job that was finished inline, so clients can poll it like any other"""
+        now = datetime.utcnow()
+        job = {
+            "id": str(uuid.uuid4()),
+            "document_id": document_id,
+            "status": status,
+            "progress": status,
+            "lane": None,
+            "error": None,
+            "enqueued_at": now,
+            "started_at": now,
+            "finished_at": now,
+        }
+        with self._lock:
+            self._prune()
+            self._jobs[job["id"]] = job
+            if document_id:
+                self._by_document[document_id] = job["id"]
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def job_for_document(self, document_id: str) -> Optional[dict]:
+        """Most recent job that ingests the given document"""
+        with self._lock:
+            job_id = self._by_document.get(document_id)
+        return self.get(job_id) if job_id else None
+
+    def update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def stats(self) -> dict:
+        """Queue depth, worker utilisation and recent wait times per lane"""
+        with self._lock:
+            lanes = {}
+            for priority, lane in LANES.items():
+                waits = sorted(self._waits[priority])
+                lanes[lane] = {
+                    "depth": self._depth[priority],
+                    "avg_wait_ms": int(sum(waits) / len(waits)) if waits else 0,
+                    "p95_wait_ms": waits[int(len(waits) * 0.95) - 1] if waits else 0,
+                    "max_wait_ms": waits[-1] if waits else 0,
+                }
+            return {
+                "workers": self.workers,
+                "busy_workers": self._busy,
+                "depth": sum(self._depth.values()),
+                "max_depth": self.max_depth,
+                "lanes": lanes,
+                **self._counts,
+            }
+
+    def shutdown(self, timeout: float = 30.0) -> List[dict]:
+        """Stop accepting work, wait for running jobs, and cancel the ones still queued"""
+        with self._lock:
+            self._stopping = True
+        cancelled = []
+        while True:
+            try:
+                priority, _, job_id, _, on_cancel = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._depth[priority] -= 1
+                self._counts["cancelled"] += 1
+                job = self._jobs[job_id]
+                job.update(status="failed", progress="failed", error="Cancelled by server shutdown",
+                           finished_at=datetime.utcnow())
+            if on_cancel:
+                try:
+                    on_cancel(dict(job))
+                except Exception as e:
+                    logger.error(f"Cancel handler for job {job_id} failed: {e}")
+            cancelled.append(dict(job))
+        for _ in self._threads:
+            self._queue.put((-1, next(self._seq), None, None, None))  # wake each worker so it can exit
+        deadline = time.time() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.time()))
+        if cancelled:
+            logger.warning(f"Cancelled {len(cancelled)} queued {self.name} jobs on shutdown")
+        return cancelled
+
+    def _worker(self) -> None:
+        while True:
+            priority, _, job_id, fn, _ = self._queue.get()
+            if job_id is None:
+                return
+            started = datetime.utcnow()
+            with self._lock:
+                self._depth[priority] -= 1
+                self._busy += 1
+                job = self._jobs[job_id]
+                job.update(status="processing", progress="processing", started_at=started)
+                self._waits[priority].append(int((started - job["enqueued_at"]).total_seconds() * 1000))
+            try:
+                fn(job)
+                status, error = "completed", None
+            except Exception as e:
+                status, error = "failed", str(getattr(e, "detail", e))
+                logger.error(f"{self.name} job {job_id} failed: {error}")
+            with self._lock:
+                self._busy -= 1
+                self._counts[status] += 1
+                job.update(status=status, progress=status, error=error, finished_at=datetime.utcnow())
+
+    def _prune(self) -> None:
+        # Caller holds the lock
+        now = datetime.utcnow()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] and (now - job["finished_at"]).total_seconds() > FINISHED_JOB_TTL_SECONDS
+        ]
+        for job_id in expired:
+            job = self._jobs.pop(job_id)
+            if self._by_document.get(job["document_id"]) == job_id:
+                del self._by_document[job["document_id"]]
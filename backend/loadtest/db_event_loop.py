@@ -0,0 +1,151 @@
+"""Event-loop lag under concurrent database load.
+
+Runs the /history workload (a user's recent documents and activity summary) from many concurrent
+requests, three ways, while a heartbeat task measures how late the event loop wakes it:
+
+    blocking    a sync session called straight from the coroutine, as async endpoints used to
+    threadpool  a sync session through run_in_threadpool, the sync dependency path
+    async       the async engine, running the same helpers through AsyncSession.run_sync
+
+Run from the backend directory:
+
+    python -m loadtest.db_event_loop --concurrency 50 --requests 2000
+
+Tables and seed rows are created in --database-url (a temporary SQLite file by default), so
+don't point it at a database you care about. Pool settings come from the DB_POOL_* variables.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+from starlette.concurrency import run_in_threadpool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = ("blocking", "threadpool", "async")
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))] if ordered else 0.0
+
+
+def seed(users: int, documents_per_user: int) -> List[str]:
+    """Create the tables and users with documents, returning the user IDs"""
+    from database import SessionLocal, create_tables
+    from models import Document, User
+
+    create_tables()
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        for user_id in user_ids:
+            db.add(User(id=user_id, firebase_uid=f"loadtest-{user_id}", email=f"{user_id}@loadtest.local", credits=5))
+            db.add_all(Document(filename=str(uuid.uuid4()), original_filename=f"document-{i}.pdf", file_size=100_000 + i,
+                                upload_date=now - timedelta(minutes=i), user_id=user_id, text_length=20_000,
+                                meta={"pages": 10}) for i in range(documents_per_user))
+        db.commit()
+    return user_ids
+
+
+def history(db, user_id: str) -> tuple:
+    from db_services import get_document_history, get_user_activity_summary
+    return get_document_history(db, user_id), get_user_activity_summary(db, user_id)
+
+
+async def heartbeat(interval: float, lags: List[float], stop: asyncio.Event) -> None:
+    """Sleep interval seconds at a time, recording how much later than asked each wake-up was"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - started - interval)
+
+
+async def run_mode(mode: str, user_ids: List[str], requests: int, concurrency: int, interval: float = 0.001) -> dict:
+    """Serve requests history lookups, at most concurrency at once, and report latency and loop lag"""
+    from database import AsyncSessionLocal, SessionLocal
+
+    def sync_history(user_id: str) -> tuple:
+        with SessionLocal() as db:
+            return history(db, user_id)
+
+    async def one(user_id: str) -> None:
+        if mode == "blocking":
+            sync_history(user_id)
+        elif mode == "threadpool":
+            await run_in_threadpool(sync_history, user_id)
+        else:
+            async with AsyncSessionLocal() as db:
+                await db.run_sync(history, user_id)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def request(i: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await one(user_ids[i % len(user_ids)])
+            latencies.append(time.perf_counter() - started)
+
+    lags = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(interval, lags, stop))
+    await asyncio.sleep(interval)
+    started = time.perf_counter()
+    await asyncio.gather(*(request(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await beat
+    return {
+        "mode": mode,
+        "requests_per_second": round(requests / elapsed, 1),
+        "latency_p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "loop_lag_p50_ms": round(percentile(lags, 0.5) * 1000, 2),
+        "loop_lag_p99_ms": round(percentile(lags, 0.99) * 1000, 2),
+        "loop_lag_max_ms": round(max(lags, default=0.0) * 1000, 2),
+    }
+
+
+async def run(modes: List[str], user_ids: List[str], requests: int, concurrency: int) -> List[dict]:
+    from database import async_engine
+
+    try:
+        return [await run_mode(mode, user_ids, requests, concurrency) for mode in modes]
+    finally:
+        await async_engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="database to create tables and seed rows in (default: temporary SQLite)")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--documents-per-user", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # database.py builds its engines on import, so choose the database first
+        os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'loadtest.db')}"
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+        user_ids = seed(args.users, args.documents_per_user)
+        results = asyncio.run(run(args.modes, user_ids, args.requests, args.concurrency))
+
+    print(f"{args.requests} requests, {args.concurrency} concurrent\n")
+    print(f"{'mode':<12}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'lag p50':>10}{'lag p99':>10}{'lag max':>10}")
+    for row in results:
+        print(f"{row['mode']:<12}{row['requests_per_second']:>9.1f}{row['latency_p50_ms']:>9.2f}{row['latency_p99_ms']:>9.2f}"
+              f"{row['loop_lag_p50_ms']:>10.2f}{row['loop_lag_p99_ms']:>10.2f}{row['loop_lag_max_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
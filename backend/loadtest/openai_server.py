@@ -0,0 +1,256 @@
+"""Local OpenAI-compatible stand-in for load and capacity tests.
+
+Serves the endpoints the backend uses - POST /v1/chat/completions (streaming and not) and
+POST /v1/embeddings - with simulated latency, token rates and injected errors, so /query and
+/upload can be load tested in CI or on an isolated box without calling OpenAI.
+
+Run from the backend directory, then point the backend at it:
+
+    python -m loadtest.openai_server --port 8100 --latency lognormal --latency-ms 400 \\
+        --tokens-per-second 40 --error-rate 0.02
+    OPENAI_BASE_URL=http://localhost:8100/v1 OPENAI_API_KEY=sk-local uvicorn main:app
+
+Embeddings are the hashing provider's deterministic vectors, so retrieval still returns
+related chunks. GET /stats reports request, error and token counts.
+
+The embedding cache keys vectors by model and, when OPENAI_BASE_URL is set, by that URL too, so
+the stand-in's vectors are never served once the backend points back at OpenAI. To keep load
+tests out of a real cache file altogether, also give the backend its own EMBEDDING_CACHE_PATH:
+
+    EMBEDDING_CACHE_PATH=/tmp/loadtest_embeddings.db OPENAI_BASE_URL=http://localhost:8100/v1 ...
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embeddings import HashingProvider, OPENAI_DIMENSIONS, estimate_tokens
+
+LATENCY_KINDS = ("constant", "uniform", "normal", "lognormal")
+ERROR_MESSAGES = {
+    429: ("rate_limit_exceeded", "Rate limit reached (injected by the stand-in server)"),
+    500: ("server_error", "The server had an error while processing your request (injected)"),
+    502: ("bad_gateway", "Bad gateway (injected)"),
+    503: ("service_unavailable", "The engine is currently overloaded (injected)"),
+}
+
+
+class LatencyModel:
+    """Delay before a response starts (time to first token when streaming).
+
+    constant: always mean_ms; uniform: mean_ms +/- spread ms; normal: mean_ms with a standard
+    deviation of spread ms; lognormal: median mean_ms with shape (sigma) spread, which gives
+    the long tail real APIs have.
+    """
+
+    def __init__(self, kind: str = "constant", mean_ms: float = 0.0, spread: float = 0.0):
+        if kind not in LATENCY_KINDS:
+            raise ValueError(f"Unknown latency distribution '{kind}' (expected one of: {', '.join(LATENCY_KINDS)})")
+        self.kind = kind
+        self.mean_ms = mean_ms
+        self.spread = spread
+
+    def sample(self, rng: random.Random) -> float:
+        """A delay in seconds"""
+        if self.kind == "uniform":
+            ms = rng.uniform(self.mean_ms - self.spread, self.mean_ms + self.spread)
+        elif self.kind == "normal":
+            ms = rng.gauss(self.mean_ms, self.spread)
+        elif self.kind == "lognormal":
+            ms = self.mean_ms * rng.lognormvariate(0, self.spread)
+        else:
+            ms = self.mean_ms
+        return max(ms, 0.0) / 1000
+
+
+class StandInConfig:
+    """Behaviour of the stand-in server"""
+
+    def __init__(self, latency: Optional[LatencyModel] = None, tokens_per_second: float = 50.0,
+                 completion_tokens: int = 120, embedding_ms_per_input: float = 0.0, error_rate: float = 0.0,
+                 error_statuses: Sequence[int] = (429, 500), stream_abort_rate: float = 0.0,
+                 seed: Optional[int] = None):
+        self.latency = latency or LatencyModel()
+        self.tokens_per_second = tokens_per_second  # 0 sends every token at once
+        self.completion_tokens = completion_tokens
+        self.embedding_ms_per_input = embedding_ms_per_input
+        self.error_rate = error_rate
+        self.error_statuses = list(error_statuses)
+        self.stream_abort_rate = stream_abort_rate  # streams cut off partway, like a dropped connection
+        self.seed = seed
+
+
+def completion_tokens(messages: List[dict], count: int) -> List[str]:
+    """Answer text as count word tokens, drawn from the prompt so it reads like a grounded answer"""
+    words = " ".join(str(message.get("content") or "") for message in messages).split() or ["Answer."]
+    return [("" if i == 0 else " ") + words[i % len(words)] for i in range(count)]
+
+
+def _embedding_input(value) -> List[str]:
+    # The SDK accepts a string, a list of strings, or (pre-tokenised) lists of token IDs
+    if isinstance(value, str):
+        return [value]
+    if value and all(isinstance(item, int) for item in value):
+        return [" ".join(map(str, value))]
+    return [item if isinstance(item, str) else " ".join(map(str, item)) for item in value]
+
+
+def create_app(config: StandInConfig) -> FastAPI:
+    app = FastAPI(title="OpenAI stand-in")
+    rng = random.Random(config.seed)
+    providers: Dict[int, HashingProvider] = {}
+    stats = {"chat_completions": 0, "chat_streams": 0, "embeddings": 0, "embedded_inputs": 0,
+             "errors": 0, "aborted_streams": 0, "completion_tokens": 0}
+
+    def injected_error() -> Optional[JSONResponse]:
+        if config.error_rate <= 0 or rng.random() >= config.error_rate:
+            return None
+        status = rng.choice(config.error_statuses)
+        code, message = ERROR_MESSAGES.get(status, ("error", "Injected error"))
+        stats["errors"] += 1
+        headers = {"retry-after": "1"} if status == 429 else None
+        return JSONResponse({"error": {"message": message, "type": code, "param": None, "code": code}},
+                            status_code=status, headers=headers)
+
+    def token_delay() -> float:
+        return 1 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        error = injected_error()
+        if error is not None:
+            return error
+
+        messages = body.get("messages", [])
+        tokens = completion_tokens(messages, body.get("max_tokens") or config.completion_tokens)
+        prompt_tokens = sum(estimate_tokens(str(message.get("content") or "")) for message in messages)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get("model", "gpt-4")
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                 "total_tokens": prompt_tokens + len(tokens)}
+
+        if not body.get("stream"):
+            stats["chat_completions"] += 1
+            await asyncio.sleep(config.latency.sample(rng) + len(tokens) * token_delay())
+            stats["completion_tokens"] += len(tokens)
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        stats["chat_streams"] += 1
+        abort_after = rng.randrange(len(tokens)) if rng.random() < config.stream_abort_rate else None
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def chunk(delta: dict, finish_reason: Optional[str] = None) -> str:
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                       "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events():
+            await asyncio.sleep(config.latency.sample(rng))
+            yield chunk({"role": "assistant", "content": ""})
+            for i, token in enumerate(tokens):
+                if i == abort_after:
+                    stats["aborted_streams"] += 1
+                    raise ConnectionResetError("Stream aborted (injected by the stand-in server)")
+                if i:
+                    await asyncio.sleep(token_delay())
+                stats["completion_tokens"] += 1
+                yield chunk({"content": token})
+            yield chunk({}, "stop")
+            if include_usage:
+                usage_chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                               "model": model, "choices": [], "usage": usage}
+                yield f"data: {json.dumps(usage_chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        error = injected_error()
+        if error is not None:
+            return error
+
+        texts = _embedding_input(body.get("input", []))
+        model = body.get("model", "text-embedding-ada-002")
+        dimension = body.get("dimensions") or OPENAI_DIMENSIONS.get(model, 1536)
+        provider = providers.setdefault(dimension, HashingProvider(dimension=dimension))
+        stats["embeddings"] += 1
+        stats["embedded_inputs"] += len(texts)
+
+        delay = config.latency.sample(rng) + len(texts) * config.embedding_ms_per_input / 1000
+        started = time.perf_counter()
+        vectors = await run_in_threadpool(provider.embed_documents, texts)
+        await asyncio.sleep(max(0.0, delay - (time.perf_counter() - started)))
+
+        as_base64 = body.get("encoding_format") == "base64"
+        data = [{
+            "object": "embedding",
+            "index": i,
+            "embedding": base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode() if as_base64 else vector,
+        } for i, vector in enumerate(vectors)]
+        prompt_tokens = sum(estimate_tokens(text) for text in texts)
+        return {"object": "list", "data": data, "model": model,
+                "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens}}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", choices=LATENCY_KINDS, default="lognormal", help="latency distribution")
+    parser.add_argument("--latency-ms", type=float, default=300, help="mean (median for lognormal) latency")
+    parser.add_argument("--latency-spread", type=float, default=0.5,
+                        help="ms for uniform/normal, sigma for lognormal (default: 0.5)")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="streamed completion rate; 0 for no delay")
+    parser.add_argument("--completion-tokens", type=int, default=120, help="tokens per answer")
+    parser.add_argument("--embedding-ms-per-input", type=float, default=0.5, help="extra embedding latency per text")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-statuses", default="429,500", help="comma-separated statuses injected errors use")
+    parser.add_argument("--stream-abort-rate", type=float, default=0.0, help="fraction of streams cut off partway")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = StandInConfig(
+        latency=LatencyModel(args.latency, args.latency_ms, args.latency_spread),
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        embedding_ms_per_input=args.embedding_ms_per_input,
+        error_rate=args.error_rate,
+        error_statuses=[int(status) for status in args.error_statuses.split(",")],
+        stream_abort_rate=args.stream_abort_rate,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
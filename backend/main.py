@@ -2,32 +2,47 @@
 
 from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+from fastapi.responses import StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
 from langchain_community.vectorstores import FAISS
-from pypdf import PdfReader
 import os
-from openai import OpenAI
+import json
+import hashlib
+import asyncio
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 import uuid
 from pydantic import BaseModel, Field
 import logging
-from io import BytesIO
-import pytesseract
-from PIL import Image
-from pdf2image import convert_from_bytes
-import tempfile
 import time
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import firebase_admin
 from firebase_admin import auth as firebase_auth, credentials
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, List, Optional, Tuple
 
 # Import database components
-from database import get_db, create_tables, get_user_by_firebase_uid
+from database import get_db, get_async_db, create_tables, get_user_by_firebase_uid, SessionLocal, AsyncSessionLocal, async_engine
 from models import Document, DocumentQuery, User, GuestUpload
-from db_services import save_document, save_query, get_document_history, get_document_queries, get_user_activity_summary
+from db_services import save_document, update_document, save_query, get_document_history, get_document_queries, get_user_activity_summary, get_user_document_ids, deduct_credit, delete_document, touch_last_login
+from index_store import IndexStore
+from dedup import ContentIndex, content_hash
+from utils import get_embeddings, get_embedding_provider
+from executors import shutdown as shutdown_process_pool
+from extraction import ExtractionError
+from ingest_pipeline import stream_pdf
+from chunk_store import search_chunks
+from bm25 import query_terms, top_chunks, fuse
+from shared_index import SharedVectorIndex, ContentFreedError, VECTOR_INDEX_MODE
+from jobs import JobQueue, QueueFullError, PRIORITY_USER, PRIORITY_GUEST
+from answer_cache import AnswerCache
+from auth_cache import TokenCache, UserCache
+from query_writer import QueryWriter, QUERY_WRITE_BEHIND
+from embedding_cache import cache_stats
+from embeddings import embedding_stats
+from document_registry import DocumentRegistry
+from metrics import REGISTRY, CONTENT_TYPE, CallbackMetric, STAGE_SECONDS, ERRORS, QUERIES, UPLOADS, timed
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -35,13 +50,17 @@ logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# OpenAI-compatible API endpoint, e.g. the local stand-in in loadtest/ (unset: api.openai.com)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=OPENAI_BASE_URL)
 
 # Debug environment variables
 logger.info("Current working directory: %s", os.getcwd())
 logger.info("Environment variables loaded: %s", bool(os.getenv("OPENAI_API_KEY")))
 logger.info("API Key starts with: %s", os.getenv("OPENAI_API_KEY")[:5] if os.getenv("OPENAI_API_KEY") else "Not found")
 
+if OPENAI_BASE_URL:
+    logger.info(f"Using OpenAI API at {OPENAI_BASE_URL}")
 if not client.api_key:
     logger.error("OpenAI API key not found in environment variables!")
     raise ValueError("OpenAI API key not found in environment variables")
@@ -62,8 +81,125 @@ app.add_middleware(
     max_age=3600,  # Cache preflight requests for 1 hour
 )
 
-# Store document embeddings in memory
-document_stores = {}
+# Persist document indexes to disk so they survive restarts
+index_store = IndexStore()
+
+# Optionally keep every document's vectors in one node-wide index instead of one FAISS index each
+shared_vector_index = SharedVectorIndex() if VECTOR_INDEX_MODE == "shared" else None
+
+# Byte-identical uploads share one set of text, chunks and vector index; in shared index mode,
+# content freed by its last alias has its vectors dropped from the shared index too
+content_index = ContentIndex(
+    on_free=lambda digest, shared: shared_vector_index.remove(digest) if shared_vector_index else None
+)
+
+# Background ingestion workers - authenticated users get a higher-priority lane than guests
+ingest_queue = JobQueue()
+
+# Answers to repeated questions (e.g. the demo document's suggested questions)
+answer_cache = AnswerCache()
+
+# Verified ID tokens and resolved user rows, so authenticating a request is normally two dict lookups
+token_cache = TokenCache()
+user_cache = UserCache()
+
+# Query history is buffered and written in batches off the request path
+query_writer = QueryWriter(SessionLocal) if QUERY_WRITE_BEHIND else None
+
+def register_content(digest: str, shared: dict) -> dict:
+    """Register processed content under its hash, moving its vectors into the shared index if enabled"""
+    if shared_vector_index is not None and isinstance(shared["vectorstore"], FAISS):
+        shared["vectorstore"] = shared_vector_index.adopt(digest, shared["vectorstore"], shared["chunks"])
+    return content_index.register(digest, shared)
+
+def load_shared_content(digest: str) -> Optional[dict]:
+    """Find already-processed content by hash, in memory or persisted on disk"""
+    shared = content_index.lookup(digest)
+    if shared is None:
+        shared = index_store.load_index(digest)
+        if shared is not None:
+            shared = register_content(digest, shared)
+    return shared
+
+def alias_content(document_id: str, digest: str, shared: dict) -> dict:
+    """Make a document ID an alias of shared content, returning the entry it now aliases"""
+    registered = content_index.add_alias(digest, document_id)
+    while registered is None:
+        # The last alias was evicted or cleaned up since the content was looked up, freeing it -
+        # reload it from disk, or register the copy in hand if it was never persisted
+        if load_shared_content(digest) is None:
+            register_content(digest, shared)
+        registered = content_index.add_alias(digest, document_id)
+    return registered
+
+def build_document(document_id: str, digest: str, shared: dict, filename: str, created_at: datetime,
+                   is_guest_upload: bool, is_demo: bool = False) -> dict:
+    """Make a document ID an alias of shared content and return its in-memory entry"""
+    shared = alias_content(document_id, digest, shared)
+    doc = {
+        "filename": filename,
+        "vectorstore": shared["vectorstore"],
+        "chunks": shared["chunks"],  # ChunkStore: the text once, chunks as offsets into it
+        "keywords": shared.get("keywords"),  # BM25 inverted index over the chunks
+        "pages": shared.get("pages"),
+        "extraction": shared.get("extraction") or {},
+        "content_hash": digest,
+        "is_demo": is_demo,
+        "created_at": created_at,  # Track creation time for cleanup
+        "is_guest_upload": is_guest_upload  # Track if guest upload (24h TTL vs 7d for users)
+    }
+    return doc
+
+def store_document(document_id: str, digest: str, shared: dict, filename: str, created_at: datetime,
+                   is_guest_upload: bool, is_demo: bool = False) -> dict:
+    """Register a document ID as an alias of shared content in document_stores"""
+    doc = build_document(document_id, digest, shared, filename, created_at, is_guest_upload, is_demo)
+    return document_stores.put(document_id, doc)
+
+def load_document(document_id: str) -> Optional[dict]:
+    """Load a document persisted by the index store - after a restart, or after eviction from memory"""
+    meta = index_store.load_meta(document_id)
+    if meta is None:
+        return None
+    # Documents persisted before content hashing keep their index under the document ID
+    digest = meta.get("content_hash") or document_id
+    shared = load_shared_content(digest)
+    if shared is None:
+        return None
+    return build_document(document_id, digest, shared, meta["filename"], meta["created_at"],
+                          meta.get("is_guest_upload", False), meta.get("is_demo", False))
+
+def get_document_store(document_id: str) -> Optional[dict]:
+    """Return a document's in-memory store, loading it from disk if it isn't resident"""
+    return document_stores.get(document_id)
+
+# In-memory documents, kept within a byte budget - the least recently queried are dropped
+# (their shared content released) and reloaded from the index store when next queried
+document_stores = DocumentRegistry(
+    load=load_document,
+    persisted=lambda document_id, doc: index_store.is_persisted(document_id, doc.get("content_hash") or document_id),
+    on_evict=content_index.release
+)
+
+# Cache and memory metrics are read from the stats these already keep, at scrape time only
+CallbackMetric("legal_lens_cache_hits_total", "Cache hits by cache (answer, embedding, document, auth_token, auth_user)",
+               lambda: {("answer",): answer_cache.hits, ("embedding",): cache_stats.hits, ("document",): document_stores.hits,
+                        ("auth_token",): token_cache.hits, ("auth_user",): user_cache.hits},
+               kind="counter", labelnames=["cache"])
+CallbackMetric("legal_lens_cache_misses_total", "Cache misses by cache (answer, embedding, document, auth_token, auth_user)",
+               lambda: {("answer",): answer_cache.misses, ("embedding",): cache_stats.misses, ("document",): document_stores.misses,
+                        ("auth_token",): token_cache.misses, ("auth_user",): user_cache.misses},
+               kind="counter", labelnames=["cache"])
+CallbackMetric("legal_lens_documents_in_memory", "Documents held in document_stores", lambda: len(document_stores))
+CallbackMetric("legal_lens_document_memory_bytes", "Estimated memory used by documents in document_stores",
+               lambda: document_stores.total_bytes)
+CallbackMetric("legal_lens_document_memory_budget_bytes", "Memory budget of document_stores", lambda: document_stores.max_bytes)
+CallbackMetric("legal_lens_answer_cache_bytes", "Memory used by cached answers", lambda: answer_cache.total_bytes)
+CallbackMetric("legal_lens_ingest_queue_depth", "Ingestion jobs waiting by lane",
+               lambda: {(lane,): stats["depth"] for lane, stats in ingest_queue.stats()["lanes"].items()},
+               labelnames=["lane"])
+CallbackMetric("legal_lens_query_write_pending", "Query history rows buffered and not yet written",
+               lambda: query_writer.stats()["pending"] if query_writer else None)
 
 # Create database tables on startup
 create_tables()
@@ -81,44 +217,32 @@ async def load_demo_document():
         with open(DEMO_DOCUMENT_PATH, "rb") as f:
             contents = f.read()
 
-        pdf_file = BytesIO(contents)
-        reader = PdfReader(pdf_file)
-
-        # Extract text
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text()
+        # Reuse the persisted demo index if we have one - saves re-embedding on every restart
+        digest = content_hash(contents)
+        shared = load_shared_content(digest)
+        if shared is None:
+            shared = register_content(digest, process_pdf(contents))
 
-        if not text.strip():
-            # Try OCR for scanned PDFs
-            text = extract_text_with_ocr(contents)
-
-        # Split text into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len
-        )
-        chunks = text_splitter.split_text(text)
-
-        # Create embeddings and store them
-        embeddings = OpenAIEmbeddings()
-        vectorstore = FAISS.from_texts(chunks, embeddings)
-
-        document_stores[DEMO_DOCUMENT_ID] = {
-            "filename": "Robinhood Cash Sweep Program (Demo)",
-            "vectorstore": vectorstore,
-            "chunks": chunks,
-            "text": text,
-            "is_demo": True,
-            "created_at": datetime.utcnow(),  # Track creation time
-            "is_guest_upload": False  # Demo documents never expire
-        }
+        # Demo documents never expire
+        doc = store_document(DEMO_DOCUMENT_ID, digest, shared, "Robinhood Cash Sweep Program (Demo)",
+                             datetime.utcnow(), is_guest_upload=False, is_demo=True)
+        index_store.save(DEMO_DOCUMENT_ID, doc)
 
-        logger.info(f"Demo document loaded successfully with {len(chunks)} chunks")
+        logger.info(f"Demo document loaded successfully with {len(shared['chunks'])} chunks")
     except Exception as e:
         logger.error(f"Failed to load demo document: {e}")
 
+@app.on_event("shutdown")
+async def flush_index_store():
+    """Let running ingestion jobs finish, then make sure every pending index write and buffered query
+    reaches disk"""
+    ingest_queue.shutdown()
+    shutdown_process_pool()
+    index_store.flush()
+    if query_writer is not None:
+        query_writer.shutdown()
+    await async_engine.dispose()
+
 # Initialize Firebase Admin SDK (only once)
 if not firebase_admin._apps:
     cred = credentials.Certificate(os.getenv("FIREBASE_ADMIN_CREDENTIAL") or "firebase-admin.json")
@@ -134,8 +258,12 @@ def cleanup_old_documents():
     cutoff_guest = datetime.utcnow() - timedelta(hours=24)
     cutoff_user = datetime.utcnow() - timedelta(days=7)
 
+    # Include persisted documents that haven't been loaded back into memory since a restart
+    all_documents = dict(index_store.iter_metadata())
+    all_documents.update(document_stores.items())
+
     to_delete = []
-    for doc_id, doc_data in document_stores.items():
+    for doc_id, doc_data in all_documents.items():
         # Skip demo documents
         if doc_data.get("is_demo"):
             continue
@@ -151,7 +279,11 @@ def cleanup_old_documents():
             to_delete.append(doc_id)
 
     for doc_id in to_delete:
-        del document_stores[doc_id]
+        document_stores.pop(doc_id, None)
+        answer_cache.invalidate(doc_id)
+        # Shared content is only freed once its last alias expires
+        content_index.release(doc_id)
+        index_store.delete(doc_id)
         logger.info(f"Cleaned up document: {doc_id}")
 
     if to_delete:
@@ -230,6 +362,15 @@ def record_guest_upload_atomic(db: Session, ip_address: str, document_id: str, m
         logger.error(f"Error recording guest upload: {e}")
         return False
 
+def release_guest_upload(db: Session, document_id: str) -> None:
+    """Remove a guest upload record, e.g. for an upload rejected before processing, so it doesn't count against the daily limit"""
+    try:
+        db.query(GuestUpload).filter(GuestUpload.document_id == document_id).delete(synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error releasing guest upload {document_id}: {e}")
+
 def record_guest_upload(db: Session, ip_address: str, document_id: str):
     """Record a guest upload in the database (legacy, non-atomic)"""
     guest_upload = GuestUpload(
@@ -239,61 +380,353 @@ def record_guest_upload(db: Session, ip_address: str, document_id: str):
     db.add(guest_upload)
     db.commit()
 
-def extract_text_with_ocr(pdf_bytes: bytes) -> str:
-    """Extract text from scanned PDF using OCR"""
-    logger.info("Attempting OCR text extraction...")
+def process_pdf(contents: bytes, on_progress: Optional[Callable[[str], None]] = None,
+                on_partial: Optional[Callable[[dict], None]] = None) -> dict:
+    """Extract text from a PDF (OCR'ing scanned pages), chunk it and build its vector index.
+
+    Runs as a streaming pipeline; on_partial receives queryable snapshots while later pages
+    are still being processed.
+    """
     try:
-        # Convert PDF to images
-        images = convert_from_bytes(pdf_bytes, dpi=300)
-        logger.info(f"Converted PDF to {len(images)} images")
-        
-        text = ""
-        for i, image in enumerate(images):
-            try:
-                # Extract text using OCR
-                page_text = pytesseract.image_to_string(image)
-                logger.info(f"OCR Page {i+1}: {len(page_text)} characters")
-                text += page_text + "\n"
-            except Exception as e:
-                logger.warning(f"OCR failed for page {i+1}: {e}")
-                continue
-        
-        logger.info(f"OCR extraction complete: {len(text)} total characters")
-        return text.strip()
+        # Only chunks missing from the embedding cache hit the API
+        processed = stream_pdf(contents, get_embeddings(), on_progress=on_progress, on_partial=on_partial)
+    except ExtractionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info(f"Created {len(processed['chunks'])} text chunks, embeddings and vector store")
+    return processed
+
+def set_processing_status(document_pk: Optional[str], status: str, **fields) -> None:
+    """Record ingestion progress on the document's database row (safe to call from worker threads)"""
+    if document_pk is None:
+        return
+    db = SessionLocal()
+    try:
+        update_document(db, document_pk, processing_status=status, **fields)
+    except Exception as e:
+        logger.error(f"Failed to update processing status for {document_pk}: {e}")
+    finally:
+        db.close()
+
+def finish_ingestion(document_id: str, digest: str, shared: dict, filename: str, is_guest: bool,
+                     document_pk: Optional[str]) -> dict:
+    """Make processed content queryable under document_id and mark its database row completed"""
+    doc = store_document(document_id, digest, shared, filename, datetime.utcnow(), is_guest_upload=is_guest)
+    index_store.save(document_id, doc)
+    # Partial snapshots' answers aren't cached, but drop any from before a re-ingest all the same
+    answer_cache.invalidate(document_id)
+    logger.info(f"Document stored with ID: {document_id}")
+
+    meta = {
+        "pages": doc["pages"],
+        "chunks": len(doc["chunks"]),
+        "processing_method": doc["extraction"].get("processing_method", "text_extraction"),
+        "pages_text_layer": doc["extraction"].get("pages_text_layer"),
+        "pages_ocr": doc["extraction"].get("pages_ocr"),
+        "is_guest_upload": is_guest,
+        "content_hash": digest
+    }
+    set_processing_status(
+        document_pk,
+        "completed",
+        text_content=doc["chunks"].text[:10000],  # Store first 10k chars for preview
+        text_length=doc["chunks"].text_length,    # Store actual total text length
+        meta=meta
+    )
+    return doc
+
+def fail_ingestion(document_pk: Optional[str], user_id: Optional[str], error: str, credit_deducted: bool = False) -> None:
+    """Mark an upload as failed and give an authenticated user back the credit it took, if it took one"""
+    ERRORS.inc("ingestion")
+    set_processing_status(document_pk, "failed", meta={"error": error})
+    if user_id is None or not credit_deducted:
+        return
+    db = SessionLocal()
+    try:
+        db.query(User).filter(User.id == user_id).update({User.credits: User.credits + 1}, synchronize_session=False)
+        db.commit()
+        user_cache.invalidate(user_id)
+        logger.info(f"Refunded upload credit to user {user_id}")
+    except Exception as e:
+        logger.error(f"Failed to refund credit to user {user_id}: {e}")
+    finally:
+        db.close()
+
+def run_ingestion(job: dict, contents: bytes, digest: str, document_id: str, filename: str, is_guest: bool,
+                  document_pk: Optional[str], user_id: Optional[str], credit_deducted: bool = False) -> None:
+    """Background job: extract, chunk and embed an uploaded PDF"""
+    published = []
+
+    def report(stage: str):
+        # Once partially queryable, stay "partial" until completed rather than showing later stages
+        if published and stage != "partial":
+            return
+        ingest_queue.update(job["id"], progress=stage)
+        set_processing_status(document_pk, stage)
+
+    def publish_partial(partial: dict):
+        # Queryable straight away, but not registered as shared content or persisted until complete
+        doc = {
+            "filename": filename,
+            "vectorstore": partial["vectorstore"],
+            "chunks": partial["chunks"],
+            "keywords": partial["keywords"],
+            "pages": partial["pages_indexed"],
+            "extraction": partial["extraction"],
+            "content_hash": None,
+            "is_demo": False,
+            "created_at": datetime.utcnow(),
+            "is_guest_upload": is_guest,
+            "partial": True
+        }
+        document_stores.put(document_id, doc)
+        report("partial")
+        published.append(partial["pages_indexed"])
+
+    try:
+        # An identical upload may have finished while this one was queued
+        shared = load_shared_content(digest)
+        if shared is None:
+            shared = register_content(digest, process_pdf(contents, on_progress=report, on_partial=publish_partial))
+        finish_ingestion(document_id, digest, shared, filename, is_guest, document_pk)
+    except Exception as e:
+        if published:
+            # Don't leave the partial snapshot, or answers drawn from it, queryable after a failure
+            document_stores.pop(document_id, None)
+            answer_cache.invalidate(document_id)
+        fail_ingestion(document_pk, user_id, str(getattr(e, "detail", e)), credit_deducted)
+        raise
+
+def raise_if_processing(document_id: str) -> None:
+    """Return 409 instead of 404 for documents whose ingestion job hasn't finished yet"""
+    job = ingest_queue.job_for_document(document_id)
+    if job and job["status"] in ("queued", "processing"):
+        raise HTTPException(status_code=409, detail=f"Document is still being processed ({job['progress']})")
+
+CHAT_MODEL = "gpt-4"
+
+SYSTEM_PROMPT = """You are Legal Lens, a specialized AI assistant designed specifically for analyzing legal documents. Your expertise is in legal document analysis, contract review, and legal compliance.
+
+IMPORTANT: You should ONLY provide analysis for legal documents such as:
+- Contracts and agreements
+- Leases and rental agreements
+- Legal notices and correspondence
+- Court documents and filings
+- Legal forms and applications
+- Terms of service and privacy policies
+- Legal memoranda and briefs
+
+If the document is NOT a legal document (e.g., resumes, personal letters, non-legal forms), politely inform the user that Legal Lens is designed specifically for legal document analysis and suggest they upload a legal document instead.
+
+When analyzing legal documents, focus on:
+- Key terms and conditions
+- Legal obligations and rights
+- Potential risks or concerns
+- Compliance requirements
+- Important deadlines or dates
+- Legal implications and consequences
+
+FORMATTING REQUIREMENTS:
+- Use clear, structured responses with proper line breaks
+- Use bullet points (•) for lists and key points
+- Separate different sections with line breaks
+- Use clear headings and subheadings without special formatting
+- Organize information in a logical, easy-to-read format
+- Use numbered lists when appropriate for step-by-step analysis
+- Avoid using asterisks or special markdown symbols
+
+Provide clear, professional legal analysis while being careful not to give legal advice. Always base your responses on the document content provided."""
+
+# Part of every answer cache key, so changing the prompt or model never serves stale answers
+PROMPT_VERSION = hashlib.sha256(f"{CHAT_MODEL}\n{SYSTEM_PROMPT}".encode("utf-8")).hexdigest()[:12]
+
+def build_messages(context: str, question: str) -> list:
+    """Chat messages for answering a question from the retrieved document context"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Document context:\n{context}\n\nQuestion: {question}"}
+    ]
+
+# Vector hits considered per retrieved chunk when fusing with BM25 scores
+HYBRID_CANDIDATES_PER_CHUNK = 4
+
+def hybrid_search(doc: dict, question: str, k: int, embedding: Optional[List[float]] = None) -> List[int]:
+    """Indexes of the k chunks that best match the question on BM25 and vector similarity combined.
+
+    When the keywords alone are decisive (e.g. "Section 12.3", "$250,000") and no embedding
+    is at hand yet, the query embedding API call is skipped altogether.
+    """
+    keywords = doc["keywords"]
+    terms = query_terms(question)
+    started = time.perf_counter()
+    scores = keywords.scores(terms)
+    if embedding is None and keywords.confident(terms, scores):
+        logger.info(f"Keyword fast path for query terms {terms}")
+        chunks = [chunk for chunk, _ in top_chunks(scores, k)]
+        STAGE_SECONDS.observe(time.perf_counter() - started, "similarity_search")
+        return chunks
+    search_seconds = time.perf_counter() - started
+
+    if embedding is None:
+        embedding = doc['vectorstore'].embedding_function.embed_query(question)
+    # The query embedding is a network call, so it's left out of the search time
+    started = time.perf_counter()
+    vector_hits = search_chunks(doc['vectorstore'], embedding, k * HYBRID_CANDIDATES_PER_CHUNK)
+    chunks = [chunk for chunk, _ in fuse(scores, vector_hits, k)]
+    STAGE_SECONDS.observe(search_seconds + time.perf_counter() - started, "similarity_search")
+    return chunks
+
+async def retrieve_context(doc: dict, question: str, k: int = 3, embedding: Optional[List[float]] = None) -> str:
+    """Join the k chunks most relevant to the question into one context string"""
+    try:
+        # Query embedding is a network call and FAISS search is CPU work - keep both off the event loop
+        if doc.get("keywords") is not None:
+            chunks = await run_in_threadpool(hybrid_search, doc, question, k, embedding)
+            texts = [doc["chunks"][i] for i in chunks]
+        elif embedding is not None:
+            with timed("similarity_search"):
+                docs = await run_in_threadpool(doc['vectorstore'].similarity_search_with_score_by_vector, embedding, k=k)
+            texts = [d[0].page_content for d in docs]
+        else:
+            docs = await run_in_threadpool(doc['vectorstore'].similarity_search_with_score, question, k=k)
+            texts = [d[0].page_content for d in docs]
+        logger.info(f"Found {len(texts)} relevant chunks")
+    except ContentFreedError as e:
+        # Evicted or cleaned up mid-query; the next request reloads it
+        logger.warning(f"Document content freed during similarity search: {e}")
+        raise HTTPException(status_code=503, detail="The document was unloaded while being searched. Please try again.")
     except Exception as e:
-        logger.error(f"OCR extraction failed: {e}")
-        raise e
+        logger.error(f"Error during similarity search: {str(e)}")
+        ERRORS.inc("similarity_search")
+        raise HTTPException(status_code=500, detail=f"Error during similarity search: {str(e)}")
+
+    context = "\n\n".join(texts)
+    logger.info(f"Created context of length: {len(context)} characters")
+    return context
+
+# Most documents a single library query searches, and the excerpts passed to the model across them
+LIBRARY_MAX_DOCUMENTS = 50
+LIBRARY_TOP_K = 8
+
+# Largest page of /history/ a request can ask for
+HISTORY_PAGE_MAX = 100
+
+LIBRARY_INSTRUCTIONS = """
+
+The document context below comes from several of the user's documents. Each excerpt starts with a numbered source tag such as [1] followed by the document's file name. Cite the sources each point relies on with their tags, e.g. [1][3], and name the document when comparing documents."""
+
+async def search_library(docs: dict, embedding: List[float], k: int = LIBRARY_TOP_K) -> list:
+    """Top-k (document_id, chunk, score) across documents, searching each distinct content once, concurrently"""
+    by_content = {}
+    for document_id, doc in docs.items():
+        by_content.setdefault(doc.get("content_hash") or document_id, document_id)
+
+    async def search(document_id: str) -> list:
+        with timed("similarity_search"):
+            results = await run_in_threadpool(docs[document_id]['vectorstore'].similarity_search_with_score_by_vector, embedding, k=k)
+        return [(document_id, chunk, score) for chunk, score in results]
+
+    batches = await asyncio.gather(*(search(document_id) for document_id in by_content.values()))
+    # Scores are L2 distances in the same embedding space, so they compare across documents
+    return sorted((result for batch in batches for result in batch), key=lambda result: result[2])[:k]
+
+async def lookup_answer(document_id: str, question: str) -> Tuple[Optional[str], Optional[List[float]]]:
+    """Cached answer for the question - exact match first, then the nearest cached query if the
+    semantic tier is on. Also returns the query embedding computed for that, so retrieval can reuse it.
+    """
+    answer = answer_cache.get(document_id, question, PROMPT_VERSION)
+    if answer is not None or not answer_cache.semantic_enabled:
+        return answer, None
+    try:
+        embedding = await run_in_threadpool(get_embeddings().embed_query, question)
+    except Exception as e:
+        logger.error(f"Failed to embed query for answer cache lookup: {e}")
+        return None, None
+    # The lookup is a matrix product over the document's cached queries; keep it off the event loop
+    return await run_in_threadpool(answer_cache.get_similar, document_id, embedding, PROMPT_VERSION), embedding
+
+async def record_query(document_id: str, query_text: str, response_text: str, response_time_ms: int,
+                       time_to_first_token_ms: Optional[int] = None, cache_hit: bool = False) -> None:
+    """Save a query: handed to the write-behind buffer, or (when that's off or full) written with
+    its own session, since streamed responses outlive the request-scoped one"""
+    if query_writer is not None and query_writer.submit(document_id, query_text, response_text, response_time_ms,
+                                                        time_to_first_token_ms=time_to_first_token_ms,
+                                                        cache_hit=cache_hit):
+        return
+    async with AsyncSessionLocal() as db:
+        await db.run_sync(
+            save_query,
+            document_id=document_id,
+            query_text=query_text,
+            response_text=response_text,
+            response_time_ms=response_time_ms,
+            time_to_first_token_ms=time_to_first_token_ms,
+            cache_hit=cache_hit
+        )
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Format one Server-Sent Events message"""
+    message = f"data: {json.dumps(data)}\n\n"
+    return f"event: {event}\n{message}" if event else message
 
 class Query(BaseModel):
     query: str = Field(..., max_length=500, min_length=1, description="Query text (max 500 characters)")
 
+class LibraryQuery(BaseModel):
+    query: str = Field(..., max_length=500, min_length=1, description="Query text (max 500 characters)")
+    document_ids: Optional[List[str]] = Field(None, description="Documents to search; omit for all of the user's documents")
+
 class HistoryResponse(BaseModel):
     documents: list
     total_documents: int
     total_size_bytes: int
 
+def verify_token(id_token: str) -> dict:
+    """Claims of a Firebase ID token - verified once, then served from the cache until it expires"""
+    claims = token_cache.get_claims(id_token)
+    if claims is None:
+        claims = firebase_auth.verify_id_token(id_token)
+        token_cache.put_claims(id_token, claims)
+    return claims
+
+async def verify_token_async(id_token: str) -> dict:
+    """verify_token for async dependencies: only a cache miss (which may fetch Google's signing keys)
+    goes to the threadpool"""
+    claims = token_cache.get_claims(id_token)
+    if claims is None:
+        claims = await run_in_threadpool(firebase_auth.verify_id_token, id_token)
+        token_cache.put_claims(id_token, claims)
+    return claims
+
+def resolve_user(claims: dict, db: Session) -> User:
+    """Cached (or loaded, or newly created) user for verified token claims, recording the login
+    at most once per LAST_LOGIN_UPDATE_SECONDS"""
+    firebase_uid = claims["uid"]
+    user = user_cache.get_user(firebase_uid)
+    if user is None:
+        user = get_user_by_firebase_uid(db, firebase_uid)
+        if not user:
+            user = User(firebase_uid=firebase_uid, email=claims.get("email"), credits=5)  # 5 credits for registered users
+            db.add(user)
+            db.commit()
+            db.refresh(user)
+        # Detached, so the cached row can be shared across requests and sessions
+        db.expunge(user)
+        user_cache.put_user(user)
+    now = datetime.utcnow()
+    if user_cache.touch_login(user, now):
+        touch_last_login(db, user.id, now)
+    return user
+
 def get_current_user(authorization: str = Header(...), db=Depends(get_db)):
     """Get current authenticated user (required)"""
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
     id_token = authorization.split(" ", 1)[1]
     try:
-        decoded_token = firebase_auth.verify_id_token(id_token)
-        firebase_uid = decoded_token["uid"]
-        email = decoded_token.get("email")
+        claims = verify_token(id_token)
     except Exception as e:
         raise HTTPException(status_code=401, detail="Invalid Firebase ID token")
-    # Get or create user in DB
-    user = get_user_by_firebase_uid(db, firebase_uid)
-    if not user:
-        user = User(firebase_uid=firebase_uid, email=email, credits=5)  # 5 credits for registered users
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-    else:
-        user.last_login = datetime.utcnow()
-        db.commit()
-    return user
+    return resolve_user(claims, db)
 
 def get_optional_user(authorization: Optional[str] = Header(None), db: Session = Depends(get_db)) -> Optional[User]:
     """Get current user if authenticated, None otherwise (for optional auth endpoints)"""
@@ -301,25 +734,34 @@ def get_optional_user(authorization: Optional[str] = Header(None), db: Session =
         return None
     try:
         id_token = authorization.split(" ", 1)[1]
-        decoded_token = firebase_auth.verify_id_token(id_token)
-        firebase_uid = decoded_token["uid"]
-        email = decoded_token.get("email")
+        return resolve_user(verify_token(id_token), db)
+    except Exception as e:
+        logger.warning(f"Failed to authenticate user: {e}")
+        return None
 
-        user = get_user_by_firebase_uid(db, firebase_uid)
-        if not user:
-            user = User(firebase_uid=firebase_uid, email=email, credits=5)  # 5 credits for registered users
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-        else:
-            user.last_login = datetime.utcnow()
-            db.commit()
-        return user
+async def get_current_user_async(authorization: str = Header(...), db: AsyncSession = Depends(get_async_db)) -> User:
+    """get_current_user on the async engine, for the hot endpoints"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
+    try:
+        claims = await verify_token_async(authorization.split(" ", 1)[1])
+    except Exception as e:
+        raise HTTPException(status_code=401, detail="Invalid Firebase ID token")
+    return await db.run_sync(lambda session: resolve_user(claims, session))
+
+async def get_optional_user_async(authorization: Optional[str] = Header(None),
+                                  db: AsyncSession = Depends(get_async_db)) -> Optional[User]:
+    """get_optional_user on the async engine, for the hot endpoints"""
+    if not authorization or not authorization.startswith("Bearer "):
+        return None
+    try:
+        claims = await verify_token_async(authorization.split(" ", 1)[1])
+        return await db.run_sync(lambda session: resolve_user(claims, session))
     except Exception as e:
         logger.warning(f"Failed to authenticate user: {e}")
         return None
 
-@app.post("/upload/")
+@app.post("/upload/", status_code=202)
 async def upload_file(
     request: Request,
     file: UploadFile = File(...),
@@ -338,7 +780,7 @@ async def upload_file(
         logger.info(f"Guest upload from IP: {client_ip}")
 
         # Atomically check and record upload - prevents race conditions
-        if not record_guest_upload_atomic(db, client_ip, document_id):
+        if not await run_in_threadpool(record_guest_upload_atomic, db, client_ip, document_id):
             raise HTTPException(
                 status_code=429,
                 detail="Daily upload limit reached for guest users. Please sign in to get more credits."
@@ -372,136 +814,113 @@ async def upload_file(
         logger.info(f"File content type: {type(contents)}")
         logger.info(f"First 100 bytes: {contents[:100]}")
         
-        pdf_file = BytesIO(contents)
-        logger.info(f"BytesIO created, size: {pdf_file.getbuffer().nbytes}")
-        
-        reader = PdfReader(pdf_file)
-        logger.info(f"PDF loaded successfully, pages: {len(reader.pages)}")
-        
-        # Check if PDF is encrypted
-        if reader.is_encrypted:
-            logger.warning("PDF is encrypted, attempting to decrypt...")
-            try:
-                reader.decrypt('')  # Try empty password
-                logger.info("PDF decrypted successfully")
-            except Exception as e:
-                logger.error(f"Failed to decrypt PDF: {e}")
-                raise HTTPException(status_code=400, detail="PDF is encrypted and cannot be processed")
-        
-        text = ""
-        for i, page in enumerate(reader.pages):
-            try:
-                page_text = page.extract_text()
-                logger.info(f"Page {i+1} extracted text length: {len(page_text)} characters")
-                if len(page_text) > 0:
-                    logger.info(f"Page {i+1} first 50 chars: {page_text[:50]}")
-                text += page_text
-            except Exception as e:
-                logger.warning(f"Error extracting text from page {i+1}: {str(e)}")
-                continue
-        
-        logger.info(f"Total extracted text length: {len(text)} characters")
-
-        if not text.strip():
-            # Try OCR for scanned PDFs
-            logger.info("No text extracted, attempting OCR for scanned PDF...")
-            try:
-                text = extract_text_with_ocr(contents)
-                if not text.strip():
-                    raise HTTPException(status_code=400, detail="No text could be extracted from the PDF using OCR. The file might be corrupted or contain unreadable images.")
-                logger.info(f"OCR successful, extracted {len(text)} characters")
-            except Exception as e:
-                logger.error(f"OCR extraction failed: {e}")
-                raise HTTPException(status_code=400, detail=f"Failed to extract text from scanned PDF: {str(e)}")
-
-        # Split text into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len
-        )
-        chunks = text_splitter.split_text(text)
-        logger.info(f"Created {len(chunks)} text chunks")
+        # Blocking work (hashing, DB writes, disk loads) runs in the threadpool to keep the event loop free
+        digest = await run_in_threadpool(content_hash, contents)
+        filename = file.filename
+        user_id = user.id if user else None
 
-        if not chunks:
-            raise HTTPException(status_code=400, detail="Failed to create text chunks from the document.")
-
-        # Create embeddings and store them
-        embeddings = OpenAIEmbeddings()
-        vectorstore = FAISS.from_texts(chunks, embeddings)
-        logger.info("Created embeddings and vector store")
-        
-        # Use the pre-generated document_id (for guests, already recorded atomically)
-        document_stores[document_id] = {
-            "filename": file.filename,
-            "vectorstore": vectorstore,
-            "chunks": chunks,
-            "text": text,
-            "created_at": datetime.utcnow(),  # Track creation time for cleanup
-            "is_guest_upload": is_guest  # Track if guest upload (24h TTL vs 7d for users)
-        }
-        logger.info(f"Document stored with ID: {document_id}")
-
-        # Save to database
+        # Save the document row up front so ingestion progress can be tracked on it
         try:
-            meta = {
-                "pages": len(reader.pages),
-                "chunks": len(chunks),
-                "processing_method": "ocr" if not text.strip() else "text_extraction",
-                "is_guest_upload": is_guest
-            }
-
-            db_document = save_document(
+            db_document = await run_in_threadpool(
+                save_document,
                 db=db,
                 filename=document_id,
                 original_filename=file.filename,
                 file_size=len(contents),
-                text_content=text[:10000],  # Store first 10k chars for preview
-                text_length=len(text),      # Store actual total text length
-                user_id=user.id if user else None,
-                meta=meta
+                user_id=user_id,
+                meta={"is_guest_upload": is_guest, "content_hash": digest},
+                processing_status="queued"
             )
+            document_pk = db_document.id
             logger.info(f"Document saved to database with ID: {db_document.id}")
         except Exception as e:
             logger.error(f"Failed to save to database: {e}")
             # Continue without database save for now
+            document_pk = None
 
         # Handle credit deduction for authenticated users (guest upload already recorded atomically)
+        # The credit is refunded if ingestion fails
+        credits_remaining = user.credits if user else None
+        credit_deducted = False
         if not is_guest:
-            # Deduct credit for authenticated users
-            if user.credits > 0:
-                user.credits -= 1
-                db.commit()
-                logger.info(f"User {user.email} credits remaining: {user.credits}")
+            # Deduct credit for authenticated users - an atomic update, as the cached user row is read-only
+            credit_deducted = await run_in_threadpool(deduct_credit, db, user.id)
+            user_cache.invalidate(user.id)
+            if not credit_deducted:
+                # A concurrent upload spent the last credit after the check above
+                if document_pk is not None:
+                    await run_in_threadpool(delete_document, db, document_pk)
+                raise HTTPException(
+                    status_code=403,
+                    detail="Insufficient credits. You have used all your upload credits."
+                )
+            credits_remaining -= 1
+            logger.info(f"User {user.email} credits remaining: {credits_remaining}")
+
+        # Byte-identical PDFs reuse the already extracted text, chunks and index - no need to queue
+        shared = await run_in_threadpool(load_shared_content, digest)
+        if shared is not None:
+            logger.info(f"Duplicate upload detected (hash {digest[:12]}), reusing existing index")
+            await run_in_threadpool(finish_ingestion, document_id, digest, shared, filename, is_guest, document_pk)
+            job = ingest_queue.record(document_id)
+            UPLOADS.inc("guest" if is_guest else "user", "duplicate")
+        else:
+            try:
+                job = ingest_queue.submit(
+                    lambda job: run_ingestion(job, contents, digest, document_id, filename, is_guest, document_pk, user_id,
+                                              credit_deducted),
+                    priority=PRIORITY_GUEST if is_guest else PRIORITY_USER,
+                    document_id=document_id,
+                    on_cancel=lambda job: fail_ingestion(document_pk, user_id, job["error"], credit_deducted)
+                )
+            except QueueFullError as e:
+                logger.warning(f"Rejecting upload: {e}")
+                UPLOADS.inc("guest" if is_guest else "user", "rejected")
+                await run_in_threadpool(fail_ingestion, document_pk, user_id, str(e), credit_deducted)
+                if is_guest:
+                    # Nothing was processed, so the rejected upload doesn't use up the guest's daily quota
+                    await run_in_threadpool(release_guest_upload, db, document_id)
+                raise HTTPException(
+                    status_code=503,
+                    detail="The server is busy processing other documents. Please try again in a few minutes."
+                )
+            logger.info(f"Queued ingestion job {job['id']} for document {document_id} ({job['lane']} lane)")
+            UPLOADS.inc("guest" if is_guest else "user", "queued")
 
         return {
+            "job_id": job["id"],
             "document_id": document_id,
+            "status": job["status"],
             "is_guest": is_guest,
-            "credits_remaining": user.credits if user else None
+            "credits_remaining": credits_remaining
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing file: {str(e)}")
+        ERRORS.inc("upload")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/query/{document_id}")
 async def query_document(
     document_id: str,
     query: Query,
-    db: Session = Depends(get_db),
-    user: Optional[User] = Depends(get_optional_user)
+    user: Optional[User] = Depends(get_optional_user_async)
 ):
     logger.info(f"Querying document {document_id} with query: {query.dict()}")
     is_guest = user is None
     
-    if document_id not in document_stores:
+    doc = await run_in_threadpool(get_document_store, document_id)
+    if doc is None:
+        raise_if_processing(document_id)
         logger.error(f"Document ID {document_id} not found in document_stores. Available IDs: {list(document_stores.keys())}")
         raise HTTPException(status_code=404, detail="Document not found")
         
+    QUERIES.inc("query")
     start_time = time.time()
     
     try:
-        doc = document_stores[document_id]
         logger.info(f"Found document: {doc['filename']}")
         
         if not client.api_key:
@@ -509,83 +928,43 @@ async def query_document(
             raise HTTPException(status_code=500, detail="OpenAI API key not configured")
         
         logger.info("Sending request to OpenAI...")
-        logger.info(f"Document text length: {len(doc['text'])} characters")
+        logger.info(f"Document text length: {doc['chunks'].text_length} characters")
         logger.info(f"Query: {query.query}")
+
+        cached, embedding = await lookup_answer(document_id, query.query)
+        if cached is not None:
+            logger.info("Answer cache hit")
+            try:
+                await record_query(document_id, query.query, cached, int((time.time() - start_time) * 1000), cache_hit=True)
+            except Exception as e:
+                logger.error(f"Failed to save query to database: {e}")
+            return {"answer": cached}
             
-        # Get relevant chunks using vector similarity search
-        try:
-            docs = doc['vectorstore'].similarity_search_with_score(query.query, k=3)
-            logger.info(f"Found {len(docs)} relevant chunks")
-        except Exception as e:
-            logger.error(f"Error during similarity search: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error during similarity search: {str(e)}")
-        
-        # Use the chunks as context for GPT
-        try:
-            context = "\n\n".join([d[0].page_content for d in docs])
-            logger.info(f"Created context of length: {len(context)} characters")
-        except Exception as e:
-            logger.error(f"Error creating context from chunks: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error creating context: {str(e)}")
+        context = await retrieve_context(doc, query.query, embedding=embedding)
         
         try:
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": """You are Legal Lens, a specialized AI assistant designed specifically for analyzing legal documents. Your expertise is in legal document analysis, contract review, and legal compliance.
-
-IMPORTANT: You should ONLY provide analysis for legal documents such as:
-- Contracts and agreements
-- Leases and rental agreements
-- Legal notices and correspondence
-- Court documents and filings
-- Legal forms and applications
-- Terms of service and privacy policies
-- Legal memoranda and briefs
-
-If the document is NOT a legal document (e.g., resumes, personal letters, non-legal forms), politely inform the user that Legal Lens is designed specifically for legal document analysis and suggest they upload a legal document instead.
-
-When analyzing legal documents, focus on:
-- Key terms and conditions
-- Legal obligations and rights
-- Potential risks or concerns
-- Compliance requirements
-- Important deadlines or dates
-- Legal implications and consequences
-
-FORMATTING REQUIREMENTS:
-- Use clear, structured responses with proper line breaks
-- Use bullet points (•) for lists and key points
-- Separate different sections with line breaks
-- Use clear headings and subheadings without special formatting
-- Organize information in a logical, easy-to-read format
-- Use numbered lists when appropriate for step-by-step analysis
-- Avoid using asterisks or special markdown symbols
-
-Provide clear, professional legal analysis while being careful not to give legal advice. Always base your responses on the document content provided."""},
-                    {"role": "user", "content": f"Document context:\n{context}\n\nQuestion: {query.query}"}
-                ],
-                temperature=0.0,
-            )
+            with timed("llm_call"):
+                response = await client.chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=build_messages(context, query.query),
+                    temperature=0.0,
+                )
             
             if not response.choices:
                 raise HTTPException(status_code=500, detail="No response generated from OpenAI")
                 
             answer = response.choices[0].message.content.strip()
             logger.info("Successfully generated response")
+            # Answers from a partial snapshot may miss later pages, so only complete documents' are cached
+            if answer and not doc.get("partial"):
+                answer_cache.put(document_id, query.query, PROMPT_VERSION, answer, embedding)
             
             # Calculate response time
             response_time_ms = int((time.time() - start_time) * 1000)
             
             # Save query to database
             try:
-                save_query(
-                    db=db,
-                    document_id=document_id,
-                    query_text=query.query,
-                    response_text=answer,
-                    response_time_ms=response_time_ms
-                )
+                await record_query(document_id, query.query, answer, response_time_ms)
                 logger.info("Query saved to database")
             except Exception as e:
                 logger.error(f"Failed to save query to database: {e}")
@@ -600,37 +979,222 @@ Provide clear, professional legal analysis while being careful not to give legal
         logger.error(f"Error processing query: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+async def cached_answer_events(document_id: str, question: str, answer: str, start_time: float):
+    """SSE events for an answer served from the cache: the whole answer as one token, then a "done" event"""
+    response_time_ms = int((time.time() - start_time) * 1000)
+    logger.info("Answer cache hit")
+    yield sse_event({"token": answer})
+    try:
+        await record_query(document_id, question, answer, response_time_ms, response_time_ms, True)
+    except Exception as e:
+        logger.error(f"Failed to save query to database: {e}")
+    yield sse_event({
+        "answer": answer,
+        "response_time_ms": response_time_ms,
+        "time_to_first_token_ms": response_time_ms,
+        "cache_hit": True
+    }, event="done")
+
+@app.post("/query/{document_id}/stream")
+async def query_document_stream(
+    document_id: str,
+    query: Query,
+    user: Optional[User] = Depends(get_optional_user_async)
+):
+    """Answer a query as Server-Sent Events: a "data" message per token, then a "done" event with the full answer"""
+    logger.info(f"Streaming query for document {document_id}: {query.dict()}")
+
+    doc = await run_in_threadpool(get_document_store, document_id)
+    if doc is None:
+        raise_if_processing(document_id)
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    QUERIES.inc("stream")
+    start_time = time.time()
+    cached, embedding = await lookup_answer(document_id, query.query)
+    if cached is not None:
+        return StreamingResponse(
+            cached_answer_events(document_id, query.query, cached, start_time),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    context = await retrieve_context(doc, query.query, embedding=embedding)
+
+    # Open the stream before responding so connection and auth errors still surface as a 500
+    llm_started = time.perf_counter()
+    try:
+        stream = await client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=build_messages(context, query.query),
+            temperature=0.0,
+            stream=True,
+        )
+    except Exception as e:
+        logger.error(f"OpenAI API error: {str(e)}")
+        ERRORS.inc("llm_call")
+        raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
+
+    async def events():
+        tokens = []
+        time_to_first_token_ms = None
+        try:
+            async for chunk in stream:
+                token = chunk.choices[0].delta.content if chunk.choices else None
+                if not token:
+                    continue
+                if time_to_first_token_ms is None:
+                    time_to_first_token_ms = int((time.time() - start_time) * 1000)
+                tokens.append(token)
+                yield sse_event({"token": token})
+        except Exception as e:
+            logger.error(f"OpenAI stream error: {str(e)}")
+            ERRORS.inc("llm_call")
+            yield sse_event({"detail": f"OpenAI API error: {str(e)}"}, event="error")
+            return
+
+        # The whole stream, from opening it to the last token
+        STAGE_SECONDS.observe(time.perf_counter() - llm_started, "llm_call")
+        answer = "".join(tokens).strip()
+        response_time_ms = int((time.time() - start_time) * 1000)
+        logger.info(f"Streamed response: first token {time_to_first_token_ms} ms, total {response_time_ms} ms")
+        if answer and not doc.get("partial"):
+            answer_cache.put(document_id, query.query, PROMPT_VERSION, answer, embedding)
+
+        try:
+            await record_query(document_id, query.query, answer, response_time_ms, time_to_first_token_ms)
+        except Exception as e:
+            logger.error(f"Failed to save query to database: {e}")
+
+        yield sse_event({
+            "answer": answer,
+            "response_time_ms": response_time_ms,
+            "time_to_first_token_ms": time_to_first_token_ms,
+            "cache_hit": False
+        }, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Stop proxies (nginx) from buffering the stream into one response
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/library/query")
+async def query_library(
+    query: LibraryQuery,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user)
+):
+    """Answer one question across several of the user's documents (or all of them), citing sources"""
+    logger.info(f"Library query from user {user.id}: {query.query}")
+    start_time = time.time()
+    if query.document_ids and len(query.document_ids) > LIBRARY_MAX_DOCUMENTS:
+        raise HTTPException(status_code=400, detail=f"At most {LIBRARY_MAX_DOCUMENTS} documents can be searched at once")
+
+    document_ids = await run_in_threadpool(get_user_document_ids, db, user.id, query.document_ids, LIBRARY_MAX_DOCUMENTS)
+    if query.document_ids and DEMO_DOCUMENT_ID in query.document_ids:
+        document_ids.append(DEMO_DOCUMENT_ID)
+    if not document_ids:
+        raise HTTPException(status_code=404, detail="No documents found to search")
+    QUERIES.inc("library")
+
+    # Load documents and embed the query concurrently - the query is embedded once for every document
+    loaded, embedding = await asyncio.gather(
+        asyncio.gather(*(run_in_threadpool(get_document_store, document_id) for document_id in document_ids)),
+        run_in_threadpool(get_embeddings().embed_query, query.query)
+    )
+    docs = {document_id: doc for document_id, doc in zip(document_ids, loaded) if doc is not None}
+    missing = [document_id for document_id, doc in zip(document_ids, loaded) if doc is None]
+    if not docs:
+        raise HTTPException(status_code=404, detail="None of the documents are available")
+
+    try:
+        results = await search_library(docs, embedding)
+    except Exception as e:
+        logger.error(f"Error during library search: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error during similarity search: {str(e)}")
+    logger.info(f"Library search over {len(docs)} documents returned {len(results)} chunks")
+
+    context = "\n\n".join(
+        f"[{i}] {docs[document_id]['filename']}\n{chunk.page_content}"
+        for i, (document_id, chunk, _) in enumerate(results, start=1)
+    )
+    messages = build_messages(context, query.query)
+    messages[0]["content"] += LIBRARY_INSTRUCTIONS
+
+    try:
+        with timed("llm_call"):
+            response = await client.chat.completions.create(model=CHAT_MODEL, messages=messages, temperature=0.0)
+        if not response.choices:
+            raise HTTPException(status_code=500, detail="No response generated from OpenAI")
+        answer = response.choices[0].message.content.strip()
+    except Exception as e:
+        logger.error(f"OpenAI API error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
+
+    response_time_ms = int((time.time() - start_time) * 1000)
+    logger.info(f"Library query answered in {response_time_ms} ms")
+    return {
+        "answer": answer,
+        "sources": [
+            {
+                "citation": i,
+                "document_id": document_id,
+                "filename": docs[document_id]["filename"],
+                "score": float(score),
+                "excerpt": chunk.page_content
+            }
+            for i, (document_id, chunk, score) in enumerate(results, start=1)
+        ],
+        "documents_searched": len(docs),
+        "missing_documents": missing,
+        "response_time_ms": response_time_ms
+    }
+
 @app.get("/history/")
-async def get_history(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    """Get document upload history"""
+async def get_history(limit: int = 50, cursor: Optional[str] = None, db: AsyncSession = Depends(get_async_db),
+                      user: User = Depends(get_current_user_async)):
+    """Get the user's document upload history, newest first, a page at a time: pass next_cursor back as
+    cursor for the next page. The summary comes with the first page only"""
+    if not 1 <= limit <= HISTORY_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {HISTORY_PAGE_MAX}")
     try:
-        documents = get_document_history(db)
-        summary = get_user_activity_summary(db)
-        
+        rows, next_cursor = await db.run_sync(get_document_history, user.id, limit, cursor)
+        documents = [
+            {
+                "id": row.id,
+                "filename": row.original_filename,
+                "upload_date": row.upload_date.isoformat(),
+                "file_size": row.file_size,
+                "text_length": row.text_length,
+                "processing_status": row.processing_status,
+                "meta": row.meta
+            }
+            for row in rows
+        ]
+        summary = None
+        if cursor is None:
+            summary = await db.run_sync(get_user_activity_summary, user.id)
+            summary["recent_documents"] = documents[:5]
+
         return {
-            "documents": [
-                {
-                    "id": doc.id,
-                    "filename": doc.original_filename,
-                    "upload_date": doc.upload_date.isoformat(),
-                    "file_size": doc.file_size,
-                    "text_length": doc.text_length,
-                    "processing_status": doc.processing_status,
-                    "meta": doc.meta
-                }
-                for doc in documents
-            ],
-            "summary": summary
+            "documents": documents,
+            "summary": summary,
+            "next_cursor": next_cursor
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting history: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/history/{document_id}/queries")
-async def get_document_queries_history(document_id: str, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+async def get_document_queries_history(document_id: str, db: AsyncSession = Depends(get_async_db),
+                                       user: User = Depends(get_current_user_async)):
     """Get query history for a specific document"""
     try:
-        queries = get_document_queries(db, document_id)
+        queries = await db.run_sync(get_document_queries, document_id)
         
         return {
             "queries": [
@@ -649,7 +1213,7 @@ async def get_document_queries_history(document_id: str, db: Session = Depends(g
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/me")
-async def get_me(user: User = Depends(get_current_user)):
+async def get_me(user: User = Depends(get_current_user_async)):
     response = {
         "id": user.id,
         "firebase_uid": user.firebase_uid,
@@ -664,8 +1228,8 @@ async def get_me(user: User = Depends(get_current_user)):
 @app.get("/demo")
 async def get_demo_document():
     """Get demo document information"""
-    if DEMO_DOCUMENT_ID in document_stores:
-        demo_doc = document_stores[DEMO_DOCUMENT_ID]
+    demo_doc = await run_in_threadpool(get_document_store, DEMO_DOCUMENT_ID)
+    if demo_doc is not None:
         return {
             "document_id": DEMO_DOCUMENT_ID,
             "filename": demo_doc["filename"],
@@ -682,15 +1246,17 @@ async def get_demo_document():
 @app.get("/document/{document_id}")
 async def get_document_info(document_id: str):
     """Get document information (works with or without authentication)"""
-    if document_id not in document_stores:
+    doc = await run_in_threadpool(get_document_store, document_id)
+    if doc is None:
+        raise_if_processing(document_id)
         raise HTTPException(status_code=404, detail="Document not found")
 
-    doc = document_stores[document_id]
     return {
         "document_id": document_id,
         "filename": doc["filename"],
         "chunks": len(doc.get("chunks", [])),
-        "text_length": len(doc.get("text", "")),
+        "text_length": doc["chunks"].text_length,
+        "partial": doc.get("partial", False),  # Still ingesting - only the first pages are searchable
         "is_demo": doc.get("is_demo", False),
         "can_view": doc.get("is_demo", False)  # Only demo documents can be viewed/downloaded
     }
@@ -716,6 +1282,36 @@ async def view_document(document_id: str):
         }
     )
 
+@app.get("/jobs/stats")
+async def get_job_stats():
+    """Ingestion queue depth, busy workers and wait times, for sizing the worker pool"""
+    return ingest_queue.stats()
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Get the status of a background ingestion job"""
+    job = ingest_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Answer cache, embedding cache, in-memory document registry and auth cache hit rates, embedding throughput and shared index usage"""
+    return {
+        "answers": answer_cache.stats(),
+        "embeddings": {**cache_stats.as_dict(), "provider": get_embedding_provider().describe(),
+                       "throughput": embedding_stats.as_dict()},
+        "documents": document_stores.stats(),
+        "auth": {"tokens": token_cache.stats(), "users": user_cache.stats()},
+        "vector_index": shared_vector_index.stats() if shared_vector_index else None
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Stage latency histograms, upload/query/error counters and cache and memory gauges in Prometheus text format"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint for Docker"""
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -29,13 +29,19 @@ class Document(Base):
     document_type = Column(String, nullable=True)  # lease, contract, etc.
     text_content = Column(Text, nullable=True)  # Extracted text
     text_length = Column(Integer, nullable=True)
-    processing_status = Column(String, default="completed")  # processing, completed, failed
+    processing_status = Column(String, default="completed")  # queued, extracting, ocr, embedding, partial, completed, failed
     meta = Column(JSON, nullable=True)  # Additional info like page count, etc.
     
     # Relationships
     queries = relationship("DocumentQuery", back_populates="document", cascade="all, delete-orphan")
     user = relationship("User", back_populates="documents")
 
+    # A user's history newest first, paged by (upload_date, id) - each page is one index range scan -
+    # with file_size on the end so the history summary (count and total size) never reads the table
+    __table_args__ = (
+        Index("idx_documents_user_upload_date_id", "user_id", "upload_date", "id", "file_size"),
+    )
+
 class DocumentQuery(Base):
     __tablename__ = "document_queries"
     
@@ -45,6 +51,8 @@ class DocumentQuery(Base):
     response_text = Column(Text, nullable=False)
     query_date = Column(DateTime, default=datetime.utcnow)
     response_time_ms = Column(Integer, nullable=True)  # For performance tracking
+    time_to_first_token_ms = Column(Integer, nullable=True)  # Streaming queries only
+    cache_hit = Column(Boolean, nullable=True, default=False)  # Answer served from the answer cache
     user_id = Column(String, nullable=True)
     
     # Relationships
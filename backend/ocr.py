@@ -0,0 +1,164 @@
+import logging
+import os
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pytesseract
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+from executors import process_pool, CPU_WORKERS
+from metrics import ERRORS, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DPI = int(os.getenv("IMAGE_DPI", "300"))
+TESSERACT_LANG = os.getenv("TESSERACT_LANG", "eng")
+
+# Pages rendered per task - peak memory is roughly OCR_WORKERS x OCR_WINDOW_PAGES page images
+OCR_WINDOW_PAGES = int(os.getenv("OCR_WINDOW_PAGES", "2"))
+# Windows OCR'd in parallel on the shared CPU process pool; 1 runs OCR inline
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(max(1, CPU_WORKERS))))
+
+
+def _ocr_window(pdf_path: str, first_page: int, last_page: int, dpi: int,
+                lang: str) -> List[Tuple[int, str, Optional[str], float]]:
+    """Render one window of pages and OCR them; returns (page_number, text, error, seconds) per page,
+    where seconds is the page's share of rendering plus its own OCR time"""
+    results = []
+    started = time.perf_counter()
+    try:
+        images = convert_from_path(pdf_path, dpi=dpi, first_page=first_page, last_page=last_page)
+    except Exception as e:
+        return [(page, "", str(e), 0.0) for page in range(first_page, last_page + 1)]
+    render_seconds = (time.perf_counter() - started) / max(1, len(images))
+
+    for offset, image in enumerate(images):
+        page = first_page + offset
+        started = time.perf_counter()
+        try:
+            results.append((page, pytesseract.image_to_string(image, lang=lang), None,
+                            render_seconds + time.perf_counter() - started))
+        except Exception as e:
+            results.append((page, "", str(e), 0.0))
+        finally:
+            image.close()
+    return results
+
+
+def _windows(page_numbers: Iterable[int], size: int) -> List[Tuple[int, int]]:
+    """Group sorted page numbers into runs of consecutive pages no longer than size"""
+    windows = []
+    for page in sorted(set(page_numbers)):
+        if windows and page == windows[-1][1] + 1 and page - windows[-1][0] < size:
+            windows[-1] = (windows[-1][0], page)
+        else:
+            windows.append((page, page))
+    return windows
+
+
+class OcrQueue:
+    """OCRs windows of scanned pages of one PDF file on the shared process pool.
+
+    Pages can be added while earlier windows are still running, so OCR for one stretch of a
+    document overlaps with reading the next. At most two windows per worker are in flight;
+    the rest wait in the queue, so memory is bounded by the window size rather than the page
+    count. With one worker, windows are OCR'd inline as their text is asked for. Not
+    thread-safe: use one queue per document, from one thread.
+    """
+
+    def __init__(self, pdf_path: str, workers: int = OCR_WORKERS, window: int = OCR_WINDOW_PAGES):
+        self.pdf_path = pdf_path
+        self.workers = workers
+        self.window = max(1, window)
+        self.max_in_flight = max(1, workers) * 2
+        self._queued = deque()
+        self._running = {}  # future -> (first_page, last_page)
+        self._texts = {}
+
+    def add(self, page_numbers: Iterable[int]) -> None:
+        """Queue 1-based pages to be OCR'd"""
+        windows = _windows(page_numbers, self.window)
+        logger.info(f"OCR: {sum(last - first + 1 for first, last in windows)} pages in {len(windows)} windows on {self.workers} workers")
+        self._queued.extend(windows)
+        self._submit()
+
+    def full(self) -> bool:
+        """Whether as many windows are waiting as are kept in flight"""
+        return len(self._queued) + len(self._running) >= self.max_in_flight
+
+    def ready(self, page_numbers: Iterable[int]) -> bool:
+        """Whether these pages are done, without waiting"""
+        done = [future for future in self._running if future.done()]
+        self._collect(done)
+        self._submit()
+        return all(page in self._texts for page in page_numbers)
+
+    def texts(self, page_numbers: Iterable[int]) -> Dict[int, str]:
+        """Wait for the given pages (which must have been added) and return {page_number: text}"""
+        wanted = set(page_numbers)
+        while not wanted.issubset(self._texts):
+            if self.workers <= 1:
+                first, last = self._queued.popleft()
+                self._record(_ocr_window(self.pdf_path, first, last, IMAGE_DPI, TESSERACT_LANG))
+            else:
+                self._submit()
+                done, _ = wait(self._running, return_when=FIRST_COMPLETED)
+                self._collect(done)
+        return {page: self._texts.pop(page) for page in sorted(wanted)}
+
+    def close(self) -> None:
+        """Drop queued windows and cancel any not yet started"""
+        self._queued.clear()
+        for future in self._running:
+            future.cancel()
+        self._running.clear()
+
+    def _submit(self) -> None:
+        if self.workers <= 1:
+            return
+        pool = process_pool()
+        while self._queued and len(self._running) < self.max_in_flight:
+            first, last = self._queued.popleft()
+            self._running[pool.submit(_ocr_window, self.pdf_path, first, last, IMAGE_DPI, TESSERACT_LANG)] = (first, last)
+
+    def _collect(self, done) -> None:
+        for future in done:
+            first, last = self._running.pop(future)
+            try:
+                results = future.result()
+            except Exception as e:
+                results = [(page, "", str(e), 0.0) for page in range(first, last + 1)]
+            self._record(results)
+
+    def _record(self, results: List[Tuple[int, str, Optional[str], float]]) -> None:
+        for page, text, error, seconds in results:
+            if error:
+                logger.warning(f"OCR failed for page {page}: {error}")
+                ERRORS.inc("ocr_page")
+            else:
+                logger.info(f"OCR Page {page}: {len(text)} characters")
+                # Timed inside the worker process, where the OCR runs
+                STAGE_SECONDS.observe(seconds, "ocr_page")
+            self._texts[page] = text
+
+
+def ocr_pages(pdf_bytes: bytes, page_numbers: Optional[Iterable[int]] = None, workers: int = OCR_WORKERS,
+              window: int = OCR_WINDOW_PAGES) -> Dict[int, str]:
+    """OCR the given 1-based pages (all pages by default) of an in-memory PDF; returns {page_number: text}"""
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(pdf_bytes)
+        pdf_path = f.name
+
+    queue = OcrQueue(pdf_path, workers, window)
+    try:
+        if page_numbers is None:
+            page_numbers = range(1, pdfinfo_from_path(pdf_path)["Pages"] + 1)
+        page_numbers = list(page_numbers)
+        queue.add(page_numbers)
+        return queue.texts(page_numbers)
+    finally:
+        queue.close()
+        os.remove(pdf_path)
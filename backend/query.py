@@ -1,3 +1,4 @@
+import os
 import sys
 from typing import Dict, Any
 from langchain_openai import ChatOpenAI
@@ -27,7 +28,8 @@ def create_qa_chain(vector_store) -> RetrievalQA:
     # Initialize language model
     llm = ChatOpenAI(
         model_name="gpt-3.5-turbo",
-        temperature=0
+        temperature=0,
+        base_url=os.getenv("OPENAI_BASE_URL") or None
     )
     
     # Create and return the QA chain
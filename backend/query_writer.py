@@ -0,0 +1,168 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from db_services import save_queries
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Buffer query history rows and insert them in batches on a background thread, so query responses
+# don't wait on the database (false: each query is written inside its request). Off by default:
+# rows still buffered when the process crashes or is killed are lost (a clean shutdown writes them),
+# and a query can be missing from /history for up to QUERY_WRITE_INTERVAL_SECONDS after it's answered
+QUERY_WRITE_BEHIND = os.getenv("QUERY_WRITE_BEHIND", "false").lower() == "true"
+# A batch is written once this many rows are buffered, or once the oldest has waited this long
+QUERY_WRITE_BATCH_SIZE = int(os.getenv("QUERY_WRITE_BATCH_SIZE", "100"))
+QUERY_WRITE_INTERVAL_SECONDS = float(os.getenv("QUERY_WRITE_INTERVAL_SECONDS", "1.0"))
+# Most rows buffered; past this, requests write their own rows until the writer catches up
+QUERY_WRITE_MAX_PENDING = int(os.getenv("QUERY_WRITE_MAX_PENDING", "10000"))
+
+BATCH_ROW_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+FLUSH_SECONDS = Histogram("legal_lens_query_write_flush_seconds", "Time to insert one batch of buffered queries")
+BATCH_ROWS = Histogram("legal_lens_query_write_batch_rows", "Rows per batch of buffered queries",
+                       buckets=BATCH_ROW_BUCKETS)
+QUERY_WRITES = Counter("legal_lens_query_writes_total",
+                       "Query history rows by outcome (written, overflow: written by the request, failed: dropped)",
+                       ["outcome"])
+
+
+class QueryWriter:
+    """Write-behind buffer for DocumentQuery rows, inserted in bulk by one background thread.
+
+    submit() only appends to the buffer. The thread writes a batch once batch_size rows are waiting
+    or the oldest has waited interval seconds. If a batch insert fails, its rows are retried one by
+    one and the ones that still fail are dropped (and counted). When the buffer is full, or after
+    shutdown, submit() returns False and the caller writes the row itself. Rows still buffered if
+    the process dies are lost - query history only, never documents or credits.
+    """
+
+    def __init__(self, session_factory: Callable, batch_size: int = QUERY_WRITE_BATCH_SIZE,
+                 interval: float = QUERY_WRITE_INTERVAL_SECONDS, max_pending: int = QUERY_WRITE_MAX_PENDING):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = []
+        self._oldest = None  # monotonic time the oldest pending row was submitted
+        self._writing = 0
+        self._flush_requested = False
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._counts = {"written": 0, "overflow": 0, "failed": 0, "batches": 0}
+        self._thread = threading.Thread(target=self._run, name="query-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, document_id: str, query_text: str, response_text: str, response_time_ms: Optional[int] = None,
+               user_id: Optional[str] = None, time_to_first_token_ms: Optional[int] = None,
+               cache_hit: bool = False) -> bool:
+        """Buffer a query to be written; False if the buffer is full or stopped, and the caller should write it"""
+        row = {
+            "id": str(uuid.uuid4()),
+            "document_id": document_id,
+            "query_text": query_text,
+            "response_text": response_text,
+            "query_date": datetime.utcnow(),
+            "response_time_ms": response_time_ms,
+            "time_to_first_token_ms": time_to_first_token_ms,
+            "cache_hit": cache_hit,
+            "user_id": user_id,
+        }
+        with self._cond:
+            if self._stopping or len(self._pending) >= self.max_pending:
+                self._counts["overflow"] += 1
+                QUERY_WRITES.inc("overflow")
+                return False
+            self._pending.append(row)
+            # Wake the writer to start the interval timer on the first row, and to write a full batch
+            if len(self._pending) == 1:
+                self._oldest = time.monotonic()
+                self._cond.notify_all()
+            elif len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every row submitted so far has been written (or dropped); False on timeout"""
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            done = self._cond.wait_for(lambda: not self._pending and not self._writing, timeout)
+            self._flush_requested = False
+            return done
+
+    def shutdown(self, timeout: float = 30.0) -> None:
+        """Stop buffering (later rows are written by their callers), write what's pending and stop the thread"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self._pending:
+            logger.error(f"Query writer stopped with {len(self._pending)} rows unwritten")
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "max_pending": self.max_pending,
+                "batch_size": self.batch_size,
+                "interval_seconds": self.interval,
+                **self._counts,
+            }
+
+    def _due(self) -> bool:
+        return bool(self._pending) and (
+            self._stopping or self._flush_requested or len(self._pending) >= self.batch_size
+            or time.monotonic() - self._oldest >= self.interval)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._due():
+                    if self._stopping:
+                        return
+                    timeout = self._oldest + self.interval - time.monotonic() if self._pending else None
+                    self._cond.wait(timeout)
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+                self._oldest = time.monotonic() if self._pending else None
+                self._writing += 1
+            written = 0
+            try:
+                written = self._write(batch)
+            except Exception as e:
+                logger.error(f"Query writer failed on a batch of {len(batch)}: {e}")
+            with self._cond:
+                self._writing -= 1
+                self._counts["written"] += written
+                self._counts["failed"] += len(batch) - written
+                self._counts["batches"] += 1
+                self._cond.notify_all()
+
+    def _write(self, batch: List[dict]) -> int:
+        """Insert a batch, falling back to row by row if it fails; returns the rows written"""
+        started = time.perf_counter()
+        try:
+            with self.session_factory() as db:
+                save_queries(db, batch)
+            written = len(batch)
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} buffered queries, retrying one by one: {e}")
+            written = 0
+            for row in batch:
+                try:
+                    with self.session_factory() as db:
+                        save_queries(db, [row])
+                    written += 1
+                except Exception as e:
+                    logger.error(f"Dropped query {row['id']} for document {row['document_id']}: {e}")
+        FLUSH_SECONDS.observe(time.perf_counter() - started)
+        BATCH_ROWS.observe(len(batch))
+        QUERY_WRITES.inc("written", amount=written)
+        if written < len(batch):
+            QUERY_WRITES.inc("failed", amount=len(batch) - written)
+        return written
@@ -0,0 +1,252 @@
+import logging
+import os
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# "per_document" gives every document its own FAISS index; "shared" puts all vectors on this node in one
+VECTOR_INDEX_MODE = os.getenv("VECTOR_INDEX_MODE", "per_document")
+# Compact once this fraction of the shared index belongs to released documents
+SHARED_INDEX_COMPACT_RATIO = float(os.getenv("SHARED_INDEX_COMPACT_RATIO", "0.25"))
+# ...and at least this many rows are dead, so small indexes aren't rebuilt constantly
+SHARED_INDEX_COMPACT_MIN_ROWS = int(os.getenv("SHARED_INDEX_COMPACT_MIN_ROWS", "10000"))
+
+_INITIAL_CAPACITY = 1024
+_DEAD = -1
+
+
+class ContentFreedError(LookupError):
+    """Raised when a document's vectors are read after its content was removed from the shared index"""
+
+
+class SharedVectorIndex:
+    """One growable matrix holding the chunk vectors of every document on this node.
+
+    Each document's vectors occupy a contiguous block of rows, and a parallel owner array
+    records which document (by content key) every row belongs to. Searches are filtered to
+    the requested documents by only scanning their blocks, so a query costs the same as
+    with a per-document index. Removing a document just marks its rows dead; compaction
+    reclaims them on a background thread once enough of the index is dead.
+    """
+
+    def __init__(self, compact_ratio: float = SHARED_INDEX_COMPACT_RATIO,
+                 compact_min_rows: int = SHARED_INDEX_COMPACT_MIN_ROWS):
+        self.compact_ratio = compact_ratio
+        self.compact_min_rows = compact_min_rows
+        self.dim = None
+        self.compactions = 0
+        self._vectors = None
+        self._owner = np.empty(0, dtype=np.int32)
+        self._size = 0
+        self._dead = 0
+        self._blocks = {}  # key -> (first row, row count)
+        self._slots = {}  # key -> owner ID stored alongside its rows
+        self._next_slot = 0
+        self._lock = threading.Lock()
+        self._compacting = False
+
+    def adopt(self, key: str, vectorstore, chunks) -> "SharedIndexView":
+        """Move a per-document FAISS store's vectors into the shared index; returns a view searching them"""
+        with self._lock:
+            present = key in self._blocks
+        if not present:
+            index = vectorstore.index
+            self.add(key, index.reconstruct_n(0, index.ntotal))
+        return SharedIndexView(self, key, chunks, vectorstore.embedding_function)
+
+    def add(self, key: str, vectors: np.ndarray) -> None:
+        """Append a document's vectors (row i = chunk i); a key that's already present is left as is"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock:
+            if key in self._blocks:
+                return
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._vectors = np.empty((_INITIAL_CAPACITY, self.dim), dtype=np.float32)
+                self._owner = np.full(_INITIAL_CAPACITY, _DEAD, dtype=np.int32)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension {vectors.shape[1]} doesn't match shared index dimension {self.dim}")
+
+            self._reserve(self._size + len(vectors))
+            slot = self._next_slot
+            self._next_slot += 1
+            start = self._size
+            self._vectors[start:start + len(vectors)] = vectors
+            self._owner[start:start + len(vectors)] = slot
+            self._size += len(vectors)
+            self._blocks[key] = (start, len(vectors))
+            self._slots[key] = slot
+
+    def remove(self, key: str) -> None:
+        """Mark a document's rows dead, compacting in the background if enough of the index is dead"""
+        with self._lock:
+            block = self._blocks.pop(key, None)
+            if block is None:
+                return
+            self._slots.pop(key)
+            start, count = block
+            self._owner[start:start + count] = _DEAD
+            self._dead += count
+            compact = (not self._compacting and self._dead >= self.compact_min_rows
+                       and self._dead >= self._size * self.compact_ratio)
+            if compact:
+                self._compacting = True
+        if compact:
+            threading.Thread(target=self._compact_in_background, name="shared-index-compaction", daemon=True).start()
+
+    def vectors(self, key: str) -> Optional[np.ndarray]:
+        """A document's vectors (a read-only view; row i = chunk i), or None if it isn't in the index"""
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is None:
+                return None
+            start, count = block
+            view = self._vectors[start:start + count]
+        view.flags.writeable = False
+        return view
+
+    def search(self, vector: List[float], keys: Iterable[str], k: int = 4) -> List[Tuple[str, int, float]]:
+        """Nearest chunks to the vector among the given documents: (key, chunk index, squared L2 distance)"""
+        query = np.asarray([vector], dtype=np.float32)
+        results = []
+        for key in keys:
+            block = self.vectors(key)
+            if block is None or not len(block):
+                continue
+            distances, indices = faiss.knn(query, block, min(k, len(block)))
+            results.extend((key, int(i), float(d)) for d, i in zip(distances[0], indices[0]) if i >= 0)
+        results.sort(key=lambda result: result[2])
+        return results[:k]
+
+    def compact(self) -> None:
+        """Rewrite the index without dead rows. Adds, removes and searches may run concurrently."""
+        with self._lock:
+            size = self._size
+            vectors = self._vectors
+            live = self._owner[:size] != _DEAD
+        if vectors is None:
+            return
+
+        # Copy live rows outside the lock; rows below `size` never change, only their owners do
+        kept = int(live.sum())
+        new_start = np.cumsum(live) - 1
+        compacted = np.empty((max(_INITIAL_CAPACITY, kept * 2), self.dim), dtype=np.float32)
+        compacted[:kept] = vectors[:size][live]
+
+        with self._lock:
+            # Bring over rows appended while copying, and owners that changed (documents removed)
+            tail = self._size - size
+            if kept + tail > len(compacted):
+                grown = np.empty(((kept + tail) * 2, self.dim), dtype=np.float32)
+                grown[:kept] = compacted[:kept]
+                compacted = grown
+            compacted[kept:kept + tail] = self._vectors[size:self._size]
+            owner = np.full(len(compacted), _DEAD, dtype=np.int32)
+            owner[:kept] = self._owner[:size][live]
+            owner[kept:kept + tail] = self._owner[size:self._size]
+
+            blocks = {}
+            for key, (start, count) in self._blocks.items():
+                blocks[key] = (int(new_start[start]) if start < size else kept + start - size, count)
+
+            freed = self._size - (kept + tail)
+            self._vectors, self._owner, self._blocks = compacted, owner, blocks
+            self._size = kept + tail
+            self._dead = int((owner[:self._size] == _DEAD).sum())
+            self.compactions += 1
+        logger.info(f"Compacted shared vector index: freed {freed} rows, {self._size} rows in use")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "documents": len(self._blocks),
+                "rows": self._size,
+                "dead_rows": self._dead,
+                "capacity": len(self._owner),
+                "bytes": self._vectors.nbytes if self._vectors is not None else 0,
+                "compactions": self.compactions,
+            }
+
+    def _reserve(self, rows: int) -> None:
+        # Caller holds the lock; grow geometrically so appends are amortised O(1)
+        if rows <= len(self._vectors):
+            return
+        capacity = max(rows, len(self._vectors) * 2)
+        vectors = np.empty((capacity, self.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        owner = np.full(capacity, _DEAD, dtype=np.int32)
+        owner[:self._size] = self._owner[:self._size]
+        self._vectors, self._owner = vectors, owner
+
+    def _compact_in_background(self) -> None:
+        try:
+            self.compact()
+        except Exception as e:
+            logger.error(f"Shared vector index compaction failed: {e}")
+        finally:
+            with self._lock:
+                self._compacting = False
+
+
+class _IndexSlice:
+    """The subset of the FAISS index API used for sizing and persisting one document's vectors"""
+
+    def __init__(self, shared: SharedVectorIndex, key: str):
+        self.shared = shared
+        self.key = key
+
+    def reconstruct_n(self, first: int, count: int) -> np.ndarray:
+        vectors = self.shared.vectors(self.key)
+        if vectors is None:
+            raise ContentFreedError(f"Shared index no longer holds {self.key[:12]} (its content was freed)")
+        return np.array(vectors[first:first + count])
+
+    @property
+    def ntotal(self) -> int:
+        vectors = self.shared.vectors(self.key)
+        return 0 if vectors is None else len(vectors)
+
+    @property
+    def d(self) -> int:
+        return self.shared.dim
+
+
+class SharedIndexView:
+    """One document's slice of the shared index, with the FAISS vector store search methods main uses"""
+
+    def __init__(self, shared: SharedVectorIndex, key: str, chunks, embedding_function):
+        self.shared = shared
+        self.key = key
+        self.chunks = chunks
+        self.embedding_function = embedding_function
+        self.index = _IndexSlice(shared, key)
+
+    def _search(self, embedding: List[float], k: int) -> List[Tuple[str, int, float]]:
+        # A freed document must fail loudly - an empty result would read as "nothing relevant"
+        if self.shared.vectors(self.key) is None:
+            raise ContentFreedError(f"Shared index no longer holds {self.key[:12]} (its content was freed)")
+        return self.shared.search(embedding, [self.key], k)
+
+    def search_chunks(self, embedding: List[float], k: int = 4) -> List[Tuple[int, float]]:
+        """(chunk index, squared L2 distance) of the k nearest chunks"""
+        return [(i, distance) for _, i, distance in self._search(embedding, k)]
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        return [
+            (Document(page_content=self.chunks[i]), distance)
+            for _, i, distance in self._search(embedding, k)
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding_function.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
@@ -0,0 +1,99 @@
+import pytest
+import os
+import sys
+from unittest.mock import patch
+
+import numpy as np
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from answer_cache import AnswerCache, normalize_query
+
+class TestAnswerCache:
+    """Test the answer cache for repeated questions"""
+
+    def test_normalized_query_hits(self):
+        """Test that case, whitespace and trailing punctuation don't change the key"""
+        cache = AnswerCache()
+        cache.put("doc-1", "What is the rent?", "v1", "Rent is $1000.")
+
+        assert normalize_query("  what IS  the rent ?? ") == "what is the rent"
+        assert cache.get("doc-1", "what is   the RENT", "v1") == "Rent is $1000."
+        assert cache.get("doc-2", "What is the rent?", "v1") is None
+        assert cache.get("doc-1", "What is the rent?", "v2") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 2
+
+    def test_entries_expire(self):
+        """Test that entries are dropped once their TTL has passed"""
+        cache = AnswerCache(ttl_seconds=60)
+        with patch('answer_cache.time.time', return_value=1000.0):
+            cache.put("doc-1", "q", "v1", "a")
+        with patch('answer_cache.time.time', return_value=1059.0):
+            assert cache.get("doc-1", "q", "v1") == "a"
+        with patch('answer_cache.time.time', return_value=1061.0):
+            assert cache.get("doc-1", "q", "v1") is None
+        assert cache.stats()["entries"] == 0
+        assert cache.total_bytes == 0
+
+    def test_lru_eviction_under_memory_cap(self):
+        """Test that the least recently used answer is evicted first"""
+        cache = AnswerCache(max_bytes=900)
+        cache.put("doc-1", "first", "v1", "x" * 200)
+        cache.put("doc-1", "second", "v1", "x" * 200)
+        cache.get("doc-1", "first", "v1")
+        cache.put("doc-1", "third", "v1", "x" * 200)
+
+        assert cache.get("doc-1", "second", "v1") is None
+        assert cache.get("doc-1", "first", "v1") is not None
+        assert cache.get("doc-1", "third", "v1") is not None
+        assert cache.total_bytes <= 900
+
+    def test_semantic_tier(self):
+        """Test that a nearby query embedding reuses the cached answer and a distant one doesn't"""
+        cache = AnswerCache(semantic_distance=0.05)
+        cache.put("doc-1", "What is the rent?", "v1", "Rent is $1000.", embedding=[1.0, 0.0, 0.0])
+
+        assert cache.get("doc-1", "How much is rent", "v1") is None
+        assert cache.get_similar("doc-1", [0.99, 0.05, 0.0], "v1") == "Rent is $1000."
+        assert cache.get_similar("doc-1", [0.0, 1.0, 0.0], "v1") is None
+        assert cache.get_similar("doc-2", [1.0, 0.0, 0.0], "v1") is None
+
+        stats = cache.stats()
+        assert (stats["hits"], stats["semantic_hits"], stats["misses"]) == (1, 1, 2)
+
+    def test_semantic_tier_picks_nearest_after_removals(self):
+        """Test that the stacked embeddings stay aligned with their entries as answers are replaced and invalidated"""
+        cache = AnswerCache(semantic_distance=0.2)
+        for i in range(20):
+            angle = i * 0.02
+            cache.put("doc-1", f"q{i}", "v1", f"a{i}", embedding=[float(np.cos(angle)), float(np.sin(angle)), 0.0])
+        cache.put("doc-1", "q0", "v1", "replaced", embedding=[0.0, 0.0, 1.0])
+        cache.put("doc-2", "q", "v1", "other", embedding=[1.0, 0.0, 0.0])
+
+        assert cache.get_similar("doc-1", [1.0, 0.0, 0.0], "v1") == "a1"
+        assert cache.get_similar("doc-1", [float(np.cos(0.3)), float(np.sin(0.3)), 0.0], "v1") == "a15"
+        assert cache.get_similar("doc-1", [0.0, 0.0, 1.0], "v1") == "replaced"
+
+        cache.invalidate("doc-1")
+        assert cache.get_similar("doc-1", [1.0, 0.0, 0.0], "v1") is None
+        assert cache.get_similar("doc-2", [1.0, 0.0, 0.0], "v1") == "other"
+
+    def test_semantic_tier_disabled(self):
+        """Test that embeddings are neither stored nor matched when the semantic tier is off"""
+        cache = AnswerCache()
+        cache.put("doc-1", "What is the rent?", "v1", "Rent is $1000.", embedding=[1.0, 0.0])
+        assert cache.get_similar("doc-1", [1.0, 0.0], "v1") is None
+
+    def test_invalidate_document(self):
+        """Test that invalidating a document drops only its answers"""
+        cache = AnswerCache()
+        cache.put("doc-1", "q", "v1", "a")
+        cache.put("doc-2", "q", "v1", "b")
+        cache.invalidate("doc-1")
+        assert cache.get("doc-1", "q", "v1") is None
+        assert cache.get("doc-2", "q", "v1") == "b"
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,137 @@
+import pytest
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import main
+from main import app
+from auth_cache import TokenCache, UserCache
+from database import get_db, get_async_db
+from db_services import deduct_credit
+from models import Base, User
+
+@pytest.fixture
+def database(tmp_path):
+    """A scratch SQLite database wired into the app, recording the SQL statements it runs"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'auth.db'}", connect_args={"check_same_thread": False})
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'auth.db'}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    AsyncSession = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    statements = []
+    for target in (engine, async_engine.sync_engine):
+        event.listen(target, "before_cursor_execute", lambda conn, cursor, sql, *args: statements.append(sql))
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def override_get_async_db():
+        async with AsyncSession() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    yield Session, statements
+    app.dependency_overrides.pop(get_db, None)
+    app.dependency_overrides.pop(get_async_db, None)
+
+@pytest.fixture
+def fresh_caches():
+    """Empty auth caches for each test"""
+    with patch('main.token_cache', TokenCache()), patch('main.user_cache', UserCache(last_login_interval=300)):
+        yield
+
+def claims(uid="firebase-1", lifetime=3600):
+    """Decoded ID token claims expiring lifetime seconds from now"""
+    return {"uid": uid, "email": f"{uid}@example.com", "exp": time.time() + lifetime}
+
+class TestAuthCache:
+    """Test caching of verified tokens and user rows, and throttled last_login writes"""
+
+    def test_tokens_cached_until_expiry(self):
+        """Test that claims are served until exp, and tokens without exp are never cached"""
+        cache = TokenCache(max_entries=2)
+        cache.put_claims("token-a", claims(lifetime=60))
+        cache.put_claims("token-b", claims(lifetime=-1))
+        cache.put_claims("token-c", {"uid": "no-exp"})
+        assert cache.get_claims("token-a")["uid"] == "firebase-1"
+        assert cache.get_claims("token-b") is None
+        assert cache.get_claims("token-c") is None
+
+        cache.put_claims("token-d", claims("firebase-2"))
+        cache.put_claims("token-e", claims("firebase-3"))
+        assert len(cache) == 2 and cache.get_claims("token-a") is None
+
+    def test_last_login_writes_are_coalesced(self):
+        """Test that a login is only due once per interval per user"""
+        cache = UserCache(last_login_interval=300)
+        user = User(id="u1", firebase_uid="firebase-1", last_login=datetime.utcnow() - timedelta(hours=1))
+        now = datetime.utcnow()
+        assert cache.touch_login(user, now)
+        assert not cache.touch_login(user, now + timedelta(seconds=299))
+        assert cache.touch_login(user, now + timedelta(seconds=301))
+        assert cache.stats()["last_login_writes"] == 2
+
+    def test_repeat_requests_skip_verification_and_database(self, database, fresh_caches):
+        """Test that after the first request, authentication needs no Firebase call and no SQL"""
+        Session, statements = database
+        with patch('main.firebase_auth.verify_id_token', return_value=claims()) as verify:
+            client = TestClient(app)
+            first = client.get("/me", headers={"Authorization": "Bearer token-1"})
+            statements.clear()
+            for _ in range(5):
+                response = client.get("/me", headers={"Authorization": "Bearer token-1"})
+                assert response.status_code == 200
+
+        assert first.json()["credits"] == 5
+        assert verify.call_count == 1
+        assert statements == []
+
+    def test_stale_last_login_written_once(self, database, fresh_caches):
+        """Test that a returning user's old login time is updated once, not on every request"""
+        Session, statements = database
+        with Session() as db:
+            db.add(User(id="u1", firebase_uid="firebase-1", email="a@example.com", credits=3,
+                        last_login=datetime.utcnow() - timedelta(days=2)))
+            db.commit()
+
+        client = TestClient(app)
+        with patch('main.firebase_auth.verify_id_token', return_value=claims()):
+            for _ in range(4):
+                assert client.get("/me", headers={"Authorization": "Bearer token-1"}).status_code == 200
+
+        assert sum(sql.startswith("UPDATE users SET last_login") for sql in statements) == 1
+        with Session() as db:
+            assert datetime.utcnow() - db.get(User, "u1").last_login < timedelta(minutes=1)
+
+    def test_credit_deduction_is_atomic_and_invalidates(self, database, fresh_caches):
+        """Test that credits are taken with a guarded update and the cached row is dropped"""
+        Session, _ = database
+        with Session() as db:
+            db.add(User(id="u1", firebase_uid="firebase-1", email="a@example.com", credits=1))
+            db.commit()
+            assert deduct_credit(db, "u1")
+            assert not deduct_credit(db, "u1")
+            assert db.get(User, "u1").credits == 0
+
+        cache = UserCache()
+        cache.put_user(User(id="u1", firebase_uid="firebase-1"))
+        cache.invalidate("u1")
+        assert cache.get_user("firebase-1") is None
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,88 @@
+import pytest
+import os
+import sys
+import threading
+import time
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embeddings import BatchedEmbeddings, EmbeddingProvider, make_batches, estimate_tokens
+
+class SlowProvider(EmbeddingProvider):
+    """Stub provider with artificial per-request latency that can fail its first few requests"""
+
+    def __init__(self, latency=0.05, batch_size=10, concurrency=4, failures=0):
+        self.model = "stub"
+        self.dimension = 2
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.latency = latency
+        self.failures = failures
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = self.failures > 0
+            self.failures -= 1
+        try:
+            time.sleep(self.latency)
+            if fail:
+                raise ConnectionError("rate limited")
+            return [[float(text.split()[-1]), 1.0] for text in texts]
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+TEXTS = [f"chunk {i}" for i in range(80)]
+
+class TestBatchedEmbeddings:
+    """Test concurrent, token-bounded, retried embedding of document chunks"""
+
+    def test_batches_respect_text_and_token_limits(self):
+        """Test that batches are consecutive and bounded by both text count and estimated tokens"""
+        assert make_batches(TEXTS, 25, 10 ** 6) == [range(0, 25), range(25, 50), range(50, 75), range(75, 80)]
+        texts = ["x" * 400] * 5  # about 100 tokens each
+        assert make_batches(texts, 100, 250) == [range(0, 2), range(2, 4), range(4, 5)]
+        assert make_batches(["x" * 4000, "y"], 100, 250) == [range(0, 1), range(1, 2)]
+        assert make_batches([], 10, 10) == []
+        assert estimate_tokens("x" * 400) == 101
+
+    def test_vectors_come_back_in_order(self):
+        """Test that concurrently embedded batches are assembled in input order"""
+        embeddings = BatchedEmbeddings(SlowProvider(latency=0.01))
+        vectors = embeddings.embed_documents(TEXTS)
+        assert [vector[0] for vector in vectors] == [float(i) for i in range(80)]
+
+    def test_wall_time_scales_with_batches_over_concurrency(self):
+        """Test that 8 batches at concurrency 4 take about 2 round trips, never more than 4 in flight"""
+        provider = SlowProvider(latency=0.1, batch_size=10, concurrency=4)
+        started = time.perf_counter()
+        BatchedEmbeddings(provider).embed_documents(TEXTS)
+        elapsed = time.perf_counter() - started
+
+        assert provider.requests == 8
+        assert provider.max_in_flight == 4
+        assert 0.2 <= elapsed < 0.5  # sequential would take 0.8s
+
+    def test_failed_batches_are_retried(self):
+        """Test that transient failures are retried with backoff and give up after max_retries"""
+        embeddings = BatchedEmbeddings(SlowProvider(latency=0, failures=2), backoff_seconds=0.001)
+        assert len(embeddings.embed_documents(TEXTS)) == 80
+
+        embeddings = BatchedEmbeddings(SlowProvider(latency=0, batch_size=100, failures=3), max_retries=2,
+                                       backoff_seconds=0.001)
+        with pytest.raises(ConnectionError):
+            embeddings.embed_documents(TEXTS)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,38 @@
+import pytest
+import os
+import sys
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stages import compare, time_stage
+
+def results(**stages):
+    """A results file for one document with the given fastest timings per stage"""
+    return {"documents": {"lease.pdf": {stage: {"min_ms": ms} if ms is not None else {"skipped": "not installed"}
+                                         for stage, ms in stages.items()}}}
+
+class TestStageBenchmarks:
+    """Test the stage timer and the regression check against a baseline"""
+
+    def test_time_stage_reports_per_unit_timings(self):
+        """Test that the timer warms up, repeats and divides by the units of work"""
+        calls = []
+        result = time_stage(lambda: calls.append(1), repeat=3, units=4)
+        assert len(calls) == 4
+        assert result["units"] == 4
+        assert 0 <= result["min_ms"] <= result["median_ms"] <= result["max_ms"]
+
+    def test_regressions_beyond_threshold_are_flagged(self):
+        """Test that only slowdowns over both the relative threshold and the noise floor regress"""
+        baseline = results(chunk=10.0, embed=100.0, search=0.1, ocr_page=None)
+        current = results(chunk=12.0, embed=140.0, search=0.3, ocr_page=None, faiss_build=1.0)
+        rows = {row["stage"]: row for row in compare(current, baseline, threshold=0.25, min_ms=0.5)}
+
+        assert set(rows) == {"chunk", "embed", "search"}  # skipped and new stages aren't compared
+        assert not rows["chunk"]["regressed"]
+        assert rows["embed"]["regressed"] and rows["embed"]["change"] == pytest.approx(0.4)
+        assert not rows["search"]["regressed"]  # tripled, but only by 0.2ms
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,66 @@
+import pytest
+import os
+import sys
+import numpy as np
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bm25 import KeywordIndex, tokenize, query_terms, top_chunks, fuse
+
+CHUNKS = [
+    "Section 12.3 Termination. Either party may terminate this Agreement on thirty days notice.",
+    "The Program Banks shall hold deposits of up to $250,000 per depositor.",
+    "Section 4.1 Fees. The Customer pays the fees set out in the Order Form.",
+    "This Agreement is governed by the laws of the State of New York.",
+]
+
+@pytest.fixture
+def index():
+    return KeywordIndex.build(CHUNKS)
+
+class TestKeywordIndex:
+    """Test the BM25 inverted index and hybrid score fusion"""
+
+    def test_tokenize_keeps_section_numbers_and_amounts(self):
+        """Test that section numbers and dollar amounts stay whole tokens"""
+        assert tokenize("See Section 12.3 for $250,000.") == ["see", "section", "12.3", "for", "250,000"]
+        assert query_terms("What does Section 12.3 say?") == ["12.3", "section"]
+
+    def test_exact_terms_rank_their_chunk_first(self, index):
+        """Test that exact legal terms score the chunk containing them highest"""
+        assert top_chunks(index.scores(query_terms("Section 12.3")), 1)[0][0] == 0
+        assert top_chunks(index.scores(query_terms("$250,000 Program Banks")), 1)[0][0] == 1
+        assert top_chunks(index.scores(["indemnification"]), 3) == []
+
+    def test_confident_only_when_match_is_decisive(self, index):
+        """Test the fast-path check: all terms in the top chunk and a clear margin over the runner-up"""
+        terms = query_terms("What does Section 12.3 say?")
+        assert index.confident(terms, index.scores(terms))
+        # "section" alone is split evenly between two chunks
+        assert not index.confident(["section"], index.scores(["section"]))
+        # A term the document doesn't contain means the keywords can't answer it alone
+        terms = query_terms("Section 12.3 indemnification")
+        assert not index.confident(terms, index.scores(terms))
+        terms = query_terms("Section 12.3")
+        assert not index.confident(terms, index.scores(terms), margin=0)
+
+    def test_save_and_load_round_trip(self, index, tmp_path):
+        """Test that a persisted index scores identically after loading"""
+        index.save(str(tmp_path))
+        loaded = KeywordIndex.load(str(tmp_path))
+        terms = query_terms("Program Banks terminate Agreement")
+        np.testing.assert_array_equal(loaded.scores(terms), index.scores(terms))
+        assert loaded.nbytes == index.nbytes
+
+    def test_fuse_weights_keyword_and_vector_scores(self, index):
+        """Test that fusion follows the weight and can pull in chunks the vector search missed"""
+        scores = index.scores(query_terms("Program Banks"))
+        vector_hits = [(3, 0.1), (2, 0.5), (0, 0.9)]
+        assert [chunk for chunk, _ in fuse(scores, vector_hits, 2, weight=0.0)] == [3, 2]
+        assert fuse(scores, vector_hits, 1, weight=1.0)[0][0] == 1
+        assert fuse(scores, vector_hits, 1, weight=0.7)[0][0] == 1
+        assert fuse(np.zeros(4, dtype=np.float32), [], 2) == []
+
+if __name__ == "__main__":
+    pytest.main([__file__])
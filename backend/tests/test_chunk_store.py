@@ -0,0 +1,60 @@
+import pytest
+import os
+import sys
+import pickle
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunk_store import ChunkStore, ChunkDocstore
+from extraction import chunk_text
+
+class TestChunkStore:
+    """Test the compact text and chunk offset storage"""
+
+    def test_chunks_resolve_to_original_text(self):
+        """Test that overlapping chunks are stored as offsets and decode back unchanged"""
+        text = "\n\n".join(f"Clause {i}: the tenant shall pay rent on day {i} of each month." for i in range(200))
+        chunks = chunk_text(text)
+        store = ChunkStore.from_chunks(text, chunks)
+
+        assert list(store) == chunks
+        assert store.text == text
+        assert store.text_length == len(text)
+        assert len(store.buffer) == len(text.encode("utf-8"))
+        assert store[1:3] == chunks[1:3]
+
+    def test_non_ascii_offsets(self):
+        """Test that byte offsets stay correct for multi-byte characters"""
+        text = "Arrendatário pagará € 1.000 — ver cláusula 5. " * 100
+        chunks = chunk_text(text, chunk_size=120, chunk_overlap=30)
+        store = ChunkStore.from_chunks(text, chunks)
+        assert list(store) == chunks
+        assert store.text_length == len(text)
+
+    def test_chunk_not_in_text_is_kept(self):
+        """Test that a chunk missing from the text is stored after it without changing the text"""
+        store = ChunkStore.from_chunks("alpha beta", ["alpha", "gamma"])
+        assert list(store) == ["alpha", "gamma"]
+        assert store.text == "alpha beta"
+
+    def test_save_and_open_memory_mapped(self, tmp_path):
+        """Test that a saved store reopens memory-mapped with no text on the heap, and pickles"""
+        text = "First clause. Second clause. Third clause."
+        store = ChunkStore.from_chunks(text, ["First clause.", "Second clause.", "Third clause."])
+        store.save(str(tmp_path))
+
+        opened = ChunkStore.open(str(tmp_path), store.text_bytes)
+        assert list(opened) == list(store)
+        assert opened.text == text
+        assert opened.resident_bytes == opened.spans.nbytes
+        assert list(pickle.loads(pickle.dumps(opened))) == list(store)
+
+    def test_docstore_lookup(self):
+        """Test that the FAISS docstore builds documents from chunk offsets"""
+        docstore = ChunkDocstore(ChunkStore.from_chunks("a b", ["a", "b"]))
+        assert docstore.search("1").page_content == "b"
+        assert isinstance(docstore.search("5"), str)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
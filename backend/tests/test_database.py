@@ -0,0 +1,72 @@
+import pytest
+import os
+import sys
+import asyncio
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from database import (POOL_CHECKOUT_SECONDS, POOL_TIMEOUTS, TimedAsyncNullPool, TimedQueuePool,
+                      async_database_url, engine_options, DB_POOL_SIZE)
+from db_services import get_document_history, save_document
+from models import Base
+
+class TestDatabase:
+    """Test engine configuration, the async session path and pool metrics"""
+
+    def test_async_url_uses_async_drivers(self):
+        """Test that the async engine reaches the same database through asyncpg or aiosqlite"""
+        assert async_database_url("sqlite:///./legal_lens.db") == "sqlite+aiosqlite:///./legal_lens.db"
+        assert async_database_url("postgresql://app:secret@db:5432/legal_lens?sslmode=require") == \
+            "postgresql+asyncpg://app:secret@db:5432/legal_lens?ssl=require"
+        assert async_database_url("mysql://app@db/legal_lens") == "mysql://app@db/legal_lens"
+
+    def test_pool_options(self):
+        """Test that pool settings apply to pooled engines but not to in-memory SQLite or aiosqlite"""
+        options = engine_options("postgresql://app@db/legal_lens", TimedQueuePool)
+        assert options["poolclass"] is TimedQueuePool
+        assert options["pool_size"] == DB_POOL_SIZE
+        assert {"max_overflow", "pool_timeout", "pool_recycle", "pool_pre_ping"} <= set(options)
+        assert "poolclass" not in engine_options("sqlite://", TimedQueuePool)
+        assert engine_options("sqlite+aiosqlite:///./legal_lens.db", TimedQueuePool) == {"poolclass": TimedAsyncNullPool}
+
+    def test_pool_timeouts_are_counted(self):
+        """Test that a checkout giving up on a full pool is counted and its wait recorded"""
+        engine = create_engine("sqlite://", poolclass=TimedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05)
+        waits, timeouts = POOL_CHECKOUT_SECONDS.count("sync"), POOL_TIMEOUTS.value("sync")
+        with engine.connect():
+            with pytest.raises(exc.TimeoutError):
+                engine.connect()
+        assert POOL_TIMEOUTS.value("sync") == timeouts + 1
+        assert POOL_CHECKOUT_SECONDS.count("sync") == waits + 2
+        engine.dispose()
+
+    def test_sync_helpers_run_on_async_session(self, tmp_path):
+        """Test that existing db_services helpers work unchanged through AsyncSession.run_sync"""
+        path = tmp_path / "async.db"
+        Base.metadata.create_all(bind=create_engine(f"sqlite:///{path}"))
+        engine = create_async_engine(async_database_url(f"sqlite:///{path}"),
+                                     **engine_options(f"sqlite+aiosqlite:///{path}", TimedQueuePool))
+        Session = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+        checkouts = POOL_CHECKOUT_SECONDS.count("async")
+
+        async def run():
+            async with Session() as db:
+                await db.run_sync(save_document, "doc-1", "lease.pdf", 1000, user_id="user-1")
+            async with Session() as db:
+                documents, _ = await db.run_sync(get_document_history, "user-1")
+                assert (await db.execute(text("select count(*) from documents"))).scalar() == 1
+            await engine.dispose()
+            return documents
+
+        documents = asyncio.run(run())
+        assert [document.original_filename for document in documents] == ["lease.pdf"]
+        assert isinstance(engine.sync_engine.pool, NullPool)
+        assert POOL_CHECKOUT_SECONDS.count("async") >= checkouts + 2
+
+if __name__ == "__main__":
+    pytest.main([__file__])
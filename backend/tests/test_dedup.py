@@ -0,0 +1,56 @@
+import pytest
+import os
+import sys
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dedup import ContentIndex, content_hash
+
+class TestContentIndex:
+    """Test content-addressed sharing of processed uploads"""
+
+    def test_identical_bytes_hash_the_same(self):
+        """Test that the content hash only depends on the bytes"""
+        assert content_hash(b"%PDF-1.4 lease") == content_hash(b"%PDF-1.4 lease")
+        assert content_hash(b"%PDF-1.4 lease") != content_hash(b"%PDF-1.4 other")
+
+    def test_register_returns_existing_entry(self):
+        """Test that a concurrent duplicate registration keeps the first entry"""
+        index = ContentIndex()
+        first = index.register("abc", {"text": "first"})
+        second = index.register("abc", {"text": "second"})
+
+        assert second is first
+        assert index.lookup("abc")["text"] == "first"
+
+    def test_entry_freed_after_last_alias(self):
+        """Test that shared content stays alive until every alias is released"""
+        index = ContentIndex()
+        index.register("abc", {"text": "lease"})
+        index.add_alias("abc", "doc-1")
+        index.add_alias("abc", "doc-2")
+
+        assert index.ref_count("abc") == 2
+        assert index.release("doc-1") is False
+        assert index.lookup("abc") is not None
+        assert index.release("doc-2") is True
+        assert index.lookup("abc") is None
+
+    def test_alias_of_freed_entry(self):
+        """Test that aliasing content freed since it was looked up reports it gone instead of raising"""
+        index = ContentIndex()
+        shared = index.register("abc", {"text": "lease"})
+        assert index.add_alias("abc", "doc-1") is shared
+        index.release("doc-1")
+
+        assert index.add_alias("abc", "doc-2") is None
+        assert index.ref_count("abc") == 0
+        assert index.release("doc-2") is False
+
+    def test_release_unknown_document(self):
+        """Test that releasing an unaliased document is a no-op"""
+        assert ContentIndex().release("missing") is False
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,79 @@
+import pytest
+import os
+import sys
+from types import SimpleNamespace
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from document_registry import DocumentRegistry, estimate_document_bytes
+from chunk_store import ChunkStore
+
+def make_doc(vectors=100, dim=10, content_hash=None):
+    """A document whose only significant memory is its vector index"""
+    index = SimpleNamespace(ntotal=vectors, d=dim)
+    return {"vectorstore": SimpleNamespace(index=index), "chunks": ChunkStore.from_chunks("", []), "content_hash": content_hash}
+
+class TestDocumentRegistry:
+    """Test the memory-budgeted in-memory document registry"""
+
+    def test_estimate_counts_index_and_chunk_store(self):
+        """Test that the size estimate grows with vectors and stored text, counting the text once"""
+        base = estimate_document_bytes(make_doc())
+        assert base == 100 * 10 * 4
+        doc = make_doc()
+        doc["chunks"] = ChunkStore.from_chunks("x" * 1000, ["x" * 600, "x" * 600])
+        assert base + 1000 < estimate_document_bytes(doc) < base + 1500
+
+    def test_evicts_least_recently_queried(self):
+        """Test that going over budget evicts the least recently used document and calls on_evict"""
+        evicted = []
+        registry = DocumentRegistry(load=lambda document_id: None, on_evict=evicted.append, max_bytes=10000)
+        registry.put("a", make_doc())
+        registry.put("b", make_doc())
+        registry.get("a")
+        registry.put("c", make_doc())
+
+        assert evicted == ["b"]
+        assert registry.keys() == ["a", "c"]
+        assert registry.total_bytes == 8000
+        assert registry.stats()["evictions"] == 1
+
+    def test_reloads_evicted_document(self):
+        """Test that an evicted document is transparently loaded back on its next access"""
+        stored = {"a": make_doc(), "b": make_doc()}
+        registry = DocumentRegistry(load=lambda document_id: stored.get(document_id), max_bytes=5000)
+        registry.put("a", stored["a"])
+        registry.put("b", stored["b"])
+        assert "a" not in registry
+
+        assert registry.get("a") is stored["a"]
+        assert registry.get("missing") is None
+        assert registry.keys() == ["a"]
+
+        stats = registry.stats()
+        assert (stats["hits"], stats["misses"], stats["reloads"], stats["evictions"]) == (0, 2, 1, 2)
+
+    def test_shared_content_counted_once(self):
+        """Test that aliases of the same content hash don't double-count its memory"""
+        registry = DocumentRegistry(load=lambda document_id: None, max_bytes=10000)
+        registry.put("a", make_doc(content_hash="h1"))
+        registry.put("b", make_doc(content_hash="h1"))
+        assert registry.total_bytes == 4000
+
+        registry.pop("a")
+        assert registry.total_bytes == 4000
+        registry.pop("b")
+        assert registry.total_bytes == 0
+
+    def test_unpersisted_documents_are_not_evicted(self):
+        """Test that documents not yet written to disk stay in memory even over budget"""
+        registry = DocumentRegistry(load=lambda document_id: None, persisted=lambda document_id, doc: document_id != "a",
+                                    max_bytes=5000)
+        registry.put("a", make_doc())
+        registry.put("b", make_doc())
+        registry.put("c", make_doc())
+        assert registry.keys() == ["a", "c"]
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,76 @@
+import pytest
+import os
+import sys
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.embeddings import Embeddings
+from embedding_cache import CachedEmbeddings, EmbeddingCacheStore
+
+class CountingEmbeddings(Embeddings):
+    """Fake provider that records every text it is asked to embed"""
+    model = "fake-model"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.extend(texts)
+        return [[float(len(text)), 0.5] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 0.5]
+
+@pytest.fixture
+def store(tmp_path):
+    """Embedding cache store in a temporary SQLite file"""
+    return EmbeddingCacheStore(str(tmp_path / "cache.db"))
+
+class TestEmbeddingCache:
+    """Test the chunk-level embedding cache"""
+
+    def test_only_misses_reach_provider(self, store):
+        """Test that shared boilerplate chunks are embedded once across documents"""
+        provider = CountingEmbeddings()
+        embeddings = CachedEmbeddings(provider, store)
+
+        first = embeddings.embed_documents(["Governing law clause", "Rent is due monthly"])
+        second = embeddings.embed_documents(["Governing law clause", "Arbitration clause"])
+
+        assert provider.calls == ["Governing law clause", "Rent is due monthly", "Arbitration clause"]
+        assert second[0] == pytest.approx(first[0])
+
+    def test_duplicate_chunks_in_one_call(self, store):
+        """Test that repeated chunks within a document are embedded once"""
+        provider = CountingEmbeddings()
+        vectors = CachedEmbeddings(provider, store).embed_documents(["Same", "Same", "Other"])
+
+        assert provider.calls == ["Same", "Other"]
+        assert vectors[0] == vectors[1]
+
+    def test_cache_keyed_by_model(self, store):
+        """Test that vectors from one model are never served for another"""
+        provider = CountingEmbeddings()
+        CachedEmbeddings(provider, store, model="model-a").embed_documents(["Clause"])
+        CachedEmbeddings(provider, store, model="model-b").embed_documents(["Clause"])
+
+        assert provider.calls == ["Clause", "Clause"]
+
+    def test_lru_eviction_respects_budget(self, tmp_path):
+        """Test that least recently used vectors are evicted past the size budget"""
+        store = EmbeddingCacheStore(str(tmp_path / "cache.db"), max_bytes=8 * 3)
+        provider = CountingEmbeddings()
+        embeddings = CachedEmbeddings(provider, store)
+
+        embeddings.embed_documents(["a", "bb", "ccc"])
+        embeddings.embed_documents(["a"])  # touch "a" so it is most recently used
+        embeddings.embed_documents(["dddd"])
+
+        assert store.total_bytes <= store.max_bytes
+        provider.calls.clear()
+        embeddings.embed_documents(["a"])
+        assert provider.calls == []
+
+if __name__ == "__main__":
+    pytest.main([__file__])
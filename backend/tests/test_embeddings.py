@@ -0,0 +1,89 @@
+import pytest
+import functools
+import os
+import sys
+import numpy as np
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embeddings import HashingProvider, OpenAIProvider, create_provider
+
+class TestEmbeddingProviders:
+    """Test the embedding provider abstraction and the offline hashing backend"""
+
+    def test_hashing_is_deterministic_and_normalised(self):
+        """Test that hashing vectors have the declared size, unit length and never change"""
+        provider = HashingProvider(dimension=256)
+        first, second = provider.embed_documents(["The tenant pays rent monthly.", "The tenant pays rent monthly."])
+        assert len(first) == 256
+        assert first == second == HashingProvider(dimension=256).embed_query("The tenant pays rent monthly.")
+        assert np.linalg.norm(first) == pytest.approx(1.0, abs=1e-5)
+        assert provider.embed_query("") == [0.0] * 256
+
+    def test_hashing_places_related_texts_closer(self):
+        """Test that texts sharing vocabulary are nearer than unrelated ones"""
+        provider = HashingProvider(dimension=512)
+        query, related, unrelated = (np.array(v) for v in provider.embed_documents([
+            "When is the rent due?",
+            "Rent is due on the first day of each month.",
+            "This Agreement is governed by the laws of New York.",
+        ]))
+        assert np.dot(query, related) > np.dot(query, unrelated)
+
+    def test_create_provider_by_name(self):
+        """Test provider selection, declared settings and rejection of unknown names"""
+        provider = create_provider("hashing")
+        assert isinstance(provider, HashingProvider)
+        assert provider.describe()["model"] == f"hashing-{provider.dimension}"
+        assert provider.batch_size > 0 and provider.concurrency > 0
+        with pytest.raises(ValueError):
+            create_provider("word2vec")
+
+    def test_create_provider_with_dimension(self, monkeypatch):
+        """Test that a dimension given to create_provider reaches the request, not just the reported size"""
+        monkeypatch.setenv("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY", "sk-test"))
+        assert create_provider("hashing", dimension=64).dimension == 64
+        small = functools.partial(OpenAIProvider, model="text-embedding-3-small")
+        with patch.dict('embeddings.PROVIDERS', {"openai": small}):
+            provider = create_provider("openai", dimension=256)
+        assert provider.dimension == 256 and provider.params == {"dimensions": 256}
+
+    def test_openai_provider_declares_model_dimension(self, monkeypatch):
+        """Test that the OpenAI provider reports the native size of its model"""
+        monkeypatch.setenv("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY", "sk-test"))
+        assert OpenAIProvider().dimension == 1536
+        assert OpenAIProvider(model="text-embedding-3-large").dimension == 3072
+        assert OpenAIProvider(model="text-embedding-3-small", dimension=256).dimension == 256
+
+    def test_openai_cache_key_includes_reduced_dimension(self, monkeypatch):
+        """Test that vectors shortened via the dimensions parameter never share a cache key with full-size ones"""
+        monkeypatch.setenv("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY", "sk-test"))
+        monkeypatch.delenv("OPENAI_BASE_URL", raising=False)
+        assert OpenAIProvider(model="text-embedding-3-small").model == "text-embedding-3-small"
+        reduced = OpenAIProvider(model="text-embedding-3-small", dimension=256)
+        assert reduced.model == "text-embedding-3-small-256"
+        assert reduced.api_model == "text-embedding-3-small"
+        assert OpenAIProvider(model="text-embedding-ada-002", dimension=1536).model == "text-embedding-ada-002"
+
+    def test_openai_rejects_dimension_for_fixed_size_model(self, monkeypatch):
+        """Test that ada-002 can't be configured with a size it never returns"""
+        monkeypatch.setenv("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY", "sk-test"))
+        with pytest.raises(ValueError):
+            OpenAIProvider(model="text-embedding-ada-002", dimension=256)
+        native = OpenAIProvider(model="text-embedding-ada-002", dimension=1536)
+        assert native.dimension == 1536 and native.params == {}
+
+    def test_openai_cache_key_includes_base_url(self, monkeypatch):
+        """Test that vectors from another OpenAI-compatible endpoint are cached apart from OpenAI's"""
+        monkeypatch.setenv("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY", "sk-test"))
+        monkeypatch.delenv("OPENAI_BASE_URL", raising=False)
+        assert OpenAIProvider(model="text-embedding-3-small").model == "text-embedding-3-small"
+        monkeypatch.setenv("OPENAI_BASE_URL", "http://localhost:8100/v1")
+        provider = OpenAIProvider(model="text-embedding-3-small", dimension=256)
+        assert provider.model == "text-embedding-3-small-256@http://localhost:8100/v1"
+        assert provider.api_model == "text-embedding-3-small"
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,133 @@
+import pytest
+import os
+import sys
+from unittest.mock import Mock, patch
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import extraction
+from extraction import iter_pdf_pages, extraction_summary
+
+def mock_reader(page_texts):
+    """PdfReader stand-in whose pages return the given text layers"""
+    reader = Mock()
+    reader.is_encrypted = False
+    reader.pages = []
+    for text in page_texts:
+        page = Mock()
+        page.extract_text.return_value = text
+        reader.pages.append(page)
+    return reader
+
+def fake_ocr(texts, capacity=2):
+    """OcrQueue stand-in returning the given texts, recording the pages added and the order of events"""
+    class FakeOcrQueue:
+        added = []
+        events = []
+
+        def __init__(self, pdf_path):
+            self.pdf_path = pdf_path
+            self.pending = []
+
+        def add(self, page_numbers):
+            self.added.extend(page_numbers)
+            self.pending.extend(page_numbers)
+            self.events.append(("add", list(page_numbers)))
+
+        def full(self):
+            return len(self.pending) >= capacity
+
+        def ready(self, page_numbers):
+            return not page_numbers
+
+        def texts(self, page_numbers):
+            self.events.append(("texts", list(page_numbers)))
+            self.pending = [page for page in self.pending if page not in page_numbers]
+            return {page: texts.get(page, "") for page in page_numbers}
+
+        def close(self):
+            pass
+    return FakeOcrQueue
+
+def extract(contents):
+    """Extract every page, returning the combined text and the per-method summary"""
+    pages = list(iter_pdf_pages(contents))
+    return {
+        "text": "".join(page.text for page in pages),
+        "extraction": extraction_summary(len(pages), sum(page.ocr for page in pages)),
+    }
+
+@pytest.fixture(autouse=True)
+def inline_cpu_work():
+    """Run CPU-bound stages in-process so the PdfReader patch applies"""
+    with patch('executors.CPU_WORKERS', 0):
+        yield
+
+class TestHybridExtraction:
+    """Test per-page text layer / OCR selection"""
+
+    def test_text_layer_only(self):
+        """Test that fully digital PDFs never touch OCR"""
+        with patch('extraction.PdfReader', return_value=mock_reader(["Lease agreement page one. " * 3, "Rent terms and conditions. " * 3])), \
+             patch('extraction.OcrQueue', fake_ocr({})) as ocr_queue:
+            result = extract(b"%PDF-1.4")
+
+        assert ocr_queue.added == []
+        assert result["extraction"] == {"processing_method": "text_extraction", "pages_text_layer": 2, "pages_ocr": 0}
+
+    def test_only_scanned_pages_are_ocrd(self):
+        """Test that OCR runs just on pages with an empty or near-empty text layer"""
+        pages = ["Lease agreement page one. " * 3, "", "  3  ", "Signature page with full text layer."]
+        with patch('extraction.PdfReader', return_value=mock_reader(pages)), \
+             patch('extraction.OcrQueue', fake_ocr({2: "Exhibit A scanned text", 3: "Exhibit B scanned text"})) as ocr_queue:
+            result = extract(b"%PDF-1.4")
+
+        assert ocr_queue.added == [2, 3]
+        assert result["extraction"] == {"processing_method": "hybrid", "pages_text_layer": 2, "pages_ocr": 2}
+        assert result["text"].index("Lease agreement") < result["text"].index("Exhibit A") < result["text"].index("Signature page")
+
+    def test_fully_scanned_document(self):
+        """Test that a scanned document is reported as OCR"""
+        with patch('extraction.PdfReader', return_value=mock_reader(["", ""])), \
+             patch('extraction.OcrQueue', fake_ocr({1: "Page one", 2: "Page two"})):
+            result = extract(b"%PDF-1.4")
+
+        assert result["text"] == "Page one\nPage two\n"
+        assert result["extraction"]["processing_method"] == "ocr"
+
+    def test_no_text_anywhere(self):
+        """Test that a page OCR can't read either comes back empty, from the text layer"""
+        with patch('extraction.PdfReader', return_value=mock_reader([""])), \
+             patch('extraction.OcrQueue', fake_ocr({1: ""})):
+            pages = list(iter_pdf_pages(b"%PDF-1.4"))
+
+        assert [(page.number, page.text, page.ocr) for page in pages] == [(1, "", False)]
+
+    def test_ocr_overlaps_later_windows(self):
+        """Test that later windows are read while earlier scanned pages are still queued for OCR,
+        up to the queue's capacity, and pages still come out in order"""
+        pages = ["", "Full text layer on page two.", "", "Full text layer on page four.", "", ""]
+        reads = []
+
+        def read_text_layer(pdf_path, first, last):
+            reads.append(first)
+            assert os.path.exists(pdf_path)
+            return pages[first - 1:last]
+
+        with patch('extraction.read_text_layer', side_effect=read_text_layer), \
+             patch('extraction.count_pages', return_value=len(pages)), \
+             patch('extraction.OcrQueue', fake_ocr({1: "scan 1", 3: "scan 3", 5: "scan 5", 6: "scan 6"})) as ocr_queue:
+            extracted = []
+            for page in iter_pdf_pages(b"%PDF-1.4", window=2):
+                extracted.append(page)
+                reads.append(("yield", page.number))
+
+        assert [page.number for page in extracted] == [1, 2, 3, 4, 5, 6]
+        assert [page.ocr for page in extracted] == [True, False, True, False, True, True]
+        # Pages 1-2 wait for OCR while pages 3-4 are read; the queue is then full, so they're yielded
+        assert reads[:4] == [1, 3, ("yield", 1), ("yield", 2)]
+        assert ocr_queue.events[:3] == [("add", [1]), ("add", [3]), ("texts", [1])]
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,109 @@
+import pytest
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from auth_cache import TokenCache, UserCache
+from database import get_async_db, add_missing_indexes
+from models import Base, Document, User
+
+client = TestClient(app)
+HEADERS = {"Authorization": "Bearer token-1"}
+
+@pytest.fixture
+def history_db(tmp_path):
+    """A scratch database with 120 documents for u1 (some sharing an upload time) and a few for u2,
+    wired into the app's async session, recording the SQL it runs"""
+    path = tmp_path / "history.db"
+    engine = create_engine(f"sqlite:///{path}")
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    AsyncSession = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    statements = []
+    event.listen(async_engine.sync_engine, "before_cursor_execute", lambda conn, cursor, sql, *args: statements.append(sql))
+
+    start = datetime(2024, 1, 1)
+    with Session() as db:
+        db.add_all([User(id="u1", firebase_uid="firebase-1", email="a@example.com", credits=5, last_login=datetime.utcnow()),
+                    User(id="u2", firebase_uid="firebase-2", email="b@example.com", credits=5)])
+        db.add_all(Document(id=f"d{i:03d}", filename=f"f{i}", original_filename=f"doc-{i}.pdf", file_size=100,
+                            upload_date=start + timedelta(minutes=i // 3), user_id="u1", text_content="x" * 10_000)
+                   for i in range(120))
+        db.add_all(Document(id=f"other{i}", filename=f"o{i}", original_filename="other.pdf", file_size=7, user_id="u2")
+                   for i in range(3))
+        db.commit()
+
+    async def override_get_async_db():
+        async with AsyncSession() as db:
+            yield db
+
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    claims = {"uid": "firebase-1", "email": "a@example.com", "exp": time.time() + 3600}
+    with patch('main.firebase_auth.verify_id_token', return_value=claims), \
+            patch('main.token_cache', TokenCache()), patch('main.user_cache', UserCache()):
+        yield engine, statements
+    app.dependency_overrides.pop(get_async_db, None)
+
+class TestHistory:
+    """Test keyset-paginated document history"""
+
+    def test_pages_cover_history_in_order(self, history_db):
+        """Test that following next_cursor visits each of the user's documents once, newest first"""
+        pages = [client.get("/history/?limit=50", headers=HEADERS).json()]
+        while pages[-1]["next_cursor"]:
+            pages.append(client.get(f"/history/?limit=50&cursor={pages[-1]['next_cursor']}", headers=HEADERS).json())
+
+        assert [len(page["documents"]) for page in pages] == [50, 50, 20]
+        ids = [document["id"] for page in pages for document in page["documents"]]
+        assert ids == sorted((f"d{i:03d}" for i in range(120)), key=lambda id: (int(id[1:]) // 3, id), reverse=True)
+
+        summary = pages[0]["summary"]
+        assert (summary["total_documents"], summary["total_size_bytes"]) == (120, 12000)
+        assert summary["recent_documents"] == pages[0]["documents"][:5]
+        assert all(page["summary"] is None for page in pages[1:])
+
+    def test_reads_only_listed_columns(self, history_db):
+        """Test that a page is one projected query plus one aggregate query, never loading text_content"""
+        _, statements = history_db
+        client.get("/history/", headers=HEADERS)
+        queries = [sql for sql in statements if "FROM documents" in sql]
+        assert len(queries) == 2
+        assert not any("text_content" in sql for sql in queries)
+        assert any("count(documents.id)" in sql and "sum(documents.file_size)" in sql for sql in queries)
+
+    def test_rejects_bad_parameters(self, history_db):
+        """Test that malformed cursors and out-of-range limits are client errors"""
+        assert client.get("/history/?cursor=not-a-cursor", headers=HEADERS).status_code == 400
+        assert client.get("/history/?limit=0", headers=HEADERS).status_code == 400
+        assert client.get("/history/?limit=1000", headers=HEADERS).status_code == 400
+
+    def test_pages_use_composite_index(self, history_db):
+        """Test that the index is added to existing tables and serves the keyset query"""
+        engine, _ = history_db
+        with engine.begin() as conn:
+            conn.execute(text("DROP INDEX idx_documents_user_upload_date_id"))
+        with patch('database.engine', engine):
+            add_missing_indexes()
+        assert "idx_documents_user_upload_date_id" in {index["name"] for index in inspect(engine).get_indexes("documents")}
+
+        with engine.connect() as conn:
+            plan = conn.execute(text(
+                "EXPLAIN QUERY PLAN SELECT id FROM documents WHERE user_id = 'u1' "
+                "AND (upload_date, id) < ('2024-01-01 00:20:00', 'd060') ORDER BY upload_date DESC, id DESC LIMIT 51"
+            )).fetchall()
+        assert any("idx_documents_user_upload_date_id" in row[-1] for row in plan)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
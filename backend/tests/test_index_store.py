@@ -0,0 +1,163 @@
+import pytest
+import os
+import sys
+import threading
+from datetime import datetime
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+from index_store import IndexStore
+from document_registry import DocumentRegistry, estimate_document_bytes
+from chunk_store import ChunkStore, attach_chunk_store
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic embeddings so tests never call OpenAI"""
+
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0, float(i)] for i, text in enumerate(texts)]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0, 0.0]
+
+@pytest.fixture
+def index_store(tmp_path, monkeypatch):
+    """Index store rooted in a temporary directory"""
+    monkeypatch.setenv("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY", "sk-test"))
+    return IndexStore(str(tmp_path))
+
+@pytest.fixture
+def document():
+    """In-memory document entry as built by the upload endpoint"""
+    texts = ["First clause", "Second clause", "Third clause"]
+    chunks = ChunkStore.from_chunks(" ".join(texts), texts)
+    return {
+        "filename": "lease.pdf",
+        "vectorstore": attach_chunk_store(FAISS.from_texts(texts, FakeEmbeddings()), chunks),
+        "chunks": chunks,
+        "created_at": datetime(2024, 1, 1, 12, 0, 0),
+        "is_guest_upload": True
+    }
+
+class TestIndexStore:
+    """Test persisting and rehydrating document indexes"""
+
+    def test_save_and_load_round_trip(self, index_store, document):
+        """Test that a flushed document loads back with the same chunks and metadata"""
+        index_store.save("doc-1", document)
+        index_store.flush()
+
+        meta = index_store.load_meta("doc-1")
+        loaded = index_store.load_index("doc-1")
+
+        assert meta["filename"] == "lease.pdf"
+        assert meta["created_at"] == document["created_at"]
+        assert meta["is_guest_upload"] is True
+        assert list(loaded["chunks"]) == ["First clause", "Second clause", "Third clause"]
+        assert loaded["chunks"].text == "First clause Second clause Third clause"
+        assert loaded["vectorstore"].index.ntotal == 3
+        query = FakeEmbeddings().embed_documents(["First clause", "Second clause"])[1]
+        assert loaded["vectorstore"].similarity_search_by_vector(query, k=1)[0].page_content == "Second clause"
+        # Saved without a keyword index, so it's rebuilt from the chunks
+        assert loaded["keywords"].scores(["second"]).argmax() == 1
+
+    def test_load_missing_document(self, index_store):
+        """Test that unknown documents return None"""
+        assert index_store.load_meta("missing") is None
+        assert index_store.load_index("missing") is None
+
+    def test_rejects_unsafe_ids(self, index_store, document):
+        """Test that path traversal IDs are never written or read"""
+        index_store.save("../escape", document)
+        index_store.flush()
+
+        assert index_store.load_meta("..") is None
+        assert not os.path.exists(os.path.join(index_store.root, "..", "escape"))
+
+    def test_delete_and_iter_metadata(self, index_store, document):
+        """Test that deleted documents disappear from the metadata listing"""
+        index_store.save("doc-1", document)
+        index_store.save("doc-2", document)
+        index_store.flush()
+
+        assert sorted(doc_id for doc_id, _ in index_store.iter_metadata()) == ["doc-1", "doc-2"]
+
+        index_store.delete("doc-1")
+
+        assert [doc_id for doc_id, _ in index_store.iter_metadata()] == ["doc-2"]
+
+    def test_shared_index_kept_until_last_alias_deleted(self, index_store, document):
+        """Test that documents with the same content hash share one index on disk"""
+        document["content_hash"] = "a" * 64
+        index_store.save("doc-1", document)
+        index_store.save("doc-2", document)
+        index_store.flush()
+
+        assert index_store.load_meta("doc-2")["content_hash"] == "a" * 64
+
+        index_store.delete("doc-1")
+        assert index_store.has_index("a" * 64)
+
+        index_store.delete("doc-2")
+        assert not index_store.has_index("a" * 64)
+
+    def test_shared_index_kept_for_alias_still_queued(self, index_store, document):
+        """Test that deleting a document keeps the shared index when another alias's metadata isn't written yet"""
+        document["content_hash"] = "b" * 64
+        index_store.save("doc-1", document)
+        index_store.flush()
+
+        # Hold up the writer thread so doc-2's metadata is still queued during the delete
+        gate = threading.Event()
+        index_store._executor.submit(gate.wait)
+        index_store.save("doc-2", document)
+        threading.Timer(0.2, gate.set).start()
+        index_store.delete("doc-1")
+
+        assert index_store.has_index("b" * 64)
+        assert index_store.load_meta("doc-2")["content_hash"] == "b" * 64
+
+    def test_alias_counts_rebuilt_at_startup(self, index_store, document):
+        """Test that a restarted store knows a shared index's aliases without rescanning metadata on delete"""
+        document["content_hash"] = "c" * 64
+        index_store.save("doc-1", document)
+        index_store.save("doc-2", document)
+        index_store.flush()
+
+        restarted = IndexStore(index_store.root)
+        with patch.object(IndexStore, 'iter_metadata', side_effect=AssertionError("metadata rescanned")):
+            restarted.delete("doc-1")
+            assert restarted.has_index("c" * 64)
+            restarted.delete("doc-2")
+        assert not restarted.has_index("c" * 64)
+
+    def test_evicted_while_write_queued_still_loads(self, index_store, document):
+        """Test that a document evicted before its queued write ran is loaded back, not lost"""
+        # Hold up the writer thread so both documents' writes stay queued
+        gate = threading.Event()
+        index_store._executor.submit(gate.wait)
+        index_store.save("doc-1", document)
+        index_store.save("doc-2", document)
+
+        def load(document_id):
+            meta = index_store.load_meta(document_id)
+            return None if meta is None else {**index_store.load_index(document_id), "filename": meta["filename"]}
+
+        registry = DocumentRegistry(load=load, persisted=lambda document_id, doc: index_store.is_persisted(document_id, document_id),
+                                    max_bytes=estimate_document_bytes(document) + 1)
+        registry.put("doc-1", document)
+        registry.put("doc-2", document)
+        assert "doc-1" not in registry
+
+        threading.Timer(0.2, gate.set).start()
+        loaded = registry.get("doc-1")
+
+        assert loaded is not None
+        assert loaded["filename"] == "lease.pdf"
+        assert list(loaded["chunks"]) == ["First clause", "Second clause", "Third clause"]
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,121 @@
+import pytest
+import os
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+import numpy as np
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embeddings import BatchedEmbeddings, HashingProvider
+from extraction import ExtractedPage, ExtractionError, StreamingChunker, chunk_text
+from ingest_pipeline import stream_pdf
+
+PAGES = [
+    "".join(f"Clause {n}.{i}: the tenant shall comply with obligation {n * 10 + i} of this lease. " for i in range(1, 25)) + "\n"
+    for n in range(1, 11)
+]
+
+def fake_pages(texts):
+    """Stand-in for iter_pdf_pages yielding the given page texts"""
+    return lambda contents, on_progress=None: (ExtractedPage(n, text, False) for n, text in enumerate(texts, start=1))
+
+@pytest.fixture(autouse=True)
+def inline_cpu_work():
+    """Run CPU-bound stages in-process"""
+    with patch('executors.CPU_WORKERS', 0):
+        yield
+
+class TestStreamingIngestion:
+    """Test the page-by-page extract, chunk, embed and index pipeline"""
+
+    def test_streamed_chunks_cover_the_text(self):
+        """Test that chunking page by page gives in-order, bounded slices covering all of the text"""
+        chunker = StreamingChunker(chunk_size=200, chunk_overlap=40)
+        spans = [span for page in PAGES for span in chunker.feed(page)] + chunker.finish()
+        text = chunker.text
+
+        assert all(text[start:end] == chunk and len(chunk) <= 200 for start, end, chunk in spans)
+        assert not text[:spans[0][0]].strip() and not text[spans[-1][1]:].strip()
+        for (start, end, _), (next_start, _, _) in zip(spans, spans[1:]):
+            assert start < next_start and not text[end:next_start].strip()
+        assert abs(len(spans) - len(chunk_text(text, 200, 40))) <= len(PAGES)
+
+    def test_builds_searchable_document(self):
+        """Test that the finished document has every chunk indexed in order with its keyword index"""
+        embeddings = HashingProvider(dimension=256)
+        with patch('ingest_pipeline.iter_pdf_pages', fake_pages(PAGES)):
+            document = stream_pdf(b"%PDF-1.4", embeddings)
+
+        assert len(document["chunks"]) > len(PAGES)
+        assert document["vectorstore"].index.ntotal == len(document["chunks"])
+        assert document["pages"] == 10
+        assert document["extraction"]["processing_method"] == "text_extraction"
+        query = embeddings.embed_query(document["chunks"][3])
+        assert document["vectorstore"].similarity_search_by_vector(query, k=1)[0].page_content == document["chunks"][3]
+
+    def test_partial_snapshots_are_published_as_pages_arrive(self):
+        """Test that snapshots come after the first pages and each doubling, and stay frozen afterwards"""
+        partials = []
+        with patch('ingest_pipeline.iter_pdf_pages', fake_pages(PAGES)):
+            document = stream_pdf(b"%PDF-1.4", HashingProvider(dimension=64), on_partial=partials.append, first_pages=2)
+
+        assert [partial["pages_indexed"] for partial in partials] == [2, 4, 8]
+        sizes = [partial["vectorstore"].index.ntotal for partial in partials]
+        assert sizes == sorted(sizes) and sizes[-1] < document["vectorstore"].index.ntotal
+        assert all(partial["vectorstore"].index.ntotal == len(partial["chunks"]) for partial in partials)
+        assert list(partials[0]["chunks"]) == list(document["chunks"])[:sizes[0]]
+        assert partials[0]["keywords"].scores(["tenant"]).max() > 0
+
+    def test_embedding_batches_overlap(self):
+        """Test that streamed chunk groups are embedded concurrently, up to the provider's concurrency,
+        and still indexed in chunk order"""
+        class SlowProvider(HashingProvider):
+            def __init__(self):
+                super().__init__(dimension=64, batch_size=256, concurrency=4)
+                self.active = self.peak = 0
+                self.lock = threading.Lock()
+
+            def embed_documents(self, texts):
+                with self.lock:
+                    self.active += 1
+                    self.peak = max(self.peak, self.active)
+                time.sleep(0.02)
+                with self.lock:
+                    self.active -= 1
+                return super().embed_documents(texts)
+
+        provider = SlowProvider()
+        with patch('ingest_pipeline.iter_pdf_pages', fake_pages(PAGES)), patch('ingest_pipeline.STREAMING_EMBED_CHUNKS', 4):
+            document = stream_pdf(b"%PDF-1.4", BatchedEmbeddings(provider))
+
+        assert 1 < provider.peak <= 4
+        chunks = list(document["chunks"])
+        indexed = document["vectorstore"].index.reconstruct_n(0, len(chunks))
+        assert np.allclose(indexed, np.asarray(provider.embed_documents(chunks), dtype=np.float32))
+
+    def test_failed_consumer_does_not_strand_producer(self):
+        """Test that the extraction thread exits when ingestion fails with the page queue full"""
+        def fail(partial):
+            raise RuntimeError("publish failed")
+
+        with patch('ingest_pipeline.iter_pdf_pages', fake_pages(PAGES[:3])), patch('ingest_pipeline.EXTRACTION_WINDOW_PAGES', 1):
+            with pytest.raises(RuntimeError):
+                stream_pdf(b"%PDF-1.4", HashingProvider(dimension=64), on_partial=fail, first_pages=1)
+
+        deadline = time.monotonic() + 5
+        while any(thread.name == "pdf-extraction" for thread in threading.enumerate()) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert not any(thread.name == "pdf-extraction" for thread in threading.enumerate())
+
+    def test_no_text_raises(self):
+        """Test that a document without any text fails with an extraction error"""
+        with patch('ingest_pipeline.iter_pdf_pages', fake_pages(["", "  \n"])):
+            with pytest.raises(ExtractionError):
+                stream_pdf(b"%PDF-1.4", HashingProvider(dimension=64))
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,106 @@
+import pytest
+import os
+import sys
+import threading
+import time
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jobs import JobQueue, QueueFullError, PRIORITY_USER, PRIORITY_GUEST
+
+def wait_for(queue, job_id, timeout=5.0):
+    """Poll a job until it finishes"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in ("completed", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+class TestJobQueue:
+    """Test the background ingestion job queue"""
+
+    def test_job_completes_with_progress(self):
+        """Test that a job runs in the background and can report progress"""
+        queue = JobQueue(workers=1, max_depth=10, name="test")
+        seen = []
+
+        def work(job):
+            queue.update(job["id"], progress="embedding")
+            seen.append(queue.get(job["id"])["progress"])
+
+        job = queue.submit(work, document_id="doc-1")
+        finished = wait_for(queue, job["id"])
+
+        assert finished["status"] == "completed"
+        assert seen == ["embedding"]
+        assert queue.job_for_document("doc-1")["id"] == job["id"]
+        queue.shutdown()
+
+    def test_failed_job_records_error(self):
+        """Test that exceptions mark the job as failed"""
+        queue = JobQueue(workers=1, max_depth=10, name="test")
+
+        def work(job):
+            raise ValueError("OCR exploded")
+
+        finished = wait_for(queue, queue.submit(work)["id"])
+
+        assert finished["status"] == "failed"
+        assert finished["error"] == "OCR exploded"
+        assert queue.stats()["failed"] == 1
+        queue.shutdown()
+
+    def test_user_lane_served_before_guest_lane(self):
+        """Test that authenticated uploads jump ahead of queued guest uploads"""
+        queue = JobQueue(workers=1, max_depth=10, name="test")
+        gate = threading.Event()
+        order = []
+
+        queue.submit(lambda job: gate.wait(5))
+        time.sleep(0.05)  # let the worker pick up the blocking job
+        guest = queue.submit(lambda job: order.append("guest"), priority=PRIORITY_GUEST)
+        user = queue.submit(lambda job: order.append("user"), priority=PRIORITY_USER)
+        assert queue.stats()["lanes"]["guest"]["depth"] == 1
+        gate.set()
+        wait_for(queue, guest["id"])
+        wait_for(queue, user["id"])
+
+        assert order == ["user", "guest"]
+        queue.shutdown()
+
+    def test_queue_depth_is_bounded(self):
+        """Test that submissions beyond max_depth are rejected"""
+        queue = JobQueue(workers=1, max_depth=1, name="test")
+        gate = threading.Event()
+        queue.submit(lambda job: gate.wait(5))
+        time.sleep(0.05)  # let the worker pick up the first job
+        queue.submit(lambda job: None)
+
+        with pytest.raises(QueueFullError):
+            queue.submit(lambda job: None)
+        gate.set()
+        queue.shutdown()
+
+    def test_shutdown_cancels_queued_jobs(self):
+        """Test that jobs still waiting at shutdown are failed and their cancel handler runs"""
+        queue = JobQueue(workers=1, max_depth=10, name="test")
+        gate = threading.Event()
+        cancelled = []
+        queue.submit(lambda job: gate.wait(5))
+        time.sleep(0.05)
+        waiting = queue.submit(lambda job: None, on_cancel=lambda job: cancelled.append(job["id"]))
+
+        stopper = threading.Thread(target=queue.shutdown)
+        stopper.start()
+        time.sleep(0.05)  # shutdown drains the queue while the first job is still running
+        gate.set()
+        stopper.join()
+
+        assert cancelled == [waiting["id"]]
+        assert queue.get(waiting["id"])["status"] == "failed"
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,83 @@
+import pytest
+import os
+import sys
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+from main import app, get_current_user
+
+client = TestClient(app)
+
+class FakeEmbeddings(Embeddings):
+    """Embeddings that place texts mentioning subletting close to the query"""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [1.0 if "sublet" in text.lower() else 0.0, float(len(text)) / 100]
+
+def make_doc(filename, texts, content_hash):
+    return {"filename": filename, "vectorstore": FAISS.from_texts(texts, FakeEmbeddings()), "content_hash": content_hash}
+
+@pytest.fixture
+def library():
+    """Three documents owned by the signed-in user, one of which is unavailable"""
+    docs = {
+        "lease-a": make_doc("lease-a.pdf", ["Tenant may sublet with consent.", "Rent is $900."], "hash-a"),
+        "lease-b": make_doc("lease-b.pdf", ["Subletting is prohibited.", "Parking space included."], "hash-b"),
+    }
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="user-1")
+    with patch('main.get_user_document_ids', return_value=["lease-a", "lease-b", "expired"]) as ids, \
+            patch('main.get_document_store', side_effect=docs.get), \
+            patch('main.get_embeddings', return_value=FakeEmbeddings()):
+        yield ids
+    app.dependency_overrides.clear()
+
+def chat_response(text):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+class TestLibraryQuery:
+    """Test querying across a user's documents"""
+
+    def test_single_llm_call_with_merged_citations(self, library):
+        """Test that chunks from every document are merged by score and sent in one call with source tags"""
+        create = AsyncMock(return_value=chat_response("lease-a.pdf allows subletting [1]; lease-b.pdf forbids it [2]."))
+        with patch('main.client.chat.completions.create', create):
+            response = client.post("/library/query", json={"query": "Which leases allow subletting?"})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert create.call_count == 1
+        assert data["documents_searched"] == 2
+        assert data["missing_documents"] == ["expired"]
+
+        sources = data["sources"]
+        assert [source["citation"] for source in sources] == list(range(1, len(sources) + 1))
+        assert {source["document_id"] for source in sources[:2]} == {"lease-a", "lease-b"}
+        assert [source["score"] for source in sources] == sorted(source["score"] for source in sources)
+
+        messages = create.call_args.kwargs["messages"]
+        assert "[1] " in messages[1]["content"] and "lease-b.pdf" in messages[1]["content"]
+        assert "Cite the sources" in messages[0]["content"]
+
+    def test_explicit_document_ids_are_passed_through(self, library):
+        """Test that a requested subset is resolved against the user's documents"""
+        with patch('main.client.chat.completions.create', AsyncMock(return_value=chat_response("ok"))):
+            client.post("/library/query", json={"query": "Parking?", "document_ids": ["lease-b"]})
+        assert library.call_args.args[1:3] == ("user-1", ["lease-b"])
+
+    def test_no_documents(self, library):
+        """Test that a user with no processed documents gets a 404"""
+        library.return_value = []
+        response = client.post("/library/query", json={"query": "Anything?"})
+        assert response.status_code == 404
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,77 @@
+import pytest
+import os
+import sys
+import time
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import MetricsRegistry, Counter, Histogram, CallbackMetric, STAGE_SECONDS, ERRORS, timed
+
+class TestMetrics:
+    """Test the Prometheus-style metrics and the /metrics endpoint"""
+
+    def test_histogram_renders_cumulative_buckets(self):
+        """Test that observations land in cumulative le buckets with their sum and count"""
+        registry = MetricsRegistry()
+        histogram = Histogram("stage_seconds", "Stage latency", ["stage"], buckets=[0.1, 1.0], registry=registry)
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe(value, "embed_batch")
+
+        lines = registry.render().splitlines()
+        assert lines[:2] == ["# HELP stage_seconds Stage latency", "# TYPE stage_seconds histogram"]
+        assert lines[2:] == [
+            'stage_seconds_bucket{stage="embed_batch",le="0.1"} 1',
+            'stage_seconds_bucket{stage="embed_batch",le="1"} 3',
+            'stage_seconds_bucket{stage="embed_batch",le="+Inf"} 4',
+            'stage_seconds_sum{stage="embed_batch"} 6.05',
+            'stage_seconds_count{stage="embed_batch"} 4',
+        ]
+
+    def test_counters_and_callbacks(self):
+        """Test labelled counters, escaping, and callback metrics read at scrape time"""
+        registry = MetricsRegistry()
+        queries = Counter("queries_total", "Queries", ["endpoint"], registry=registry)
+        queries.inc("stream")
+        queries.inc("stream")
+        queries.inc('say "hi"')
+        state = {"documents": 3}
+        CallbackMetric("documents", "Documents in memory", lambda: state["documents"], registry=registry)
+        state["documents"] = 4
+
+        text = registry.render()
+        assert 'queries_total{endpoint="stream"} 2' in text
+        assert 'queries_total{endpoint="say \\"hi\\""} 1' in text
+        assert "# TYPE documents gauge\ndocuments 4\n" in text
+
+    def test_timed_counts_errors(self):
+        """Test that a timed stage is observed whether or not it fails, and failures are counted"""
+        count, errors = STAGE_SECONDS.count("db_write"), ERRORS.value("db_write")
+        with timed("db_write"):
+            pass
+        with pytest.raises(RuntimeError):
+            with timed("db_write"):
+                raise RuntimeError("database is locked")
+        assert STAGE_SECONDS.count("db_write") == count + 2
+        assert ERRORS.value("db_write") == errors + 1
+
+    def test_observe_is_cheap(self):
+        """Test that recording an observation stays in the low microseconds"""
+        histogram = Histogram("hot_path_seconds", "Hot path", ["stage"], registry=None)
+        started = time.perf_counter()
+        for _ in range(100000):
+            histogram.observe(0.003, "similarity_search")
+        assert (time.perf_counter() - started) / 100000 < 20e-6
+
+    def test_metrics_endpoint(self, test_client):
+        """Test that /metrics serves every family in the Prometheus text format"""
+        response = test_client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        for family in ("legal_lens_stage_duration_seconds", "legal_lens_queries_total", "legal_lens_cache_hits_total",
+                       "legal_lens_documents_in_memory", "legal_lens_document_memory_bytes"):
+            assert f"# TYPE {family} " in response.text
+        assert 'legal_lens_cache_hits_total{cache="answer"}' in response.text
+
+if __name__ == "__main__":
+    pytest.main([__file__])
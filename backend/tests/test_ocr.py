@@ -0,0 +1,83 @@
+import pytest
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ocr
+
+def fake_render(pdf_path, dpi, first_page, last_page):
+    """Stand-in for pdf2image that returns one mock image per requested page"""
+    images = []
+    for page in range(first_page, last_page + 1):
+        image = Mock()
+        image.page = page
+        images.append(image)
+    return images
+
+class TestOCR:
+    """Test windowed OCR extraction"""
+
+    def test_windows_group_consecutive_pages(self):
+        """Test that pages are grouped into bounded runs of consecutive pages"""
+        assert ocr._windows([1, 2, 3, 4, 5, 7, 8, 10], 2) == [(1, 2), (3, 4), (5, 5), (7, 8), (10, 10)]
+
+    def test_pages_rendered_in_windows_and_reassembled_in_order(self):
+        """Test that only one window is rendered at a time and text comes back in page order"""
+        with patch('ocr.convert_from_path', side_effect=fake_render) as mock_render, \
+             patch('ocr.pdfinfo_from_path', return_value={"Pages": 5}), \
+             patch('ocr.pytesseract.image_to_string', side_effect=lambda image, lang: f"page {image.page}"):
+            texts = ocr.ocr_pages(b"%PDF-1.4", workers=1, window=2)
+
+        assert texts == {1: "page 1", 2: "page 2", 3: "page 3", 4: "page 4", 5: "page 5"}
+        assert [call.kwargs["last_page"] - call.kwargs["first_page"] + 1 for call in mock_render.call_args_list] == [2, 2, 1]
+
+    def test_failed_page_does_not_abort_document(self):
+        """Test that a page tesseract can't read is skipped, not fatal"""
+        def flaky(image, lang):
+            if image.page == 2:
+                raise RuntimeError("tesseract crashed")
+            return f"page {image.page}"
+
+        with patch('ocr.convert_from_path', side_effect=fake_render), \
+             patch('ocr.pytesseract.image_to_string', side_effect=flaky):
+            texts = ocr.ocr_pages(b"%PDF-1.4", page_numbers=[1, 2, 3], workers=1)
+
+        assert texts == {1: "page 1", 2: "", 3: "page 3"}
+
+    def test_queue_bounds_windows_in_flight_across_adds(self):
+        """Test that windows added in separate calls run together, never more than two per worker"""
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+
+        def slow_window(pdf_path, first_page, last_page, dpi, lang):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+            return [(page, f"page {page}", None, 0.0) for page in range(first_page, last_page + 1)]
+
+        with ThreadPoolExecutor(max_workers=8) as pool, \
+                patch('ocr.process_pool', return_value=pool), patch('ocr._ocr_window', side_effect=slow_window):
+            queue = ocr.OcrQueue("document.pdf", workers=2, window=1)
+            queue.add([1, 2, 3])
+            queue.add([5, 6, 7, 8])
+            assert queue.full()
+            texts = queue.texts([5, 6])
+            rest = queue.texts([1, 2, 3, 7, 8])
+            queue.close()
+
+        assert texts == {5: "page 5", 6: "page 6"}
+        assert rest == {1: "page 1", 2: "page 2", 3: "page 3", 7: "page 7", 8: "page 8"}
+        assert 1 < peak[0] <= 4
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,80 @@
+import pytest
+import os
+import sys
+import random
+import time
+import numpy as np
+from fastapi.testclient import TestClient
+from openai import OpenAI, APIStatusError
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embeddings import HashingProvider, OpenAIProvider
+from loadtest.openai_server import LatencyModel, StandInConfig, create_app
+
+def openai_client(config):
+    """The real OpenAI SDK talking to the stand-in app in-process"""
+    app = create_app(config)
+    return OpenAI(api_key="sk-local", base_url="http://testserver/v1", max_retries=0,
+                  http_client=TestClient(app)), app
+
+MESSAGES = [{"role": "system", "content": "Context: the rent is due on the first day of each month."},
+            {"role": "user", "content": "When is rent due?"}]
+
+class TestOpenAIStandIn:
+    """Test the local OpenAI-compatible server used for load tests"""
+
+    def test_chat_completion(self):
+        """Test a non-streaming completion with the configured answer length"""
+        client, _ = openai_client(StandInConfig(tokens_per_second=0, completion_tokens=12))
+        response = client.chat.completions.create(model="gpt-4", messages=MESSAGES)
+        assert len(response.choices[0].message.content.split()) == 12
+        assert response.usage.completion_tokens == 12
+
+    def test_streamed_tokens_follow_the_token_rate(self):
+        """Test that a stream delivers every token, paced by tokens per second"""
+        client, app = openai_client(StandInConfig(tokens_per_second=100, completion_tokens=20))
+        started = time.perf_counter()
+        stream = client.chat.completions.create(model="gpt-4", messages=MESSAGES, stream=True)
+        tokens = [chunk.choices[0].delta.content for chunk in stream if chunk.choices and chunk.choices[0].delta.content]
+        assert len(tokens) == 20
+        assert time.perf_counter() - started >= 0.19
+        assert TestClient(app).get("/stats").json()["completion_tokens"] == 20
+
+    def test_embeddings_match_the_hashing_provider(self):
+        """Test that embeddings (base64-encoded by the SDK) decode to the hashing provider's vectors"""
+        client, _ = openai_client(StandInConfig())
+        response = client.embeddings.create(model="text-embedding-3-small", input=["rent is due", "late fee"],
+                                            dimensions=64)
+        expected = HashingProvider(dimension=64).embed_documents(["rent is due", "late fee"])
+        assert np.allclose([item.embedding for item in response.data], expected, atol=1e-6)
+
+    def test_openai_provider_sends_one_request_per_batch(self):
+        """Test that the backend's embedding provider works against the stand-in, batch by batch"""
+        client, app = openai_client(StandInConfig())
+        provider = OpenAIProvider(model="text-embedding-3-small", dimension=32, batch_size=2)
+        provider.client = client
+        texts = [f"clause {i}" for i in range(5)]
+        assert np.allclose(provider.embed_documents(texts), HashingProvider(dimension=32).embed_documents(texts), atol=1e-6)
+        assert TestClient(app).get("/stats").json()["embeddings"] == 3
+
+    def test_injected_errors(self):
+        """Test that error injection returns OpenAI-style error responses"""
+        client, _ = openai_client(StandInConfig(error_rate=1.0, error_statuses=[429]))
+        with pytest.raises(APIStatusError) as error:
+            client.chat.completions.create(model="gpt-4", messages=MESSAGES)
+        assert error.value.status_code == 429
+
+    def test_latency_distributions(self):
+        """Test that sampled latencies follow the configured distribution"""
+        rng = random.Random(0)
+        assert LatencyModel("constant", 200).sample(rng) == 0.2
+        samples = [LatencyModel("lognormal", 300, 0.5).sample(rng) for _ in range(2000)]
+        assert sorted(samples)[1000] == pytest.approx(0.3, rel=0.1)
+        assert all(0.1 <= LatencyModel("uniform", 200, 100).sample(rng) <= 0.3 for _ in range(100))
+        with pytest.raises(ValueError):
+            LatencyModel("pareto")
+
+if __name__ == "__main__":
+    pytest.main([__file__])
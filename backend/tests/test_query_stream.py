@@ -0,0 +1,118 @@
+import pytest
+import os
+import sys
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+from fastapi.testclient import TestClient
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import app
+from answer_cache import AnswerCache
+
+client = TestClient(app)
+
+def make_chunk(content):
+    """Build a streamed chat completion chunk carrying one token"""
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+async def fake_stream(tokens, error=None):
+    for token in tokens:
+        yield make_chunk(token)
+    if error:
+        raise error
+
+def parse_events(body):
+    """Split an SSE body into (event, data) pairs"""
+    events = []
+    for message in body.strip().split("\n\n"):
+        event = "message"
+        data = None
+        for line in message.split("\n"):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+        events.append((event, data))
+    return events
+
+@pytest.fixture
+def document():
+    """An in-memory document whose vector store returns one chunk"""
+    vectorstore = Mock()
+    vectorstore.similarity_search_with_score.return_value = [(SimpleNamespace(page_content="Rent is $1000."), 0.1)]
+    doc = {"filename": "lease.pdf", "text": "Rent is $1000.", "vectorstore": vectorstore}
+    with patch('main.get_document_store', return_value=doc), patch('main.answer_cache', AnswerCache()):
+        yield doc
+
+class TestQueryStream:
+    """Test the streaming query endpoint"""
+
+    def test_streams_tokens_then_done(self, document):
+        """Test that tokens arrive as separate events and the final answer is saved with both latencies"""
+        create = AsyncMock(return_value=fake_stream(["Rent ", "is ", "$1000", None]))
+        with patch('main.client.chat.completions.create', create), patch('main.record_query') as record:
+            response = client.post("/query/doc-1/stream", json={"query": "What is the rent?"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = parse_events(response.text)
+        assert [data["token"] for event, data in events if event == "message"] == ["Rent ", "is ", "$1000"]
+
+        event, done = events[-1]
+        assert event == "done"
+        assert done["answer"] == "Rent is $1000"
+        assert done["time_to_first_token_ms"] <= done["response_time_ms"]
+        assert create.call_args.kwargs["stream"] is True
+
+        document_id, query_text, answer, response_time_ms, first_token_ms = record.call_args.args
+        assert (document_id, query_text, answer) == ("doc-1", "What is the rent?", "Rent is $1000")
+        assert (response_time_ms, first_token_ms) == (done["response_time_ms"], done["time_to_first_token_ms"])
+
+    def test_stream_failure_sends_error_event(self, document):
+        """Test that an error mid-stream is reported as an error event and nothing is saved"""
+        create = AsyncMock(return_value=fake_stream(["Rent "], error=RuntimeError("connection reset")))
+        with patch('main.client.chat.completions.create', create), patch('main.record_query') as record:
+            response = client.post("/query/doc-1/stream", json={"query": "What is the rent?"})
+
+        event, data = parse_events(response.text)[-1]
+        assert event == "error"
+        assert "connection reset" in data["detail"]
+        record.assert_not_called()
+
+    def test_repeated_query_served_from_cache(self, document):
+        """Test that asking the same question again skips OpenAI and is saved as a cache hit"""
+        create = AsyncMock(side_effect=lambda **kwargs: fake_stream(["Rent ", "is ", "$1000"]))
+        with patch('main.client.chat.completions.create', create), patch('main.record_query') as record:
+            client.post("/query/doc-1/stream", json={"query": "What is the rent?"})
+            response = client.post("/query/doc-1/stream", json={"query": "what is the rent"})
+
+        events = parse_events(response.text)
+        assert events[0] == ("message", {"token": "Rent is $1000"})
+        event, done = events[-1]
+        assert event == "done" and done["cache_hit"] is True
+        assert create.call_count == 1
+        assert record.call_args.args[-1] is True
+
+    def test_partial_document_answers_not_cached(self, document):
+        """Test that answers from a partial snapshot are never cached, as later pages may change them"""
+        document["partial"] = True
+        create = AsyncMock(side_effect=lambda **kwargs: fake_stream(["Rent ", "is ", "$1000"]))
+        with patch('main.client.chat.completions.create', create), patch('main.record_query'):
+            client.post("/query/doc-1/stream", json={"query": "What is the rent?"})
+            response = client.post("/query/doc-1/stream", json={"query": "What is the rent?"})
+
+        event, done = parse_events(response.text)[-1]
+        assert event == "done" and done["cache_hit"] is False
+        assert create.call_count == 2
+
+    def test_unknown_document_returns_404(self):
+        """Test that a missing document fails before the stream starts"""
+        with patch('main.get_document_store', return_value=None):
+            response = client.post("/query/missing/stream", json={"query": "What is the rent?"})
+        assert response.status_code == 404
+
+if __name__ == "__main__":
+    pytest.main([__file__])
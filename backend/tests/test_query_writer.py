@@ -0,0 +1,102 @@
+import pytest
+import os
+import sys
+import time
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, DocumentQuery
+from query_writer import QueryWriter, BATCH_ROWS
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Sessions on a scratch SQLite database, recording each INSERT statement's row count"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'queries.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    inserts = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, sql, params, context, many:
+                 inserts.append(len(params) if many else 1) if sql.startswith("INSERT") else None)
+    Session = sessionmaker(bind=engine)
+    Session.inserts = inserts
+    return Session
+
+def count_queries(Session):
+    with Session() as db:
+        return db.query(DocumentQuery).count()
+
+class TestQueryWriter:
+    """Test write-behind batching of query history"""
+
+    def test_batches_by_size(self, session_factory):
+        """Test that a full batch is written at once as one bulk insert"""
+        writer = QueryWriter(session_factory, batch_size=10, interval=60)
+        batches = BATCH_ROWS.count()
+        for i in range(25):
+            assert writer.submit("doc-1", f"question {i}", "answer", response_time_ms=5)
+        deadline = time.time() + 5
+        while count_queries(session_factory) < 20 and time.time() < deadline:
+            time.sleep(0.01)
+
+        assert count_queries(session_factory) == 20
+        assert session_factory.inserts == [10, 10]
+        assert writer.stats()["pending"] == 5
+        writer.shutdown()
+        assert count_queries(session_factory) == 25
+        assert BATCH_ROWS.count() == batches + 3
+
+    def test_batches_by_interval(self, session_factory):
+        """Test that a partial batch is written once its oldest row has waited the interval"""
+        writer = QueryWriter(session_factory, batch_size=100, interval=0.05)
+        writer.submit("doc-1", "question", "answer", time_to_first_token_ms=3, cache_hit=True)
+        deadline = time.time() + 5
+        while count_queries(session_factory) < 1 and time.time() < deadline:
+            time.sleep(0.01)
+
+        with session_factory() as db:
+            row = db.query(DocumentQuery).one()
+        assert (row.query_text, row.time_to_first_token_ms, row.cache_hit) == ("question", 3, True)
+        writer.shutdown()
+
+    def test_overflow_and_shutdown_return_rows_to_caller(self, session_factory):
+        """Test that submit refuses rows when the buffer is full or the writer has stopped"""
+        writer = QueryWriter(session_factory, batch_size=100, interval=60, max_pending=2)
+        assert writer.submit("doc-1", "q1", "a") and writer.submit("doc-1", "q2", "a")
+        assert not writer.submit("doc-1", "q3", "a")
+        writer.shutdown()
+        assert not writer.submit("doc-1", "q4", "a")
+        assert count_queries(session_factory) == 2
+        assert writer.stats()["overflow"] == 2
+
+    def test_failed_batch_retried_row_by_row(self, session_factory):
+        """Test that one bad row doesn't lose the rest of its batch"""
+        writer = QueryWriter(session_factory, batch_size=100, interval=60)
+        writer.submit("doc-1", "good", "answer")
+        writer.submit("doc-1", None, "answer")  # query_text is NOT NULL
+        writer.submit("doc-1", "also good", "answer")
+        assert writer.flush(timeout=5)
+
+        assert count_queries(session_factory) == 2
+        assert (writer.stats()["written"], writer.stats()["failed"]) == (2, 1)
+        writer.shutdown()
+
+    def test_query_response_does_not_wait_for_database(self, session_factory):
+        """Test that recording a query only buffers it"""
+        import asyncio
+        import main
+
+        writer = QueryWriter(session_factory, batch_size=100, interval=60)
+        with patch('main.query_writer', writer), patch('main.AsyncSessionLocal') as sessions:
+            asyncio.run(main.record_query("doc-1", "question", "answer", 12))
+        sessions.assert_not_called()
+        assert count_queries(session_factory) == 0
+        writer.shutdown()
+        assert count_queries(session_factory) == 1
+
+if __name__ == "__main__":
+    pytest.main([__file__])
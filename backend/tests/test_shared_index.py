@@ -0,0 +1,132 @@
+import pytest
+import os
+import sys
+import time
+import faiss
+import numpy as np
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+from shared_index import SharedVectorIndex, ContentFreedError
+from index_store import IndexStore
+from chunk_store import ChunkStore, attach_chunk_store
+from dedup import ContentIndex
+from utils import save_faiss_index
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic embeddings so tests never call OpenAI"""
+
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0, float(i)] for i, text in enumerate(texts)]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0, 0.0]
+
+def make_vectorstore(texts):
+    """Per-document FAISS store with its chunk store attached, as process_pdf builds it"""
+    chunks = ChunkStore.from_chunks(" ".join(texts), texts)
+    return attach_chunk_store(FAISS.from_texts(texts, FakeEmbeddings()), chunks), chunks
+
+class TestSharedVectorIndex:
+    """Test the node-wide shared vector index"""
+
+    def test_search_is_filtered_by_document(self):
+        """Test that a document's view only returns its own chunks, matching its own FAISS index"""
+        shared = SharedVectorIndex()
+        lease, lease_chunks = make_vectorstore(["Rent is due monthly", "Deposit is $500", "Pets are allowed"])
+        other, other_chunks = make_vectorstore(["Rent is due monthly!", "Unrelated clause"])
+        lease_view = shared.adopt("lease", lease, lease_chunks)
+        shared.adopt("other", other, other_chunks)
+
+        query = FakeEmbeddings().embed_query("Deposit is $50")
+        expected = [(d.page_content, pytest.approx(score)) for d, score in lease.similarity_search_with_score_by_vector(query, k=2)]
+        actual = [(d.page_content, score) for d, score in lease_view.similarity_search_with_score_by_vector(query, k=2)]
+        assert actual == expected
+        assert {key for key, _, _ in shared.search(query, ["lease", "other"], k=5)} == {"lease", "other"}
+        assert shared.stats()["rows"] == 5
+
+    def test_adopting_same_content_twice_adds_once(self):
+        """Test that duplicate content keys share one block of rows"""
+        shared = SharedVectorIndex()
+        vectorstore, chunks = make_vectorstore(["a", "b"])
+        shared.adopt("key", vectorstore, chunks)
+        shared.adopt("key", vectorstore, chunks)
+        assert shared.stats()["rows"] == 2
+
+    def test_compaction_reclaims_removed_documents(self):
+        """Test that compaction drops dead rows and keeps the remaining documents searchable"""
+        shared = SharedVectorIndex(compact_min_rows=10**9)
+        for i in range(3):
+            shared.add(f"doc-{i}", np.full((4, 3), i, dtype=np.float32))
+        shared.remove("doc-0")
+        shared.remove("doc-1")
+        assert shared.stats()["dead_rows"] == 8
+
+        shared.compact()
+        shared.add("doc-3", np.full((2, 3), 3, dtype=np.float32))
+
+        stats = shared.stats()
+        assert (stats["rows"], stats["dead_rows"], stats["documents"]) == (6, 0, 2)
+        assert shared.vectors("doc-0") is None
+        assert (shared.vectors("doc-2") == 2).all() and len(shared.vectors("doc-2")) == 4
+        assert (shared.vectors("doc-3") == 3).all()
+        assert shared.search([2, 2, 2], ["doc-2"], k=1)[0][:2] == ("doc-2", 0)
+
+    def test_compacts_in_background_past_threshold(self):
+        """Test that removing enough rows triggers a background compaction"""
+        shared = SharedVectorIndex(compact_ratio=0.5, compact_min_rows=1)
+        shared.add("a", np.zeros((4, 3), dtype=np.float32))
+        shared.add("b", np.ones((4, 3), dtype=np.float32))
+        shared.remove("a")
+
+        for _ in range(100):
+            if shared.stats()["compactions"]:
+                break
+            time.sleep(0.01)
+        assert shared.stats()["rows"] == 4
+        assert shared.vectors("b").sum() == 12
+
+    def test_view_persists_as_flat_index(self, tmp_path):
+        """Test that a shared index view is saved as a standalone FAISS index"""
+        shared = SharedVectorIndex()
+        vectorstore, chunks = make_vectorstore(["First clause", "Second clause"])
+        view = shared.adopt("key", vectorstore, chunks)
+        save_faiss_index(view, str(tmp_path))
+        index = faiss.read_index(str(tmp_path / "index.faiss"))
+        assert index.ntotal == 2
+        assert (index.reconstruct_n(0, 2) == vectorstore.index.reconstruct_n(0, 2)).all()
+
+    def test_freed_content_leaves_shared_index(self):
+        """Test that releasing the last alias of shared content removes its vectors"""
+        shared = SharedVectorIndex()
+        content_index = ContentIndex(on_free=lambda digest, entry: shared.remove(digest))
+        vectorstore, chunks = make_vectorstore(["a", "b"])
+        content_index.register("hash", {"vectorstore": shared.adopt("hash", vectorstore, chunks)})
+        content_index.add_alias("hash", "doc-1")
+        content_index.release("doc-1")
+        assert shared.vectors("hash") is None
+
+    def test_view_of_freed_content_fails_clearly(self, tmp_path, monkeypatch):
+        """Test that a view whose content was freed raises on search, and a queued persist of it is skipped"""
+        monkeypatch.setenv("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY", "sk-test"))
+        shared = SharedVectorIndex()
+        vectorstore, chunks = make_vectorstore(["First clause", "Second clause"])
+        view = shared.adopt("hash", vectorstore, chunks)
+        shared.remove("hash")
+
+        with pytest.raises(ContentFreedError):
+            view.search_chunks([12.0, 1.0, 0.0], k=1)
+        with pytest.raises(ContentFreedError):
+            view.index.reconstruct_n(0, 2)
+
+        store = IndexStore(str(tmp_path))
+        store.save("doc-1", {"filename": "lease.pdf", "vectorstore": view, "chunks": chunks, "content_hash": "hash"})
+        store.flush()
+        assert not store.has_index("hash")
+        assert not os.path.exists(str(tmp_path / "hash.tmp"))
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,53 @@
+import pytest
+import os
+import sys
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from database import get_db
+from jobs import QueueFullError
+from models import Base, GuestUpload
+
+client = TestClient(app)
+PDF = ("contract.pdf", b"%PDF-1.4 guest upload", "application/pdf")
+
+@pytest.fixture
+def database(tmp_path):
+    """A scratch SQLite database wired into the app"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'upload.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    yield Session
+    app.dependency_overrides.pop(get_db, None)
+
+class TestGuestUpload:
+    """Test the guest upload quota around rejected uploads"""
+
+    def test_queue_full_does_not_use_guest_quota(self, database):
+        """Test that an upload rejected because the ingestion queue is full is released from the daily limit"""
+        with patch('main.load_shared_content', return_value=None), \
+             patch('main.ingest_queue.submit', side_effect=QueueFullError("Ingestion queue is full")):
+            responses = [client.post("/upload/", files={"file": PDF}) for _ in range(3)]
+
+        assert [response.status_code for response in responses] == [503, 503, 503]
+        with database() as db:
+            assert db.query(GuestUpload).count() == 0
+
+if __name__ == "__main__":
+    pytest.main([__file__])
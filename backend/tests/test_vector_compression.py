@@ -0,0 +1,103 @@
+import pytest
+import os
+import sys
+import threading
+import numpy as np
+
+# Add the parent directory to the path so we can import from backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+from langchain_community.vectorstores import FAISS
+from vector_compression import CompressedIndex, build_index, compress_index
+from chunk_store import ChunkStore, attach_chunk_store
+from document_registry import estimate_document_bytes
+from embeddings import HashingProvider
+from utils import save_faiss_index, load_faiss_index
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).standard_normal((1000, 32)).astype(np.float32)
+
+def recall(index, vectors, queries, k=3):
+    """Share of the exact top-k each query gets back from the index"""
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors)
+    _, exact = flat.search(queries, k)
+    _, found = index.search(queries, k)
+    return np.mean([len(set(e) & set(f)) / k for e, f in zip(exact, found)])
+
+class TestVectorCompression:
+    """Test compressed vector indexes with exact re-ranking"""
+
+    def test_compressions_shrink_codes(self, vectors):
+        """Test that each compression stores fewer bytes per vector than float32"""
+        sizes = {compression: build_index(vectors, compression).sa_code_size() for compression in ("none", "fp16", "int8", "pq")}
+        assert sizes["none"] == 32 * 4
+        assert sizes["none"] > sizes["fp16"] > sizes["int8"] > sizes["pq"]
+
+    def test_pq_falls_back_to_int8_for_small_documents(self, vectors):
+        """Test that too few vectors to train a product quantizer use int8 instead"""
+        index = build_index(vectors[:100], "pq")
+        assert isinstance(index, faiss.IndexScalarQuantizer)
+        with pytest.raises(ValueError):
+            build_index(vectors, "binary")
+
+    def test_rerank_recovers_recall(self, vectors):
+        """Test that re-ranking candidates against the exact vectors restores accuracy lost to PQ"""
+        queries = vectors[:50] + 0.3 * np.random.default_rng(1).standard_normal((50, 32)).astype(np.float32)
+        assert recall(CompressedIndex.build(vectors, "pq", rerank_factor=0), vectors, queries) < 0.9
+        assert recall(CompressedIndex.build(vectors, "pq", rerank_factor=8), vectors, queries) > 0.95
+        assert recall(CompressedIndex.build(vectors, "int8", rerank_factor=4), vectors, queries) == 1.0
+
+    def test_persisted_vectors_are_memory_mapped(self, vectors, tmp_path, monkeypatch):
+        """Test the save/load round trip and that exact vectors leave the heap once on disk"""
+        monkeypatch.setenv("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY", "sk-test"))
+        texts = [f"clause {i}" for i in range(len(vectors))]
+        chunks = ChunkStore.from_chunks(" ".join(texts), texts)
+        flat = faiss.IndexFlatL2(32)
+        flat.add(vectors)
+        store = attach_chunk_store(FAISS(HashingProvider(dimension=32), compress_index(flat, "int8"), None, {}), chunks)
+        doc = {"vectorstore": store, "chunks": chunks}
+        in_memory = estimate_document_bytes(doc)
+
+        save_faiss_index(store, str(tmp_path))
+        store.index.use_vectors_file(str(tmp_path))
+        assert estimate_document_bytes(doc) == in_memory - vectors.nbytes
+
+        loaded = load_faiss_index(str(tmp_path), chunks)
+        assert isinstance(loaded.index, CompressedIndex) and isinstance(loaded.index.vectors, np.memmap)
+        assert loaded.similarity_search_by_vector(vectors[7].tolist(), k=1)[0].page_content == "clause 7"
+
+    def test_swap_to_vectors_file_while_searching(self, vectors, tmp_path):
+        """Test that searches running while the exact vectors are swapped for the memory map keep their results,
+        and that a file that doesn't match the index is refused"""
+        index = CompressedIndex.build(vectors, "int8", rerank_factor=4)
+        index.save_vectors(str(tmp_path))
+        queries = vectors[:20]
+        expected = index.search(queries, 5)[1]
+
+        results = []
+        stop = threading.Event()
+
+        def search():
+            while not stop.is_set():
+                results.append(index.search(queries, 5)[1])
+
+        searcher = threading.Thread(target=search)
+        searcher.start()
+        for _ in range(20):
+            index.use_vectors_file(str(tmp_path))
+        stop.set()
+        searcher.join()
+
+        assert isinstance(index.vectors, np.memmap)
+        assert results and all((found == expected).all() for found in results)
+
+        np.save(os.path.join(str(tmp_path), "vectors.npy"), vectors[:10])
+        with pytest.raises(ValueError):
+            index.use_vectors_file(str(tmp_path))
+        assert len(index.vectors) == len(vectors)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
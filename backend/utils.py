@@ -1,14 +1,38 @@
 import os
 from typing import List
-from langchain_openai import OpenAIEmbeddings
+import faiss
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document
 from langchain_community.vectorstores import FAISS
 from dotenv import load_dotenv
+from embedding_cache import CachedEmbeddings, EmbeddingCacheStore
+from embeddings import BatchedEmbeddings, EmbeddingProvider, create_provider
+from chunk_store import ChunkStore, attach_chunk_store
+from vector_compression import CompressedIndex, VECTORS_FILE
 
 # Load environment variables
 load_dotenv()
 
+_embedding_cache_store = None
+_embedding_provider = None
+_batched_embeddings = None
+
+def get_embedding_provider() -> EmbeddingProvider:
+    """The embedding backend selected by EMBEDDING_PROVIDER (created once per process)."""
+    global _embedding_provider
+    if _embedding_provider is None:
+        _embedding_provider = create_provider()
+    return _embedding_provider
+
+def get_embeddings() -> CachedEmbeddings:
+    """The configured embedding provider, batched and concurrent, behind the shared on-disk chunk embedding cache."""
+    global _embedding_cache_store, _batched_embeddings
+    if _embedding_cache_store is None:
+        _embedding_cache_store = EmbeddingCacheStore()
+    if _batched_embeddings is None:
+        _batched_embeddings = BatchedEmbeddings(get_embedding_provider())
+    return CachedEmbeddings(_batched_embeddings, _embedding_cache_store)
+
 def create_chunks(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[Document]:
     """Split text into overlapping chunks."""
     text_splitter = RecursiveCharacterTextSplitter(
@@ -22,18 +46,44 @@ def create_chunks(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -
 
 def create_vector_store(documents: List[Document], store_name: str = "document_store") -> FAISS:
     """Create a FAISS vector store from documents."""
-    embeddings = OpenAIEmbeddings()
+    embeddings = get_embeddings()
     vector_store = FAISS.from_documents(documents, embeddings)
     
     # Save the vector store
-    vector_store.save_local(store_name)
+    save_vector_store(vector_store, store_name)
     return vector_store
 
+def save_vector_store(vector_store: FAISS, store_name: str = "document_store") -> None:
+    """Save a FAISS vector store (index and docstore) to a folder."""
+    vector_store.save_local(store_name)
+
 def load_vector_store(store_name: str = "document_store") -> FAISS:
     """Load a saved FAISS vector store."""
     if not os.path.exists(store_name):
         raise FileNotFoundError(f"Vector store '{store_name}' not found.")
     
-    embeddings = OpenAIEmbeddings()
+    embeddings = get_embeddings()
     vector_store = FAISS.load_local(store_name, embeddings, allow_dangerous_deserialization=True)
-    return vector_store 
\ No newline at end of file
+    return vector_store
+
+def save_faiss_index(vector_store: FAISS, store_name: str) -> None:
+    """Save only the FAISS index of a vector store whose chunks live in a ChunkStore."""
+    os.makedirs(store_name, exist_ok=True)
+    index = vector_store.index
+    if isinstance(index, CompressedIndex):
+        # Compressed codes for searching, plus the exact vectors they're re-ranked against
+        index.save_vectors(store_name)
+        index = index.index
+    elif not isinstance(index, faiss.Index):
+        # A document's slice of the shared index - persist its vectors as a standalone flat index
+        index = faiss.IndexFlatL2(index.d)
+        index.add(vector_store.index.reconstruct_n(0, vector_store.index.ntotal))
+    faiss.write_index(index, os.path.join(store_name, "index.faiss"))
+
+def load_faiss_index(store_name: str, chunks: ChunkStore) -> FAISS:
+    """Load a FAISS index saved by save_faiss_index and serve its documents from chunks."""
+    index = faiss.read_index(os.path.join(store_name, "index.faiss"))
+    if os.path.exists(os.path.join(store_name, VECTORS_FILE)):
+        index = CompressedIndex.load(index, store_name)
+    vector_store = FAISS(get_embeddings(), index, None, {})
+    return attach_chunk_store(vector_store, chunks)
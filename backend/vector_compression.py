@@ -0,0 +1,155 @@
+import logging
+import os
+from typing import Optional, Tuple
+
+import faiss
+import numpy as np
+
+from executors import run_cpu_bound
+
+logger = logging.getLogger(__name__)
+
+# How per-document vector indexes are stored in memory: none (float32), fp16, int8 (scalar
+# quantization) or pq (product quantization). Shorter vectors come from EMBEDDING_DIMENSION.
+VECTOR_COMPRESSION = os.getenv("VECTOR_COMPRESSION", "none")
+# Compressed indexes fetch this many candidates per result and re-rank them against the
+# exact vectors (memory-mapped from disk once persisted); 0 disables re-ranking
+VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", "4"))
+# Product quantization: bytes per vector (sub-quantizers; rounded down to a divisor of the dimension)
+VECTOR_PQ_BYTES = int(os.getenv("VECTOR_PQ_BYTES", "96"))
+
+COMPRESSIONS = ("none", "fp16", "int8", "pq")
+VECTORS_FILE = "vectors.npy"
+
+
+def _pq_index(vectors: np.ndarray, code_bytes: int) -> Optional[faiss.Index]:
+    d = vectors.shape[1]
+    m = max(m for m in range(1, min(code_bytes, d) + 1) if d % m == 0)
+    # Each sub-quantizer has 2^nbits centroids; k-means wants ~39 training vectors per centroid
+    nbits = min(8, int(np.log2(max(len(vectors) / 39, 1))))
+    if nbits < 4:
+        return None
+    return faiss.IndexPQ(d, m, nbits)
+
+
+def build_index(vectors: np.ndarray, compression: str = VECTOR_COMPRESSION) -> faiss.Index:
+    """A FAISS index over the vectors using the given compression (trained on the vectors themselves)"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    d = vectors.shape[1]
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown vector compression '{compression}' (expected one of: {', '.join(COMPRESSIONS)})")
+
+    if compression == "pq":
+        index = _pq_index(vectors, VECTOR_PQ_BYTES)
+        if index is None:
+            # Too few chunks to train a codebook - int8 is the next smallest
+            logger.info(f"Only {len(vectors)} vectors; using int8 instead of product quantization")
+            compression = "int8"
+    if compression == "none":
+        index = faiss.IndexFlatL2(d)
+    elif compression == "fp16":
+        index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_fp16)
+    elif compression == "int8":
+        index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit)
+
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+class CompressedIndex:
+    """A compressed FAISS index whose top candidates are re-ranked by exact L2 distance.
+
+    Exposes the parts of the faiss.Index API the vector store and persistence use (search,
+    ntotal, d, reconstruct_n). The exact float32 vectors are an in-memory array right after
+    ingestion and a read-only memory map once the index store has written them, so only
+    the compressed codes stay on the heap.
+
+    Thread-safety: the index store swaps in the memory map from its writer thread while
+    queries may be searching. The swap is a single assignment of a fully opened array, and
+    readers take one reference to self.vectors and use only that, so a search sees either
+    the in-memory vectors or the map, never a mix. Both hold the same values.
+    """
+
+    def __init__(self, index: faiss.Index, vectors: Optional[np.ndarray], rerank_factor: int = VECTOR_RERANK_FACTOR):
+        self.index = index
+        self.vectors = vectors
+        self.rerank_factor = rerank_factor
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, compression: str = VECTOR_COMPRESSION,
+              rerank_factor: int = VECTOR_RERANK_FACTOR) -> "CompressedIndex":
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        return cls(build_index(vectors, compression), vectors, rerank_factor)
+
+    @classmethod
+    def load(cls, index: faiss.Index, path: str, rerank_factor: int = VECTOR_RERANK_FACTOR) -> "CompressedIndex":
+        return cls(index, np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r"), rerank_factor)
+
+    def save_vectors(self, path: str) -> None:
+        np.save(os.path.join(path, VECTORS_FILE), np.asarray(self.vectors))
+
+    def use_vectors_file(self, path: str) -> None:
+        """Re-rank from the persisted vectors instead of the in-memory copy"""
+        mapped = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+        current = self.vectors
+        if current is not None and mapped.shape != current.shape:
+            raise ValueError(f"Persisted vectors {mapped.shape} don't match the index's {current.shape}")
+        # Opened and checked before being published in one assignment - see the class docstring
+        self.vectors = mapped
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def d(self) -> int:
+        return self.index.d
+
+    @property
+    def nbytes(self) -> int:
+        """Heap memory: the compressed codes, plus the exact vectors until they're memory-mapped"""
+        vectors = self.vectors
+        vector_bytes = 0 if vectors is None or isinstance(vectors, np.memmap) else vectors.nbytes
+        return self.index.sa_code_size() * self.index.ntotal + vector_bytes
+
+    def reconstruct_n(self, first: int, count: int) -> np.ndarray:
+        vectors = self.vectors
+        if vectors is not None:
+            return np.array(vectors[first:first + count], dtype=np.float32)
+        return self.index.reconstruct_n(first, count)
+
+    def search(self, x: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        vectors = self.vectors
+        if vectors is None or self.rerank_factor <= 0:
+            return self.index.search(x, k)
+
+        _, candidates = self.index.search(x, min(k * self.rerank_factor, self.ntotal))
+        distances = np.full((len(x), k), np.inf, dtype=np.float32)
+        indices = np.full((len(x), k), -1, dtype=np.int64)
+        for row, ids in enumerate(candidates):
+            # Sorted IDs read the (possibly memory-mapped) vectors in file order
+            ids = np.sort(ids[ids >= 0])
+            exact = ((np.asarray(vectors[ids]) - x[row]) ** 2).sum(axis=1)
+            order = np.argsort(exact)[:k]
+            distances[row, :len(order)] = exact[order]
+            indices[row, :len(order)] = ids[order]
+        return distances, indices
+
+
+def _serialized_index(vectors: np.ndarray, compression: str) -> np.ndarray:
+    return faiss.serialize_index(build_index(vectors, compression))
+
+
+def compress_index(index: faiss.Index, compression: str = VECTOR_COMPRESSION):
+    """Replace a flat index with the configured compressed one (returned unchanged for "none")"""
+    if compression == "none" or index.ntotal == 0:
+        return index
+    vectors = np.ascontiguousarray(index.reconstruct_n(0, index.ntotal), dtype=np.float32)
+    # Training (k-means for pq) runs on the process pool; FAISS indexes cross it serialized
+    compressed = CompressedIndex(faiss.deserialize_index(run_cpu_bound(_serialized_index, vectors, compression)), vectors)
+    logger.info(f"Compressed {index.ntotal} vectors with {compression}: {index.ntotal * index.d * 4} -> "
+                f"{compressed.index.sa_code_size() * index.ntotal} bytes of codes")
+    return compressed
@@ -17,7 +17,7 @@ import {
 import { IconSend, IconRefresh, IconFileText, IconChevronDown, IconChevronUp, IconEye } from '@tabler/icons-react';
 import { useAuth } from '../contexts/AuthContext';
 import apiEndpoints from '../config/api';
-import type { DocumentInfo, QueryResponse } from '../types/api';
+import type { DocumentInfo, QueryResponse, StreamEvent } from '../types/api';
 
 interface Message {
   role: 'user' | 'assistant';
@@ -154,7 +154,7 @@ export default function ChatInterface({ documentId, onReset, isGuest = false }:
         }
       }
 
-      const response = await fetch(apiEndpoints.query(documentId), {
+      const response = await fetch(apiEndpoints.queryStream(documentId), {
         method: 'POST',
         headers,
         body: JSON.stringify({
@@ -162,16 +162,38 @@ export default function ChatInterface({ documentId, onReset, isGuest = false }:
         }),
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error('Failed to get response');
       }
 
-      const data = await response.json();
-      const assistantMessage = {
-        role: 'assistant' as const,
-        content: data.answer,
-      };
-      setMessages((prev) => [...prev, assistantMessage]);
+      // Show the answer as it streams in: one server-sent event per token, then "done"
+      setMessages((prev) => [...prev, { role: 'assistant' as const, content: '' }]);
+      const setAnswer = (content: string) =>
+        setMessages((prev) => [...prev.slice(0, -1), { role: 'assistant' as const, content }]);
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let answer = '';
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop() ?? '';
+        for (const event of events) {
+          const name = event.match(/^event: (.*)$/m)?.[1] ?? 'message';
+          const data = event.match(/^data: (.*)$/m)?.[1];
+          if (!data) continue;
+          const payload = JSON.parse(data) as StreamEvent;
+          if (name === 'error') {
+            setAnswer('Sorry, I encountered an error while processing your request.');
+            return;
+          }
+          answer = name === 'done' ? payload.answer ?? answer : answer + (payload.token ?? '');
+          setAnswer(answer);
+        }
+      }
     } catch (error) {
       setMessages((prev) => [
         ...prev,
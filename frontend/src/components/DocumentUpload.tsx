@@ -5,7 +5,28 @@ import { IconUpload, IconX, IconFile } from '@tabler/icons-react';
 import { notifications } from '@mantine/notifications';
 import { useAuth } from '../contexts/AuthContext';
 import apiEndpoints from '../config/api';
-import type { UploadResponse } from '../types/api';
+import type { UploadResponse, JobStatus } from '../types/api';
+
+const JOB_POLL_INTERVAL_MS = 1500;
+
+// Uploads are processed in the background - poll the job until the document is queryable
+// (completed, or "partial" once its first pages are indexed)
+async function waitForJob(jobId: string): Promise<JobStatus> {
+  for (;;) {
+    const response = await fetch(apiEndpoints.job(jobId));
+    const job: JobStatus = await response.json();
+    if (!response.ok) {
+      throw new Error('Lost track of the upload. Please try again.');
+    }
+    if (job.status === 'completed' || job.progress === 'partial') {
+      return job;
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Failed to process document');
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
+}
 
 interface DocumentUploadProps {
   onUploadSuccess: (filename: string) => void;
@@ -126,6 +147,10 @@ export default function DocumentUpload({ onUploadSuccess, credits, isGuest = fal
         setGuestUploadsRemaining(newRemainingCount);
       }
 
+      if (data.status !== 'completed') {
+        await waitForJob(data.job_id);
+      }
+
       // Call success callback to open chat interface
       onUploadSuccess(data.document_id);
 
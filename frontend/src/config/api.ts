@@ -9,9 +9,13 @@ export const apiEndpoints = {
   // Document endpoints
   upload: `${API_BASE_URL}/upload/`,
   query: (docId: string) => `${API_BASE_URL}/query/${docId}`,
+  queryStream: (docId: string) => `${API_BASE_URL}/query/${docId}/stream`,
   documentInfo: (docId: string) => `${API_BASE_URL}/document/${docId}`,
   documentView: (docId: string) => `${API_BASE_URL}/document/${docId}/view`,
 
+  // Background ingestion jobs
+  job: (jobId: string) => `${API_BASE_URL}/jobs/${jobId}`,
+
   // Health check
   health: `${API_BASE_URL}/health`,
 };
@@ -1,17 +1,28 @@
 // API Response Types
 
 export interface UploadResponse {
+  job_id: string;
   document_id: string;
+  status: JobStatus['status'];
   is_guest: boolean;
   credits_remaining?: number;
   guest_remaining_uploads?: number;
   detail?: string;  // For error responses
 }
 
+export interface JobStatus {
+  id: string;
+  document_id: string;
+  status: 'queued' | 'processing' | 'completed' | 'failed';
+  progress: string;
+  error?: string | null;
+}
+
 export interface DocumentInfo {
   filename: string;
   chunks: number;
   text_length: number;
+  partial?: boolean;
   is_demo: boolean;
   can_view: boolean;
 }
@@ -21,6 +32,16 @@ export interface QueryResponse {
   credits_remaining?: number;
 }
 
+// Server-sent events from the streaming query endpoint
+export interface StreamEvent {
+  token?: string;  // one per message event
+  answer?: string;  // "done" event
+  response_time_ms?: number;
+  time_to_first_token_ms?: number | null;
+  cache_hit?: boolean;
+  detail?: string;  // "error" event
+}
+
 export interface UserProfile {
   email: string;
   credits: number;